@@ -53,6 +53,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'data.middleware.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
@@ -62,6 +63,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'data.middleware.DatabaseRoutingMiddleware',
 ]
 
 CORS_ORIGIN_WHITELIST = [
@@ -74,6 +76,16 @@ REST_FRAMEWORK = {
         'rest_framework.authentication.SessionAuthentication',
         'rest_framework.authentication.TokenAuthentication',
     ],
+    # JSON con orjson (data/renderers.py), stesso output di JSONRenderer/JSONParser
+    'DEFAULT_RENDERER_CLASSES': [
+        'data.renderers.ORJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'data.renderers.ORJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
     'DATE_FORMAT': "%d/%m/%Y",
     'DATETIME_FORMAT': "%d/%m/%Y %H:%M",
 }
@@ -103,13 +115,107 @@ WSGI_APPLICATION = 'SmartFit_Coach_BE.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
-DATABASES = {
-    'default': {
+# Profilo del database scelto da DB_ENGINE: "sqlite" (predefinito) oppure "postgresql".
+#
+# SQLite, per più worker (gunicorn) e cron concorrenti:
+# - WAL: le letture non bloccano le scritture e viceversa; synchronous=NORMAL è sicuro con WAL
+# - busy_timeout/timeout: una scrittura concorrente attende il lock invece di fallire con "database is locked"
+# - transaction_mode IMMEDIATE: le transazioni prendono subito il lock di scrittura, evitando
+#   l'errore immediato quando una transazione nata in lettura prova a scrivere
+# - connessioni persistenti (CONN_MAX_AGE) con controllo di validità prima del riuso
+# Verifica con: python manage.py bench_sqlite_concurrency
+#
+# PostgreSQL: connessione da DB_NAME, DB_USER, DB_PASSWORD, DB_HOST, DB_PORT con il pool di psycopg
+# (DB_POOL_MIN_SIZE, DB_POOL_MAX_SIZE, DB_POOL_TIMEOUT). Con DB_REPLICA_HOST viene aggiunta la replica
+# in sola lettura usata da data/routers.py per le liste e le analisi.
+DB_ENGINE = os.getenv('DB_ENGINE', 'sqlite')
+
+# Routing delle letture sulla replica (data/routers.py). PIN_SECONDS: per quanto un utente resta
+# sul primario dopo aver scritto, in attesa che la replica riceva le modifiche
+DATABASE_REPLICA = {
+    'ALIAS': 'replica',
+    'PIN_SECONDS': int(os.getenv('DB_REPLICA_PIN_SECONDS', 5)),
+}
+
+DATABASE_ROUTERS = ['data.routers.PrimaryReplicaRouter']
+
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 5000,
+    'foreign_keys': 'ON',
+    'temp_store': 'MEMORY',
+    'mmap_size': 128 * 1024 * 1024,
+    'cache_size': -20000,  # negativo = KiB (circa 20 MB per connessione)
+}
+
+if DB_ENGINE == 'postgresql':
+    PRIMARY_DATABASE = {
+        'ENGINE': 'django.db.backends.postgresql',
+        'NAME': os.getenv('DB_NAME', 'smartfit'),
+        'USER': os.getenv('DB_USER', 'smartfit'),
+        'PASSWORD': os.getenv('DB_PASSWORD', ''),
+        'HOST': os.getenv('DB_HOST', 'localhost'),
+        'PORT': os.getenv('DB_PORT', '5432'),
+        # Il pool riusa già le connessioni: con "pool" CONN_MAX_AGE deve restare 0
+        'CONN_MAX_AGE': 0,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'pool': {
+                'min_size': int(os.getenv('DB_POOL_MIN_SIZE', 2)),
+                'max_size': int(os.getenv('DB_POOL_MAX_SIZE', 10)),
+                'timeout': int(os.getenv('DB_POOL_TIMEOUT', 10)),
+            },
+        },
+    }
+    REPLICA_DATABASE = {
+        **PRIMARY_DATABASE,
+        'HOST': os.getenv('DB_REPLICA_HOST'),
+        'PORT': os.getenv('DB_REPLICA_PORT', PRIMARY_DATABASE['PORT']),
+    } if os.getenv('DB_REPLICA_HOST') else None
+else:
+    PRIMARY_DATABASE = {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', 600)),
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'init_command': ';'.join(f'PRAGMA {name}={value}' for name, value in SQLITE_PRAGMAS.items()),
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': 5,
+        },
+    }
+    # Stand-in locale della replica: una seconda connessione sullo stesso file, in sola lettura quindi
+    # senza transazioni IMMEDIATE. read_uncommitted ha effetto solo sui database in memoria condivisi
+    # (quello dei test): la replica vede i dati ancora nella transazione di TestCase invece di
+    # trovare le tabelle bloccate
+    REPLICA_DATABASE = {
+        **PRIMARY_DATABASE,
+        'OPTIONS': {
+            **PRIMARY_DATABASE['OPTIONS'],
+            'init_command': PRIMARY_DATABASE['OPTIONS']['init_command'] + ';PRAGMA read_uncommitted=1',
+            'transaction_mode': None,
+        },
     }
-}
 
+DATABASES = {
+    'default': PRIMARY_DATABASE,
+}
+if REPLICA_DATABASE:
+    # Nei test la replica è un mirror di "default": nessun database separato da creare
+    DATABASES[DATABASE_REPLICA['ALIAS']] = {**REPLICA_DATABASE, 'TEST': {'MIRROR': 'default'}}
+
+# Il pin sul primario dopo una scrittura (data/routers.py) sta nella cache: con PostgreSQL la richiesta
+# successiva dell'utente può arrivare a un altro worker (o server), quindi la cache deve essere condivisa
+# (Redis, REDIS_URL). Con SQLite la "replica" è lo stesso file, non c'è ritardo da coprire e basta la
+# cache locale del processo.
+if DB_ENGINE == 'postgresql':
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv('REDIS_URL', 'redis://localhost:6379/0'),
+        },
+    }
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -161,6 +267,75 @@ SITE_ID = 1
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Cache persistente delle risposte LLM (data/llm_cache.py)
+# BACKEND: 'database', 'filesystem' oppure '' per disattivarla
+LLM_CACHE = {
+    'BACKEND': os.getenv('LLM_CACHE_BACKEND', 'database'),
+    'LOCATION': BASE_DIR / 'llm_cache',
+    'TTL': int(os.getenv('LLM_CACHE_TTL', 60 * 60 * 24 * 7)),
+    'MAX_ENTRIES': int(os.getenv('LLM_CACHE_MAX_ENTRIES', 5000)),
+    'EVICT_INTERVAL': int(os.getenv('LLM_CACHE_EVICT_INTERVAL', 300)),
+}
+
+# Backend dei modelli: "openai" (ChatOpenAI) oppure "fake" (data/fake_llm.py, deterministico e senza rete)
+LLM_BACKEND = os.getenv('LLM_BACKEND', 'openai')
+
+FAKE_LLM = {
+    'LATENCY': float(os.getenv('FAKE_LLM_LATENCY', 0)),  # secondi di attesa simulata per chiamata
+    'FIXTURES': os.getenv('FAKE_LLM_FIXTURES'),  # file JSON {sha256 del prompt: risposta}
+}
+
+# Preparazione delle immagini per il modello vision (data/images.py): ridimensionamento e formato di invio
+VISION_IMAGE = {
+    'MAX_LONG_SIDE': 2048,
+    'MAX_SHORT_SIDE': 768,
+    'FORMAT': os.getenv('VISION_IMAGE_FORMAT', 'JPEG'),  # "JPEG" oppure "WEBP"
+    'QUALITY': 85,
+}
+
+# Cache percettiva delle analisi delle foto dei pasti (data/images.py)
+# THRESHOLD: distanza di Hamming massima (su 64 bit) perché due foto siano considerate la stessa
+FOOD_IMAGE_CACHE = {
+    'ENABLED': os.getenv('FOOD_IMAGE_CACHE_ENABLED', 'True') == 'True',
+    'THRESHOLD': int(os.getenv('FOOD_IMAGE_CACHE_THRESHOLD', 6)),
+    'RETENTION_DAYS': int(os.getenv('FOOD_IMAGE_CACHE_RETENTION_DAYS', 30)),
+    'MAX_ENTRIES': int(os.getenv('FOOD_IMAGE_CACHE_MAX_ENTRIES', 200)),  # per utente
+}
+
+# Versioni ridotte delle immagini degli esercizi (data/images.py): lato massimo in pixel per ogni dimensione
+GYM_MEDIA_VARIANTS = {
+    'SIZES': {'thumb': 160, 'small': 320, 'medium': 640},
+    'QUALITY': 80,
+    'DIRECTORY': 'gym_media/variants',
+}
+
+# Numero massimo di chiamate LLM indipendenti eseguite in parallelo (vedi data.utils.run_concurrently)
+LLM_MAX_CONCURRENCY = int(os.getenv('LLM_MAX_CONCURRENCY', 4))
+
+# Quota giornaliera di token LLM per utente (data/usage.py); personalizzabile per utente con il modello LLMQuota.
+# DAILY_TOKENS vuoto = nessun limite
+LLM_QUOTA = {
+    'DAILY_TOKENS': int(os.getenv('LLM_DAILY_TOKENS', 200000)) or None,
+}
+
+# Metriche per richiesta (data/middleware.py): query SQL, chiamate LLM, token e latenza.
+# SERVER_TIMING: header Server-Timing nella risposta; LOG: una riga JSON per richiesta sul logger "data.metrics"
+REQUEST_METRICS = {
+    'SERVER_TIMING': DEBUG,
+    'LOG': os.getenv('REQUEST_METRICS_LOG', str(not DEBUG)) == 'True',
+}
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'data.metrics': {'handlers': ['console'], 'level': 'INFO', 'propagate': False},
+    },
+}
+
 warnings.filterwarnings(
     "ignore",
     message="app_settings.USERNAME_REQUIRED is deprecated.*",
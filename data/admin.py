@@ -1,7 +1,9 @@
 from django.contrib import admin
 
 from data.models import DetailsAccount, Weight, BodyMeasurement, FoodItem, FoodPlan, FoodPlanItem, FoodPlanSection, \
-    GymItem, GymPlanItem, GymPlan, GymMediaUpload, GymPlanSection, GymPlanSetDetail
+    GymItem, GymPlanItem, GymPlan, GymMediaUpload, GymPlanSection, GymPlanSetDetail, LLMCacheEntry, \
+    AIJob, FoodItemToken, LLMUsage, LLMUsageDaily, LLMQuota, \
+    FoodImageAnalysis
 
 # Register your models here.
 admin.site.register(DetailsAccount)
@@ -11,6 +13,7 @@ admin.site.register(Weight)
 admin.site.register(BodyMeasurement)
 
 admin.site.register(FoodItem)
+admin.site.register(FoodItemToken)
 admin.site.register(FoodPlan)
 admin.site.register(FoodPlanItem)
 admin.site.register(FoodPlanSection)
@@ -20,4 +23,11 @@ admin.site.register(GymMediaUpload)
 admin.site.register(GymPlan)
 admin.site.register(GymPlanItem)
 admin.site.register(GymPlanSection)
-admin.site.register(GymPlanSetDetail)
\ No newline at end of file
+admin.site.register(GymPlanSetDetail)
+
+admin.site.register(LLMCacheEntry)
+admin.site.register(AIJob)
+admin.site.register(LLMUsage)
+admin.site.register(LLMUsageDaily)
+admin.site.register(LLMQuota)
+admin.site.register(FoodImageAnalysis)
@@ -0,0 +1,324 @@
+import io
+import os
+import statistics
+import tempfile
+import time
+from contextlib import ExitStack, contextmanager
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection, connections
+from django.test.utils import CaptureQueriesContext, setup_test_environment, teardown_test_environment
+from django.urls import reverse
+from django.utils import timezone
+
+
+# ======== STRUMENTI PER I BENCHMARK ========
+# Funzioni condivise dai comandi `bench_*`: database usa e getta, dati di esempio
+# e statistiche sulle misure. Nessuna di queste funzioni tocca il database reale.
+
+
+@contextmanager
+def throwaway_database(on_disk: bool = False):
+    """
+    Crea un database di test (con tutte le migrazioni) e lo distrugge all'uscita,
+    come fa il test runner di Django. Gli alias configurati come TEST MIRROR (la replica)
+    puntano al database di test, così anche le letture sulla replica non toccano il database reale.
+
+    :param on_disk: con SQLite usa un file temporaneo invece del database in memoria: serve quando
+                    più thread scrivono insieme (in memoria le tabelle bloccate non attendono busy_timeout)
+    """
+    setup_test_environment()
+    test_settings = connection.settings_dict.setdefault("TEST", {})
+    old_test_name = test_settings.get("NAME")
+    if on_disk and connection.vendor == "sqlite":
+        test_settings["NAME"] = os.path.join(tempfile.gettempdir(), f"bench-{os.getpid()}.sqlite3")
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    mirrors = {
+        alias: connections[alias].settings_dict["NAME"]
+        for alias in connections
+        if connections[alias].settings_dict.get("TEST", {}).get("MIRROR") == connection.alias
+    }
+    for alias in mirrors:
+        connections[alias].close()
+        connections[alias].creation.set_as_test_mirror(connection.settings_dict)
+    try:
+        yield
+    finally:
+        for alias, name in mirrors.items():
+            connections[alias].close()
+            connections[alias].settings_dict["NAME"] = name
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        if on_disk and connection.vendor == "sqlite":
+            # Le connessioni rimaste aperte in altri thread lasciano i file del WAL
+            for suffix in ("-wal", "-shm"):
+                if os.path.exists(test_settings["NAME"] + suffix):
+                    os.remove(test_settings["NAME"] + suffix)
+        test_settings["NAME"] = old_test_name
+        teardown_test_environment()
+
+
+def percentile(values: list, pct: float) -> float:
+    """
+    Percentile con interpolazione lineare (pct tra 0 e 100).
+    """
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    position = (len(ordered) - 1) * pct / 100
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def summarize(samples: list[dict]) -> dict:
+    """
+    Riassume i campioni di un endpoint ({"ms", "queries", "llm_calls", "status"}).
+    """
+    latencies = [s["ms"] for s in samples]
+    return {
+        "runs": len(samples),
+        "status": sorted({s["status"] for s in samples}),
+        "p50_ms": percentile(latencies, 50),
+        "p99_ms": percentile(latencies, 99),
+        "queries": statistics.median(s["queries"] for s in samples),
+        "llm_calls": statistics.median(s["llm_calls"] for s in samples),
+    }
+
+
+FOOD_NAMES = [
+    "Pasta al pomodoro", "Pasta integrale", "Petto di pollo", "Mela golden", "Yogurt greco",
+    "Fiocchi di avena", "Salmone affumicato", "Riso basmati", "Pane integrale", "Tonno al naturale",
+]
+
+EXERCISE_NAMES = [
+    "Barbell Squat", "Barbell Bench Press", "Dumbbell Bench Press", "Leg Press", "Lat Machine",
+    "Barbell Deadlift", "Dumbbell Curl", "Cable Triceps Pushdown",
+]
+
+
+def seed_benchmark_data(filler_food_items: int = 500, filler_exercises: int = 100) -> dict:
+    """
+    Popola il database con un utente completo: profilo, 30 giorni di pesate e misure, catalogo alimenti
+    (indicizzato per la ricerca), piano alimentare della settimana precedente e scheda di allenamento.
+
+    :return: dizionario con l'utente e gli id usati dagli endpoint del benchmark
+    """
+    from data.models import (
+        DetailsAccount, Weight, BodyMeasurement, FoodItem, FoodPlan, FoodPlanItem, FoodPlanSection, GymItem,
+        GymPlan, GymPlanItem, GymPlanSection, GymPlanSetDetail
+    )
+    from data.search import index_food_items
+
+    user = get_user_model().objects.create_user(username="benchmark", password="benchmark")
+    DetailsAccount.objects.create(
+        author=user,
+        date_of_birth="1990-01-01",
+        biological_gender="M",
+        height_cm=180,
+        goal_targets="fitness"
+    )
+
+    today = timezone.now().date()
+    Weight.objects.bulk_create([
+        Weight(author=user, weight_value=80 - day * 0.1, date_recorded=today - timedelta(days=day))
+        for day in range(0, 30, 3)
+    ])
+    BodyMeasurement.objects.bulk_create([
+        BodyMeasurement(author=user, chest=100, waist=85 - day * 0.1, hips=95, bicep=35,
+                        date_recorded=today - timedelta(days=day))
+        for day in range(0, 30, 7)
+    ])
+
+    food_items = FoodItem.objects.bulk_create(
+        [
+            FoodItem(author=user, name=name, brand="Benchmark", kcal_per_100g=150, protein_per_100g=10,
+                     carbs_per_100g=20, sugars_per_100g=3, fats_per_100g=4, fiber_per_100g=2)
+            for name in FOOD_NAMES
+        ] + [
+            FoodItem(author=user, name=f"Alimento {i} {FOOD_NAMES[i % len(FOOD_NAMES)].split()[0]}",
+                     brand=f"Marca {i % 20}", kcal_per_100g=100 + i % 200, protein_per_100g=i % 30,
+                     carbs_per_100g=i % 60, fats_per_100g=i % 25, fiber_per_100g=i % 8)
+            for i in range(filler_food_items)
+        ]
+    )
+    index_food_items(food_items)
+
+    sections = FoodPlanSection.objects.bulk_create([
+        FoodPlanSection(author=user, name=name, start_time=hour)
+        for name, hour in [("Colazione", 8), ("Spuntino", 10), ("Pranzo", 13), ("Cena", 20)]
+    ])
+
+    monday = today - timedelta(days=today.weekday())
+    previous_plan = FoodPlan.objects.create(
+        author=user, start_date=monday - timedelta(days=7), end_date=monday - timedelta(days=1),
+        max_kcal=2500, max_protein=150, max_carbs=280, max_fats=80
+    )
+    current_plan = FoodPlan.objects.create(
+        author=user, start_date=monday, end_date=monday + timedelta(days=6),
+        max_kcal=2500, max_protein=150, max_carbs=280, max_fats=80
+    )
+    FoodPlanItem.objects.bulk_create([
+        FoodPlanItem(food_plan=plan, food_item=food_items[i], food_section=sections[i % len(sections)],
+                     quantity_in_grams=100)
+        for plan in (previous_plan, current_plan)
+        for i in range(len(FOOD_NAMES))
+    ])
+
+    exercises = GymItem.objects.bulk_create(
+        [GymItem(author=user, name=name) for name in EXERCISE_NAMES] +
+        [GymItem(author=user, name=f"Esercizio {i}") for i in range(filler_exercises)]
+    )
+
+    gym_plan = GymPlan.objects.create(author=user, start_date=monday, end_date=monday + timedelta(days=6))
+    gym_sections = GymPlanSection.objects.bulk_create([
+        GymPlanSection(author=user, gym_plan=gym_plan, day=day) for day in ("lun", "mer", "ven")
+    ])
+    items = GymPlanItem.objects.bulk_create([
+        GymPlanItem(section=section, order=order, intensity_techniques=["bilateral"])
+        for section in gym_sections
+        for order in range(1, 5)
+    ])
+    GymPlanSetDetail.objects.bulk_create([
+        GymPlanSetDetail(plan_item=item, exercise=exercises[index % len(EXERCISE_NAMES)], order=number,
+                         set_number=number, prescribed_reps_1=8, prescribed_reps_2=10, weight=50)
+        for index, item in enumerate(items)
+        for number in range(1, 4)
+    ])
+
+    return {
+        "user": user,
+        "food_plan_id": current_plan.id,
+        "food_section_id": sections[2].id,
+        "gym_plan_id": gym_plan.id,
+        "gym_section_id": gym_sections[0].id,
+        "gym_item_id": items[0].id,
+        "exercise_id": exercises[0].id,
+    }
+
+
+def sample_image(size=(640, 480)) -> SimpleUploadedFile:
+    from PIL import Image
+
+    buffer = io.BytesIO()
+    Image.new("RGB", size, (200, 120, 60)).save(buffer, format="PNG")
+    return SimpleUploadedFile("pasto.png", buffer.getvalue(), content_type="image/png")
+
+
+def ai_endpoints(seed: dict) -> list[dict]:
+    """
+    Tutti gli endpoint AI di data/urls.py con i parametri per i dati di `seed_benchmark_data`.
+    """
+    return [
+        {"name": "weight-analysis", "method": "get", "url": reverse("weight-analysis")},
+        {"name": "weight-analysis-stream", "method": "get", "url": reverse("weight-analysis-stream")},
+        {"name": "body-analysis", "method": "get", "url": reverse("body-analysis")},
+        {"name": "body-analysis-stream", "method": "get", "url": reverse("body-analysis-stream")},
+        {"name": "foodplan-text-parsing", "method": "post", "url": reverse("foodplan-text-parsing"),
+         "data": lambda: {"sentence": "A pranzo 100g di pasta al pomodoro, petto di pollo e una mela"}},
+        {"name": "foodplan-image-parsing", "method": "post", "url": reverse("foodplan-image-parsing"),
+         "data": lambda: {"image": sample_image()}, "format": "multipart"},
+        {"name": "foodplan-optimize-grams", "method": "get",
+         "url": reverse("foodplan-optimize-grams", args=[seed["food_plan_id"]])},
+        {"name": "foodplan-optimize-grams-numeric", "method": "get",
+         "url": reverse("foodplan-optimize-grams", args=[seed["food_plan_id"]]) + "?mode=numeric"},
+        {"name": "foodplan-generate-plan-item", "method": "get",
+         "url": reverse("foodplan-generate-plan-item", args=[seed["food_plan_id"]])},
+        {"name": "foodplan-generate-macros", "method": "get", "url": reverse("foodplan-generate-macros")},
+        {"name": "foodplan-generate-alternative-section", "method": "post",
+         "url": reverse("foodplan-generate-alternative-section"),
+         "data": lambda: {"food_plan_id": seed["food_plan_id"], "section_id": seed["food_section_id"]}},
+        {"name": "gymplansection-classify", "method": "get",
+         "url": reverse("gymplansection-classify", args=[seed["gym_section_id"]])},
+        {"name": "gymplansection-generate-note", "method": "get",
+         "url": reverse("gymplansection-generate-note", args=[seed["gym_section_id"]])},
+        {"name": "gymplansection-generate-note-stream", "method": "get",
+         "url": reverse("gymplansection-generate-note-stream", args=[seed["gym_section_id"]])},
+        {"name": "gymplan-generate-note", "method": "get",
+         "url": reverse("gymplan-generate-note", args=[seed["gym_plan_id"]])},
+        {"name": "gymplan-generate-note-stream", "method": "get",
+         "url": reverse("gymplan-generate-note-stream", args=[seed["gym_plan_id"]])},
+        {"name": "gymplan-generate-entire", "method": "post",
+         "url": reverse("gymplan-generate_entire", args=[seed["gym_plan_id"]]),
+         "data": lambda: {"days": ["lun", "mer", "ven"]}, "format": "json"},
+        {"name": "gymplanitem-generate-note", "method": "get",
+         "url": reverse("gymplanitem-generate-note", args=[seed["gym_item_id"]])},
+        {"name": "gymplanitem-generate-note-stream", "method": "get",
+         "url": reverse("gymplanitem-generate-note-stream", args=[seed["gym_item_id"]])},
+        {"name": "gymplanitem-generate-alternative", "method": "get",
+         "url": reverse("gymplanitem-generate-alternative", args=[seed["gym_item_id"]])},
+        {"name": "gymplanitem-generate-warmup", "method": "get",
+         "url": reverse("gymplanitem-generate-warmup", args=[seed["gym_item_id"]])},
+        {"name": "gymplanset-suggested-weight", "method": "get",
+         "url": reverse("gymplanset-suggested-weight", args=[seed["exercise_id"]])},
+    ]
+
+
+def measure_request(client, endpoint: dict, llm_call_count) -> dict:
+    """
+    Esegue una richiesta (consumando l'eventuale risposta in streaming) e ne misura
+    latenza, query SQL (su tutti i database configurati) e chiamate LLM.
+
+    :param llm_call_count: funzione che ritorna il totale corrente delle chiamate LLM
+    """
+    data = endpoint["data"]() if "data" in endpoint else None
+    kwargs = {"format": endpoint["format"]} if "format" in endpoint else {}
+
+    calls_before = llm_call_count()
+    with ExitStack() as stack:
+        # Tutti gli alias: le view con ReplicaReadMixin leggono dalla replica
+        captured = [stack.enter_context(CaptureQueriesContext(connections[alias])) for alias in connections]
+        started = time.perf_counter()
+        response = getattr(client, endpoint["method"])(endpoint["url"], data, **kwargs)
+        if getattr(response, "streaming", False):
+            b"".join(response.streaming_content)
+        elapsed = (time.perf_counter() - started) * 1000
+
+    return {
+        "ms": elapsed,
+        "queries": sum(len(queries.captured_queries) for queries in captured),
+        "llm_calls": llm_call_count() - calls_before,
+        "status": response.status_code,
+    }
+
+
+def seed_time_series(users: int = 50, years: int = 3) -> list:
+    """
+    Storico pluriennale per più utenti: una pesata al giorno, misure, piano alimentare e scheda ogni settimana.
+
+    :return: lista degli utenti creati
+    """
+    from data.models import Weight, BodyMeasurement, FoodPlan, GymPlan
+
+    today = timezone.now().date()
+    monday = today - timedelta(days=today.weekday())
+    days = 365 * years
+    weeks = days // 7
+
+    created = get_user_model().objects.bulk_create([
+        get_user_model()(username=f"storico{i}") for i in range(users)
+    ])
+
+    for user in created:
+        Weight.objects.bulk_create([
+            Weight(author=user, date_recorded=today - timedelta(days=day), weight_value=80 + (day % 30) / 10)
+            for day in range(days)
+        ], batch_size=2000)
+        BodyMeasurement.objects.bulk_create([
+            BodyMeasurement(author=user, date_recorded=today - timedelta(weeks=week), waist=85, chest=100)
+            for week in range(weeks)
+        ], batch_size=2000)
+        FoodPlan.objects.bulk_create([
+            FoodPlan(author=user, start_date=monday - timedelta(weeks=week),
+                     end_date=monday - timedelta(weeks=week) + timedelta(days=6),
+                     max_kcal=2500, max_protein=150, max_carbs=280, max_fats=80)
+            for week in range(weeks)
+        ], batch_size=2000)
+        GymPlan.objects.bulk_create([
+            GymPlan(author=user, start_date=monday - timedelta(weeks=week),
+                    end_date=monday - timedelta(weeks=week) + timedelta(days=6))
+            for week in range(weeks)
+        ], batch_size=2000)
+
+    return created
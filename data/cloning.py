@@ -0,0 +1,131 @@
+from datetime import timedelta
+
+from django.db import transaction
+
+from .models import FoodPlan, FoodPlanItem, GymPlan, GymPlanItem, GymPlanSection, GymPlanSetDetail
+
+
+# ======== CLONAZIONE DEI PIANI ========
+# Copia profonda di un piano (alimentare o di allenamento) sulle settimane successive.
+# Ogni livello dell'albero viene letto con una query e scritto con un solo bulk_create,
+# dentro un'unica transazione: il numero di query non dipende né dalla dimensione del piano
+# né dal numero di settimane clonate. Le nuove righe vengono collegate ai nuovi genitori
+# tramite mappe {(settimana, id originale): nuova istanza}.
+
+MAX_CLONE_WEEKS = 52
+
+
+def check_clone_weeks(weeks: int):
+    if not 1 <= weeks <= MAX_CLONE_WEEKS:
+        raise ValueError(f"Il numero di settimane deve essere tra 1 e {MAX_CLONE_WEEKS}: {weeks}")
+
+
+def clone_food_plan(original_plan: FoodPlan, weeks: int = 1) -> list[FoodPlan]:
+    """
+    Clona un piano alimentare e i suoi FoodPlanItem sulle `weeks` settimane successive.
+
+    :param original_plan: piano da copiare
+    :param weeks: numero di copie; la copia k-esima inizia 7*k giorni dopo l'originale
+    :return: lista dei nuovi piani, in ordine di settimana
+    """
+    check_clone_weeks(weeks)
+    with transaction.atomic():
+        original_items = list(FoodPlanItem.objects.filter(food_plan=original_plan))
+
+        new_plans = FoodPlan.objects.bulk_create([
+            FoodPlan(
+                author=original_plan.author,
+                start_date=original_plan.start_date + timedelta(days=7 * week),
+                end_date=original_plan.end_date + timedelta(days=7 * week),
+                max_kcal=original_plan.max_kcal,
+                max_protein=original_plan.max_protein,
+                max_carbs=original_plan.max_carbs,
+                max_fats=original_plan.max_fats,
+            )
+            for week in range(1, weeks + 1)
+        ])
+
+        # Le sezioni dei piani alimentari appartengono all'utente, non al piano: si riusano le stesse
+        FoodPlanItem.objects.bulk_create([
+            FoodPlanItem(
+                eaten=False,
+                food_plan=new_plan,
+                food_item_id=item.food_item_id,
+                food_section_id=item.food_section_id,
+                quantity_in_grams=item.quantity_in_grams,
+            )
+            for new_plan in new_plans
+            for item in original_items
+        ])
+
+    return new_plans
+
+
+def clone_gym_plan(original_plan: GymPlan, weeks: int = 1) -> list[GymPlan]:
+    """
+    Clona una scheda di allenamento (sezioni, item e set) sulle `weeks` settimane successive.
+    Gli esercizi (GymItem) sono riferimenti e non vengono duplicati.
+
+    :param original_plan: scheda da copiare
+    :param weeks: numero di copie; la copia k-esima inizia 7*k giorni dopo l'originale
+    :return: lista delle nuove schede, in ordine di settimana
+    """
+    check_clone_weeks(weeks)
+    with transaction.atomic():
+        original_sections = list(GymPlanSection.objects.filter(gym_plan=original_plan))
+        original_items = list(GymPlanItem.objects.filter(section__gym_plan=original_plan))
+        original_sets = list(GymPlanSetDetail.objects.filter(plan_item__section__gym_plan=original_plan))
+
+        new_plans = GymPlan.objects.bulk_create([
+            GymPlan(
+                author=original_plan.author,
+                start_date=original_plan.start_date + timedelta(days=7 * week),
+                end_date=original_plan.end_date + timedelta(days=7 * week),
+                note=original_plan.note
+            )
+            for week in range(1, weeks + 1)
+        ])
+
+        section_mapping = {}
+        for week, new_plan in enumerate(new_plans):
+            for section in original_sections:
+                section_mapping[(week, section.id)] = GymPlanSection(
+                    author_id=section.author_id,
+                    gym_plan=new_plan,
+                    day=section.day,
+                    type=section.type,
+                    note=section.note
+                )
+        GymPlanSection.objects.bulk_create(section_mapping.values())
+
+        item_mapping = {}
+        for week in range(len(new_plans)):
+            for item in original_items:
+                item_mapping[(week, item.id)] = GymPlanItem(
+                    section=section_mapping[(week, item.section_id)],
+                    order=item.order,
+                    notes=item.notes,
+                    intensity_techniques=item.intensity_techniques
+                )
+        GymPlanItem.objects.bulk_create(item_mapping.values())
+
+        GymPlanSetDetail.objects.bulk_create([
+            GymPlanSetDetail(
+                plan_item=item_mapping[(week, s.plan_item_id)],
+                exercise_id=s.exercise_id,  # RIFERIMENTO, non duplicato
+                order=s.order,
+                set_number=s.set_number,
+                prescribed_reps_1=s.prescribed_reps_1,
+                actual_reps_1=s.actual_reps_1,
+                prescribed_reps_2=s.prescribed_reps_2,
+                actual_reps_2=s.actual_reps_2,
+                rir=s.rir,
+                rest_seconds=s.rest_seconds,
+                weight=s.weight,
+                tempo_fcr=s.tempo_fcr
+            )
+            for week in range(len(new_plans))
+            for s in original_sets
+        ])
+
+    return new_plans
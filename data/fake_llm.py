@@ -0,0 +1,281 @@
+import hashlib
+import json
+import re
+import threading
+import time
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+
+# ======== BACKEND LLM FITTIZIO ========
+# Sostituto deterministico di ChatOpenAI, attivato con LLM_BACKEND=fake (vedi settings.FAKE_LLM).
+# Permette di eseguire pipeline, test e benchmark senza rete né chiave OpenAI.
+#
+# La risposta a un prompt viene scelta, in ordine, tra:
+#   1. le fixture registrate (file JSON {sha256 del prompt: risposta}, vedi fixture_key)
+#   2. lo script della catena che ha generato il prompt (DEFAULT_SCRIPT, chiave = nome in CHAINS)
+#   3. una risposta testuale generica
+# La latenza artificiale simula il tempo di risposta del provider.
+
+def fixture_key(prompt: str) -> str:
+    return hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+
+
+def estimate_tokens(text: str) -> int:
+    # Stima grossolana (≈ 4 caratteri per token), sufficiente per misurare l'andamento dei consumi
+    return max(1, len(text) // 4)
+
+
+def _batch_selection(prompt):
+    meals = len(re.findall(r"^Pasto \d+:", prompt, re.M))
+    return json.dumps([{"meal": number, "candidate": 1} for number in range(1, meals + 1)])
+
+
+def _optimization(prompt):
+    ids = re.findall(r"^- ID (\d+)", prompt, re.M)
+    return json.dumps([{"id": int(item_id), "adjusted_quantity_in_grams": 100} for item_id in ids])
+
+
+def _generated_food_item(prompt):
+    match = re.search(r'con il nome "(.*?)"', prompt)
+    return json.dumps({
+        "name": match.group(1) if match else "Alimento generato",
+        "kcal_per_100g": 150, "protein_per_100g": 10, "carbs_per_100g": 20, "sugars_per_100g": 5,
+        "fats_per_100g": 4, "saturated_fats_per_100g": 1, "fiber_per_100g": 2
+    })
+
+
+def _alternative_meals(prompt):
+    match = re.search(r'della sezione "(.*?)"', prompt)
+    section = match.group(1) if match else "Pranzo"
+    return json.dumps([
+        {"meal": "Riso basmati", "quantity": 80, "section": section, "keywords": ["riso", "basmati"]},
+        {"meal": "Petto di pollo", "quantity": 150, "section": section, "keywords": ["pollo", "petto"]},
+    ])
+
+
+def _gym_plan(prompt):
+    match = re.search(r"^Giorni selezionati: (.*)$", prompt, re.M)
+    days = [day.strip() for day in match.group(1).split(",")] if match else ["lun"]
+    exercises = [
+        {"name": "Barbell Squat", "order": 1, "sets": 4, "technique": "bilateral", "prescribed_reps_1": 6,
+         "prescribed_reps_2": 8, "tempo_fcr": "3-1-1", "rir": 2, "weight": 60, "rest_seconds": 120,
+         "notes": "Forza sulle gambe"},
+        {"name": "Barbell Bench Press", "order": 2, "sets": 3, "technique": "bilateral", "prescribed_reps_1": 8,
+         "prescribed_reps_2": 10, "tempo_fcr": "2-0-2", "rir": 2, "weight": 50, "rest_seconds": 90,
+         "notes": "Volume per il petto"},
+    ]
+    return json.dumps({day: exercises for day in days})
+
+
+def _exercise_name(prompt):
+    match = re.search(r'esercizio: "(.*?)"', prompt)
+    wanted = set(match.group(1).lower().split()) if match else set()
+    block = prompt.split("(case insensitive):", 1)[-1].split("Risposta:", 1)[0]
+    names = [name.strip() for name in block.split(",") if name.strip()]
+    for name in names:
+        if wanted & set(name.lower().split()):
+            return name
+    return names[0] if names else ""
+
+
+FOOD_MEALS = json.dumps([
+    {"meal": "Pasta al pomodoro", "keywords": ["pasta", "pomodoro", "pomodori"], "quantity": 100},
+    {"meal": "Petto di pollo", "keywords": ["pollo", "petto"], "quantity": 150},
+    {"meal": "Mela", "keywords": ["mela", "mele"], "quantity": 120},
+])
+
+FOOD_PLAN = json.dumps([
+    {"meal": "Yogurt greco", "keywords": ["yogurt", "greco"], "quantity": 150, "section": "Colazione",
+     "section_keywords": ["colazione", "mattina"]},
+    {"meal": "Avena", "keywords": ["avena", "fiocchi"], "quantity": 50, "section": "Colazione",
+     "section_keywords": ["colazione", "mattina"]},
+    {"meal": "Pasta integrale", "keywords": ["pasta", "integrale"], "quantity": 90, "section": "Pranzo",
+     "section_keywords": ["pranzo"]},
+    {"meal": "Petto di pollo", "keywords": ["pollo", "petto"], "quantity": 150, "section": "Pranzo",
+     "section_keywords": ["pranzo"]},
+    {"meal": "Mela", "keywords": ["mela", "mele"], "quantity": 150, "section": "Spuntino",
+     "section_keywords": ["spuntino"]},
+    {"meal": "Salmone", "keywords": ["salmone"], "quantity": 150, "section": "Cena",
+     "section_keywords": ["cena", "sera"]},
+])
+
+ANALYSIS_TEXT = (
+    "L'andamento è regolare e coerente con l'obiettivo: i valori mostrano un progresso graduale, "
+    "senza variazioni brusche. Continua con la stessa costanza e verifica i dati ogni due settimane."
+)
+
+DEFAULT_SCRIPT = {
+    "goals_target": "fitness",
+    "goal_description": "Obiettivo orientato a salute generale, tono muscolare e resistenza.",
+    "weight_analysis": ANALYSIS_TEXT,
+    "body_measurement_analysis": ANALYSIS_TEXT,
+    "food_parsing_natural_language": FOOD_MEALS,
+    "food_parsing_vision": FOOD_MEALS,
+    "food_items_batch_selector": _batch_selection,
+    "food_plan_optimization": _optimization,
+    "food_plan_personalized": FOOD_PLAN,
+    "food_item_generate_macros": _generated_food_item,
+    "food_plan_generate_macros": json.dumps({
+        "max_protein": 150, "max_carbs": 250, "max_fats": 70,
+        "reason": "<b>Proteine</b> confermate, leggero <b>aumento</b> dei carboidrati."
+    }),
+    "food_plan_alternative_meals": _alternative_meals,
+    "food_plan_section_type": "Full Body",
+    "food_plan_section_note": "Allenamento completo con focus su forza e controllo tecnico, recuperi ampi.",
+    "food_plan_note": "Settimana bilanciata tra forza e volume, con progressione graduale dei carichi.",
+    "food_plan_item_note": "Focus su forza e controllo",
+    "generate_plan": _gym_plan,
+    "parser": _exercise_name,
+    "gym_item_generate_alternative": json.dumps({
+        "name": "Dumbbell Bench Press", "sets": 3, "prescribed_reps_1": 8, "prescribed_reps_2": 10,
+        "tempo_fcr": "2-0-2", "rir": 2, "weight": 20, "rest_seconds": 90, "notes": "Stimolo diverso per il petto"
+    }),
+    "generate_warmup": json.dumps([
+        {"order": 1, "prescribed_reps_1": 12, "prescribed_reps_2": 12, "tempo_fcr": "2-0-1", "rir": 5,
+         "weight": 20, "rest_seconds": 60},
+        {"order": 2, "prescribed_reps_1": 8, "prescribed_reps_2": 8, "tempo_fcr": "2-0-1", "rir": 4,
+         "weight": 35, "rest_seconds": 60},
+    ]),
+    "suggest_weight": "60",
+}
+
+DEFAULT_RESPONSE = "Risposta generata dal backend LLM fittizio."
+
+PLACEHOLDER_RE = re.compile(r"(?<!\{)\{\w+\}(?!\})")
+
+_signatures = None
+
+
+def chain_signatures() -> dict:
+    """
+    Per ogni catena di CHAINS, il frammento letterale più lungo del suo prompt: serve a riconoscere
+    la catena quando i metadata della run non sono disponibili (es. in streaming).
+    """
+    global _signatures
+    if _signatures is None:
+        from data.utils import CHAINS, food_parsing_vision_prompt
+
+        templates = {name: prompt for name, (prompt, _) in CHAINS.items()}
+        templates["food_parsing_vision"] = food_parsing_vision_prompt
+        _signatures = {
+            name: max(PLACEHOLDER_RE.split(template), key=len).replace("{{", "{").replace("}}", "}").strip()
+            for name, template in templates.items()
+        }
+    return _signatures
+
+
+def detect_chain(prompt: str) -> str | None:
+    return next((name for name, signature in chain_signatures().items() if signature in prompt), None)
+
+_calls = 0
+_calls_lock = threading.Lock()
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    Modello chat deterministico compatibile con le catene LangChain (prompt | modello).
+    Conta le chiamate eseguite (FakeChatModel.call_count) per i benchmark.
+    """
+
+    model_name: str = "fake"
+    temperature: float = 0
+    latency: float = 0.0
+    fixtures: dict = {}
+    script: dict = DEFAULT_SCRIPT
+    # Come ChatOpenAI: in streaming l'uso dei token arriva solo se richiesto
+    stream_usage: bool = False
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat"
+
+    @property
+    def _identifying_params(self) -> dict:
+        return {"model_name": self.model_name, "temperature": self.temperature}
+
+    @staticmethod
+    def call_count() -> int:
+        return _calls
+
+    @staticmethod
+    def reset_call_count():
+        global _calls
+        with _calls_lock:
+            _calls = 0
+
+    def respond(self, messages, run_manager=None) -> tuple[str, str]:
+        """
+        Ritorna (prompt, risposta) per i messaggi ricevuti.
+        """
+        parts = []
+        for message in messages:
+            if isinstance(message.content, str):
+                parts.append(message.content)
+            else:
+                parts.extend(part.get("text", "") for part in message.content if isinstance(part, dict))
+        prompt = "\n".join(parts)
+
+        global _calls
+        with _calls_lock:
+            _calls += 1
+
+        if fixture_key(prompt) in self.fixtures:
+            return prompt, self.fixtures[fixture_key(prompt)]
+
+        chain = (getattr(run_manager, "metadata", None) or {}).get("chain") or detect_chain(prompt)
+        answer = self.script.get(chain, DEFAULT_RESPONSE)
+        return prompt, answer(prompt) if callable(answer) else answer
+
+    def usage(self, prompt: str, text: str) -> dict:
+        input_tokens = estimate_tokens(prompt)
+        output_tokens = estimate_tokens(text)
+        return {"input_tokens": input_tokens, "output_tokens": output_tokens, "total_tokens": input_tokens + output_tokens}
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        prompt, text = self.respond(messages, run_manager)
+        if self.latency:
+            time.sleep(self.latency)
+
+        usage = self.usage(prompt, text)
+        message = AIMessage(
+            content=text,
+            usage_metadata=usage,
+            response_metadata={"model_name": self.model_name, "finish_reason": "stop"}
+        )
+        return ChatResult(
+            generations=[ChatGeneration(message=message)],
+            llm_output={"model_name": self.model_name, "token_usage": {
+                "prompt_tokens": usage["input_tokens"],
+                "completion_tokens": usage["output_tokens"],
+                "total_tokens": usage["total_tokens"],
+            }}
+        )
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        prompt, text = self.respond(messages, run_manager)
+
+        # Metà della latenza prima del primo token, il resto distribuito sui frammenti
+        pieces = re.findall(r"\S+\s*", text) or [text]
+        if self.latency:
+            time.sleep(self.latency / 2)
+
+        for index, piece in enumerate(pieces):
+            if self.latency and index:
+                time.sleep(self.latency / 2 / len(pieces))
+            last = index == len(pieces) - 1
+            chunk = ChatGenerationChunk(message=AIMessageChunk(
+                content=piece,
+                usage_metadata=self.usage(prompt, text) if last and self.stream_usage else None,
+                response_metadata={"model_name": self.model_name, "finish_reason": "stop"} if last else {}
+            ))
+            yield chunk
+
+
+def load_fixtures(path) -> dict:
+    if not path:
+        return {}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
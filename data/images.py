@@ -0,0 +1,326 @@
+import base64
+import io
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from data.storage import content_hash, name_digest, references_lock
+
+
+# ======== PREPARAZIONE DELLE IMMAGINI PER IL MODELLO VISION ========
+# Le foto dei telefoni (10-12 MP, diversi MB) non vanno inviate a piena risoluzione: il modello
+# le ridimensiona comunque (lato lungo ≤ 2048 px, poi lato corto ≤ 768 px). Riducendole prima,
+# con lo stesso criterio, e ricodificandole in JPEG/WebP si inviano poche centinaia di KB
+# invece di diversi MB, con meno memoria occupata e una risposta più rapida.
+# La configurazione è in settings.VISION_IMAGE.
+
+MIME_TYPES = {
+    "JPEG": "image/jpeg",
+    "WEBP": "image/webp",
+    "PNG": "image/png",
+    "GIF": "image/gif",
+}
+
+# Multiplo di 3: ogni blocco si codifica in Base64 senza padding intermedio
+ENCODE_CHUNK_SIZE = 3 * 64 * 1024
+
+
+def vision_size(width: int, height: int) -> tuple[int, int]:
+    """
+    Dimensioni utili per il modello: lato lungo entro MAX_LONG_SIDE e lato corto entro MAX_SHORT_SIDE,
+    mantenendo le proporzioni. Le immagini già più piccole non vengono ingrandite.
+    """
+    config = settings.VISION_IMAGE
+    scale = min(
+        1.0,
+        config["MAX_LONG_SIDE"] / max(width, height),
+        config["MAX_SHORT_SIDE"] / min(width, height),
+    )
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def prepare_image_for_vision(file) -> tuple[bytes, str]:
+    """
+    Ridimensiona e ricodifica un'immagine caricata per l'invio al modello vision.
+
+    :param file: file immagine (upload Django o FieldFile)
+    :return: (byte dell'immagine ricodificata, MIME type corrispondente)
+    :raises UnidentifiedImageError: se il file non è un'immagine leggibile da Pillow
+    """
+    config = settings.VISION_IMAGE
+    file.seek(0)
+
+    with Image.open(file) as image:
+        # Per i JPEG la decodifica avviene direttamente a una scala ridotta (1/2, 1/4, 1/8):
+        # molta meno memoria e CPU rispetto a decodificare 12 MP per poi scartarli
+        image.draft("RGB", vision_size(*image.size))
+        image = ImageOps.exif_transpose(image)
+
+        if image.mode in ("RGBA", "LA", "P"):
+            image = image.convert("RGBA")
+            background = Image.new("RGB", image.size, (255, 255, 255))
+            background.paste(image, mask=image.getchannel("A"))
+            image = background
+        elif image.mode != "RGB":
+            image = image.convert("RGB")
+
+        image.thumbnail(vision_size(*image.size), Image.Resampling.LANCZOS)
+
+        buffer = io.BytesIO()
+        image.save(buffer, format=config["FORMAT"], quality=config["QUALITY"], optimize=True)
+
+    return buffer.getvalue(), MIME_TYPES[config["FORMAT"]]
+
+
+def encode_base64_chunks(file) -> str:
+    """
+    Codifica un file in Base64 leggendolo a blocchi, senza copiarlo prima in un buffer intermedio.
+    """
+    file.seek(0)
+    parts = []
+    while chunk := file.read(ENCODE_CHUNK_SIZE):
+        parts.append(base64.b64encode(chunk).decode("ascii"))
+    return "".join(parts)
+
+
+def image_data_url(file) -> str:
+    """
+    Data URI dell'immagine pronta per il modello vision. Se Pillow non riesce a leggerla
+    (formato non supportato), il file viene inviato così com'è con il MIME type dichiarato dall'upload.
+    """
+    try:
+        data, mime_type = prepare_image_for_vision(file)
+        return f"data:{mime_type};base64,{base64.b64encode(data).decode('ascii')}"
+    except UnidentifiedImageError:
+        mime_type = getattr(file, "content_type", None) or "image/jpeg"
+        return f"data:{mime_type};base64,{encode_base64_chunks(file)}"
+
+
+# ======== CACHE PERCETTIVA DELLE ANALISI ========
+# La stessa foto (o una quasi identica: ricompressa, ridimensionata, con luce leggermente diversa)
+# caricata più volte non deve costare ogni volta una chiamata vision. Di ogni foto analizzata si
+# salva un dHash a 64 bit insieme ai pasti riconosciuti: un nuovo upload con hash entro
+# THRESHOLD bit di distanza (Hamming) da uno recente dello stesso utente riusa quell'analisi.
+# Configurazione in settings.FOOD_IMAGE_CACHE (soglia, finestra di validità, voci massime per utente).
+
+def compute_dhash(file, hash_size: int = 8) -> int | None:
+    """
+    Difference hash: l'immagine in scala di grigi ridotta a (hash_size + 1) x hash_size, un bit per ogni
+    coppia di pixel adiacenti (1 se il pixel a sinistra è più chiaro). Ritorna None se il file non è un'immagine.
+    """
+    file.seek(0)
+    try:
+        with Image.open(file) as image:
+            image.draft("L", (hash_size * 8, hash_size * 8))
+            image = ImageOps.exif_transpose(image)
+            pixels = list(image.convert("L").resize((hash_size + 1, hash_size), Image.Resampling.LANCZOS).getdata())
+    except UnidentifiedImageError:
+        return None
+    finally:
+        file.seek(0)
+
+    value = 0
+    for row in range(hash_size):
+        for col in range(hash_size):
+            left = pixels[row * (hash_size + 1) + col]
+            right = pixels[row * (hash_size + 1) + col + 1]
+            value = (value << 1) | int(left > right)
+    return value
+
+
+def find_cached_food_analysis(user, image_hash: int) -> list | None:
+    """
+    Cerca tra le analisi recenti dell'utente quella con hash più vicino entro la soglia.
+
+    :return: lista dei pasti già riconosciuti, oppure None se non c'è un'immagine abbastanza simile
+    """
+    from data.models import FoodImageAnalysis
+
+    config = settings.FOOD_IMAGE_CACHE
+    if not config["ENABLED"] or image_hash is None:
+        return None
+
+    # Scansione lineare: le voci per utente sono al massimo MAX_ENTRIES, il confronto costa un XOR
+    cutoff = timezone.now() - timedelta(days=config["RETENTION_DAYS"])
+    best_id, best_distance = None, config["THRESHOLD"] + 1
+    for entry_id, entry_hash in FoodImageAnalysis.objects.filter(author=user, created_at__gte=cutoff) \
+            .values_list("id", "image_hash"):
+        distance = (image_hash ^ int(entry_hash, 16)).bit_count()
+        if distance < best_distance:
+            best_id, best_distance = entry_id, distance
+
+    if best_id is None:
+        return None
+
+    FoodImageAnalysis.objects.filter(pk=best_id).update(hits=F("hits") + 1, last_used_at=timezone.now())
+    return FoodImageAnalysis.objects.values_list("meals", flat=True).get(pk=best_id)
+
+
+def store_food_analysis(user, image_hash: int, meals: list):
+    """
+    Salva l'analisi di una foto ed elimina le voci scadute o in eccesso (le meno usate di recente).
+    """
+    from data.models import FoodImageAnalysis
+
+    config = settings.FOOD_IMAGE_CACHE
+    if not config["ENABLED"] or image_hash is None or not meals:
+        return
+
+    FoodImageAnalysis.objects.create(author=user, image_hash=f"{image_hash:016x}", meals=meals)
+
+    cutoff = timezone.now() - timedelta(days=config["RETENTION_DAYS"])
+    entries = FoodImageAnalysis.objects.filter(author=user)
+    entries.filter(created_at__lt=cutoff).delete()
+
+    overflow = list(entries.order_by("-last_used_at", "-pk").values_list("pk", flat=True)[config["MAX_ENTRIES"]:])
+    if overflow:
+        FoodImageAnalysis.objects.filter(pk__in=overflow).delete()
+
+
+# ======== VARIANTI DELLE IMMAGINI DEGLI ESERCIZI ========
+# Per ogni GymMediaUpload vengono generate versioni ridotte in JPEG e WebP (settings.GYM_MEDIA_VARIANTS),
+# salvate in gym_media/variants/<hash[:2]>/<hash>/ con lo sha256 del file originale, come lo storage per
+# contenuto (data/storage.py): gli upload dello stesso file condividono le stesse varianti e una variante
+# viene eliminata solo quando nessun upload la usa più. Le liste mostrano miniature da pochi KB invece
+# dell'immagine originale; i percorsi generati sono salvati nel campo `variants` dell'upload.
+
+VARIANT_FORMATS = {
+    "jpeg": ("JPEG", "jpg"),
+    "webp": ("WEBP", "webp"),
+}
+
+
+def variant_directory(digest: str) -> str:
+    return f"{settings.GYM_MEDIA_VARIANTS['DIRECTORY']}/{digest[:2]}/{digest}"
+
+
+def variant_path(digest: str, size_name: str, extension: str) -> str:
+    return f"{variant_directory(digest)}/{size_name}.{extension}"
+
+
+def variant_paths(variants: dict) -> list[tuple[str, str, str]]:
+    """
+    (dimensione, formato, percorso) di ogni variante descritta in `variants`.
+    """
+    return [
+        (size_name, key, size[key])
+        for size_name, size in (variants or {}).get("sizes", {}).items()
+        for key in VARIANT_FORMATS
+        if size.get(key)
+    ]
+
+
+def generate_media_variants(upload) -> dict:
+    """
+    Genera (o rigenera) tutte le varianti di un GymMediaUpload.
+
+    :return: descrizione delle varianti da salvare in `upload.variants`
+    :raises UnidentifiedImageError: se il file non è un'immagine
+    """
+    config = settings.GYM_MEDIA_VARIANTS
+    largest = max(config["SIZES"].values())
+    sizes = {}
+
+    with upload.file.open("rb") as file:
+        digest = name_digest(upload.file.name) or content_hash(file)
+
+        with Image.open(file) as image:
+            image.draft("RGB", (largest, largest))
+            image = ImageOps.exif_transpose(image).convert("RGB")
+
+            for size_name, max_side in config["SIZES"].items():
+                resized = image.copy()
+                resized.thumbnail((max_side, max_side), Image.Resampling.LANCZOS)
+                sizes[size_name] = {"width": resized.width, "height": resized.height}
+
+                for key, (image_format, extension) in VARIANT_FORMATS.items():
+                    buffer = io.BytesIO()
+                    resized.save(buffer, format=image_format, quality=config["QUALITY"], optimize=True)
+                    path = variant_path(digest, size_name, extension)
+                    # Percorso stabile: una rigenerazione sovrascrive la variante precedente
+                    with references_lock:
+                        default_storage.delete(path)
+                        sizes[size_name][key] = default_storage.save(path, ContentFile(buffer.getvalue()))
+
+    return {"source": upload.file.name, "sizes": sizes}
+
+
+def delete_media_variants(variants: dict):
+    """
+    Elimina, dopo il commit della transazione in corso, le varianti che nessun upload usa più.
+    Va chiamata dopo aver rimosso o aggiornato l'upload (es. in post_delete).
+    """
+    paths = variant_paths(variants)
+    if paths:
+        transaction.on_commit(lambda: delete_unreferenced_variants(paths))
+
+
+def delete_unreferenced_variants(paths: list[tuple[str, str, str]]):
+    from data.models import GymMediaUpload
+
+    with references_lock:
+        for size_name, key, path in paths:
+            if not GymMediaUpload.objects.filter(**{f"variants__sizes__{size_name}__{key}": path}).exists():
+                default_storage.delete(path)
+
+
+def variants_are_current(upload) -> bool:
+    """
+    Le varianti sono aggiornate se sono state generate dal file attuale con tutte le dimensioni configurate
+    e, per i file dello storage per contenuto, si trovano nella cartella del loro hash.
+    """
+    variants = upload.variants or {}
+    if variants.get("source") != upload.file.name:
+        return False
+    if set(variants.get("sizes", {})) != set(settings.GYM_MEDIA_VARIANTS["SIZES"]):
+        return False
+
+    digest = name_digest(upload.file.name)
+    return not digest or all(
+        path.startswith(f"{variant_directory(digest)}/") for _, _, path in variant_paths(variants)
+    )
+
+
+def shared_media_variants(upload) -> dict | None:
+    """
+    Varianti aggiornate di un altro upload dello stesso file, se esistono ancora: si riusano senza rigenerarle.
+    """
+    from data.models import GymMediaUpload
+
+    for other in GymMediaUpload.objects.filter(file=upload.file.name, variants__source=upload.file.name) \
+            .exclude(pk=upload.pk).only("file", "variants"):
+        if variants_are_current(other) and all(
+            default_storage.exists(path) for _, _, path in variant_paths(other.variants)
+        ):
+            return other.variants
+    return None
+
+
+def refresh_media_variants(upload, force: bool = False) -> bool:
+    """
+    Rigenera le varianti se mancanti o non aggiornate e le salva sull'upload (senza inviare post_save).
+    Se un altro upload dello stesso file ha già le varianti aggiornate, vengono riusate.
+
+    :param force: rigenera le varianti anche se aggiornate o condivise
+    :return: True se le varianti sono state generate o riusate
+    """
+    from data.models import GymMediaUpload
+
+    if not upload.file or not upload.file.storage.exists(upload.file.name):
+        return False
+    if not force and variants_are_current(upload):
+        return False
+
+    old_variants = upload.variants
+    upload.variants = (not force and shared_media_variants(upload)) or generate_media_variants(upload)
+    GymMediaUpload.objects.filter(pk=upload.pk).update(variants=upload.variants)
+
+    # Le varianti precedenti (file cambiato, percorso non più per contenuto) restano se questo o altri upload le usano
+    delete_media_variants(old_variants)
+    return True
@@ -0,0 +1,120 @@
+import traceback
+from datetime import timedelta
+
+from django.db.models import Q
+from django.utils import timezone
+
+from .middleware import collect_metrics
+from .models import AIJob
+from .usage import quota_exceeded, record_llm_usage
+from .pipelines import run_food_image_parsing, run_food_plan_generation, run_gym_plan_generation, run_goal_inference
+
+
+# ======== CODA DEI JOB AI ========
+# Le view AI più lente possono accodare la pipeline e rispondere subito con 202 Accepted:
+# il lavoro viene svolto dal comando `manage.py run_ai_jobs`, fuori dal thread della richiesta,
+# e il client interroga `ai-job/<id>/` fino a quando lo stato è "done" o "failed".
+
+JOB_PIPELINES = {
+    "food_image_parsing": run_food_image_parsing,
+    "food_plan_generation": run_food_plan_generation,
+    "gym_plan_generation": run_gym_plan_generation,
+    "goal_inference": run_goal_inference,
+}
+
+
+def wants_async(request) -> bool:
+    """
+    Una view esegue la pipeline in coda se la richiesta contiene `?async=1` (o true/yes).
+    """
+    return request.query_params.get("async", "").lower() in ("1", "true", "yes")
+
+
+def enqueue_job(user, kind: str, payload: dict | None = None, attachment=None) -> AIJob:
+    """
+    Crea un job in stato "pending" per la pipeline indicata.
+
+    :param user: utente proprietario del job (l'unico che può leggerne lo stato)
+    :param kind: chiave di JOB_PIPELINES
+    :param payload: parametri JSON-serializzabili della pipeline
+    :param attachment: file opzionale (es. immagine caricata) salvato insieme al job
+    """
+    if kind not in JOB_PIPELINES:
+        raise ValueError(f"Tipo di job sconosciuto: {kind}")
+
+    return AIJob.objects.create(
+        author=user,
+        kind=kind,
+        payload=payload or {},
+        attachment=attachment,
+    )
+
+
+def claim_next_job() -> AIJob | None:
+    """
+    Prende in carico il job in attesa più vecchio. Il passaggio pending → running avviene
+    con un UPDATE condizionale, quindi più worker in parallelo non eseguono mai lo stesso job.
+    """
+    while True:
+        job = AIJob.objects.filter(status=AIJob.STATUS_PENDING).order_by("created_at", "id").first()
+        if job is None:
+            return None
+
+        claimed = AIJob.objects.filter(pk=job.pk, status=AIJob.STATUS_PENDING).update(
+            status=AIJob.STATUS_RUNNING,
+            started_at=timezone.now()
+        )
+        if claimed:
+            job.refresh_from_db()
+            return job
+
+
+def run_job(job: AIJob) -> AIJob:
+    """
+    Esegue la pipeline del job e ne salva risultato e status HTTP equivalente.
+    Qualsiasi eccezione segna il job come fallito, senza interrompere il worker;
+    se l'utente ha esaurito la quota giornaliera di token il job fallisce con 429 senza chiamare il modello.
+    """
+    pipeline = JOB_PIPELINES[job.kind]
+
+    if quota_exceeded(job.author):
+        job.status = AIJob.STATUS_FAILED
+        job.result = {"error": "Quota giornaliera di token esaurita."}
+        job.result_status = 429
+    else:
+        with collect_metrics() as metrics:
+            try:
+                attachment = job.attachment if job.attachment else None
+                data, result_status = pipeline(job.author, job.payload, attachment)
+                job.status = AIJob.STATUS_DONE if result_status < 400 else AIJob.STATUS_FAILED
+                job.result = data
+                job.result_status = result_status
+            except Exception as e:
+                traceback.print_exc()
+                job.status = AIJob.STATUS_FAILED
+                job.result = {"error": str(e)}
+                job.result_status = 500
+
+        # Anche i token spesi in background pesano sulla quota dell'utente
+        if metrics.chains:
+            record_llm_usage(job.author, metrics.totals()["chains"])
+
+    job.finished_at = timezone.now()
+    job.save(update_fields=["status", "result", "result_status", "finished_at"])
+
+    # Il file caricato serve solo alla pipeline: una volta elaborato non occupa più spazio
+    if job.attachment:
+        job.attachment.delete(save=True)
+
+    return job
+
+
+def requeue_stale_jobs(older_than_seconds: int) -> int:
+    """
+    Rimette in coda i job rimasti "running" troppo a lungo (es. worker terminato a metà).
+    """
+    cutoff = timezone.now() - timedelta(seconds=older_than_seconds)
+    return AIJob.objects.filter(
+        Q(started_at__lt=cutoff) | Q(started_at__isnull=True),
+        status=AIJob.STATUS_RUNNING
+    ).update(status=AIJob.STATUS_PENDING, started_at=None)
@@ -0,0 +1,252 @@
+import hashlib
+import json
+import os
+import time
+import warnings
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.utils import timezone
+
+from langchain_core.caches import BaseCache
+from langchain_core.globals import set_llm_cache
+from langchain_core.load import dumps, loads
+
+# `loads` è marcata come beta da LangChain: il filtro va registrato dopo l'import,
+# altrimenti langchain_core lo sovrascrive con il proprio
+warnings.filterwarnings("ignore", message="The function `loads` is in beta.*")
+
+
+# === Cache persistente delle risposte LLM ===
+# Ogni chiamata a un modello a temperatura 0 (ChatOpenAI) passa dalla cache globale di LangChain
+# (i modelli con temperatura > 0 e le catene che devono dare ogni volta un testo nuovo no, vedi get_llm):
+# la chiave è composta da modello, temperatura e parametri di invocazione (llm_string)
+# più il prompt renderizzato. Se lo stesso prompt è già stato pagato, la risposta
+# viene servita in pochi millisecondi invece di 1-5 secondi.
+
+DEFAULT_LLM_CACHE = {
+    "BACKEND": "database",      # "database", "filesystem" oppure None per disattivarla
+    "LOCATION": None,           # cartella per il backend "filesystem"
+    "TTL": 60 * 60 * 24 * 7,    # durata di una voce in secondi (None = senza scadenza)
+    "MAX_ENTRIES": 5000,        # oltre questo numero si eliminano le voci usate meno di recente
+    "EVICT_INTERVAL": 300,      # secondi tra due pulizie (scadute e in eccesso) nello stesso processo
+}
+
+
+def make_cache_key(prompt: str, llm_string: str) -> str:
+    """
+    Calcola la chiave della cache a partire dalla configurazione del modello
+    (nome, temperatura, stop, ecc.) e dal prompt serializzato.
+    """
+    return hashlib.sha256(f"{llm_string}\x00{prompt}".encode("utf-8")).hexdigest()
+
+
+def extract_model_name(llm_string: str) -> str:
+    """
+    Estrae il nome del modello dalla llm_string di LangChain (solo a scopo informativo).
+    """
+    try:
+        serialized = json.loads(llm_string.split("---", 1)[0])
+        kwargs = serialized.get("kwargs", {})
+        return kwargs.get("model_name") or kwargs.get("model") or ""
+    except (ValueError, AttributeError):
+        return ""
+
+
+def mark_cached(generations: list) -> list:
+    """
+    Segna le generazioni lette dalla cache (`response_metadata["cached"] = True`),
+    così le metriche per richiesta (data/middleware.py) non le contano come token consumati.
+    """
+    for generation in generations:
+        message = getattr(generation, "message", None)
+        if message is not None:
+            message.response_metadata["cached"] = True
+    return generations
+
+
+class PeriodicEvictionMixin:
+    """
+    Esegue `evict()` dopo una scrittura al più una volta ogni `evict_interval` secondi per processo:
+    la pulizia (DELETE e COUNT sulla tabella, scansione della cartella) non pesa su ogni risposta.
+    Nel frattempo le voci scadute non vengono comunque servite (lookup controlla il TTL) e il numero
+    di voci può superare `max_entries` di quanto scritto in un intervallo. None = a ogni scrittura.
+    """
+    evict_interval = None
+    _next_eviction = 0.0
+
+    def maybe_evict(self):
+        now = time.monotonic()
+        if self.evict_interval and now < self._next_eviction:
+            return
+        self._next_eviction = now + (self.evict_interval or 0)
+        self.evict()
+
+
+class DatabaseLLMCache(PeriodicEvictionMixin, BaseCache):
+    """
+    Backend su tabella (`LLMCacheEntry`), con scadenza TTL ed eviction LRU
+    basata sul campo `last_accessed_at`.
+    """
+
+    def __init__(self, ttl=None, max_entries=None, evict_interval=None):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.evict_interval = evict_interval
+
+    def lookup(self, prompt, llm_string):
+        from data.models import LLMCacheEntry
+
+        key = make_cache_key(prompt, llm_string)
+        entry = LLMCacheEntry.objects.filter(key=key).first()
+        if entry is None:
+            return None
+
+        now = timezone.now()
+        if self.ttl and (now - entry.created_at).total_seconds() > self.ttl:
+            entry.delete()
+            return None
+
+        LLMCacheEntry.objects.filter(pk=entry.pk).update(last_accessed_at=now)
+        return mark_cached(loads(entry.response))
+
+    def update(self, prompt, llm_string, return_val):
+        from data.models import LLMCacheEntry
+
+        now = timezone.now()
+        LLMCacheEntry.objects.update_or_create(
+            key=make_cache_key(prompt, llm_string),
+            defaults={
+                "model_name": extract_model_name(llm_string),
+                "response": dumps(return_val),
+                "created_at": now,
+                "last_accessed_at": now,
+            }
+        )
+        self.maybe_evict()
+
+    def evict(self):
+        """
+        Rimuove le voci scadute e, se si supera `max_entries`, quelle usate meno di recente.
+        """
+        from data.models import LLMCacheEntry
+
+        if self.ttl:
+            cutoff = timezone.now() - timedelta(seconds=self.ttl)
+            LLMCacheEntry.objects.filter(created_at__lt=cutoff).delete()
+
+        if self.max_entries:
+            overflow = LLMCacheEntry.objects.count() - self.max_entries
+            if overflow > 0:
+                oldest = LLMCacheEntry.objects.order_by("last_accessed_at").values_list("pk", flat=True)[:overflow]
+                LLMCacheEntry.objects.filter(pk__in=list(oldest)).delete()
+
+    def clear(self, **kwargs):
+        from data.models import LLMCacheEntry
+        LLMCacheEntry.objects.all().delete()
+
+
+class FileSystemLLMCache(PeriodicEvictionMixin, BaseCache):
+    """
+    Backend su filesystem: un file JSON per voce. L'ultimo accesso è la mtime del file,
+    usata per l'eviction LRU.
+    """
+
+    def __init__(self, location, ttl=None, max_entries=None, evict_interval=None):
+        self.location = Path(location)
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.evict_interval = evict_interval
+        self.location.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, key: str) -> Path:
+        return self.location / f"{key}.json"
+
+    def lookup(self, prompt, llm_string):
+        path = self._path(make_cache_key(prompt, llm_string))
+        try:
+            with open(path, encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        if self.ttl and time.time() - entry["created_at"] > self.ttl:
+            path.unlink(missing_ok=True)
+            return None
+
+        os.utime(path)
+        return mark_cached(loads(entry["response"]))
+
+    def update(self, prompt, llm_string, return_val):
+        path = self._path(make_cache_key(prompt, llm_string))
+        tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({
+                "model_name": extract_model_name(llm_string),
+                "created_at": time.time(),
+                "response": dumps(return_val),
+            }, f)
+        # Scrittura atomica: nessun lettore vede mai un file a metà
+        os.replace(tmp_path, path)
+        self.maybe_evict()
+
+    def evict(self):
+        """
+        Rimuove i file scaduti e, oltre `max_entries`, quelli con accesso meno recente.
+        """
+        files = []
+        now = time.time()
+        for path in self.location.glob("*.json"):
+            try:
+                mtime = path.stat().st_mtime
+            except OSError:
+                continue
+            files.append((mtime, path))
+
+        if self.max_entries and len(files) > self.max_entries:
+            files.sort()
+            for _, path in files[:len(files) - self.max_entries]:
+                path.unlink(missing_ok=True)
+
+        if self.ttl:
+            # La mtime viene aggiornata a ogni lettura, quindi qui si eliminano
+            # solo le voci né lette né scritte nell'intervallo di TTL
+            for mtime, path in files:
+                if now - mtime > self.ttl:
+                    path.unlink(missing_ok=True)
+
+    def clear(self, **kwargs):
+        for path in self.location.glob("*.json"):
+            path.unlink(missing_ok=True)
+
+
+def build_llm_cache() -> BaseCache | None:
+    """
+    Costruisce il backend di cache indicato in `settings.LLM_CACHE`.
+    Ritorna None se la cache è disattivata.
+    """
+    config = {**DEFAULT_LLM_CACHE, **getattr(settings, "LLM_CACHE", {})}
+    backend = config["BACKEND"]
+
+    if not backend:
+        return None
+    if backend == "database":
+        return DatabaseLLMCache(
+            ttl=config["TTL"], max_entries=config["MAX_ENTRIES"], evict_interval=config["EVICT_INTERVAL"]
+        )
+    if backend == "filesystem":
+        location = config["LOCATION"] or Path(settings.BASE_DIR) / "llm_cache"
+        return FileSystemLLMCache(
+            location, ttl=config["TTL"], max_entries=config["MAX_ENTRIES"], evict_interval=config["EVICT_INTERVAL"]
+        )
+
+    raise ValueError(f"Backend di cache LLM non supportato: {backend}")
+
+
+def configure_llm_cache():
+    """
+    Registra la cache come cache globale di LangChain, usata dai modelli a temperatura 0
+    (tranne che dalle catene in UNCACHED_CHAINS, vedi get_llm in data/utils.py).
+    """
+    set_llm_cache(build_llm_cache())
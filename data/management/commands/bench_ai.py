@@ -0,0 +1,81 @@
+import json
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+
+from data.benchmarks import throwaway_database, seed_benchmark_data, ai_endpoints, measure_request, summarize
+
+# Benchmark end-to-end degli endpoint AI, senza rete: usa il backend LLM fittizio (data/fake_llm.py)
+# con latenza simulata e un database di test creato e distrutto per l'occasione.
+# Per ogni endpoint riporta latenza p50/p99, query SQL e chiamate LLM per richiesta,
+# così che le regressioni di prestazioni siano misurabili anche in CI.
+#
+# Esempio:
+# python manage.py bench_ai --runs 20 --latency 0.2 --json risultati.json
+
+class Command(BaseCommand):
+    help = "Benchmark offline degli endpoint AI (p50/p99, query e chiamate LLM per richiesta)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=5, help='Richieste per endpoint')
+        parser.add_argument('--latency', type=float, default=0.05, help='Latenza simulata per chiamata LLM (s)')
+        parser.add_argument('--fixtures', type=str, help='File JSON di risposte registrate per il backend fittizio')
+        parser.add_argument('--llm-cache', action='store_true', help='Mantiene attive la cache LLM e quella delle foto (default: disattivate)')
+        parser.add_argument('--only', type=str, help='Esegue solo gli endpoint il cui nome contiene questo testo')
+        parser.add_argument('--json', type=str, help='Salva i risultati in un file JSON')
+
+    def handle(self, *args, **options):
+        from data.fake_llm import FakeChatModel
+        from data.utils import reset_llm_registry
+        from rest_framework.test import APIClient
+
+        llm_cache = {**settings.LLM_CACHE}
+        if not options['llm_cache']:
+            llm_cache['BACKEND'] = None
+
+        fake_llm = {'LATENCY': options['latency'], 'FIXTURES': options['fixtures']}
+        # Anche la cache percettiva delle foto evita la chiamata vision: segue la stessa opzione
+        food_image_cache = {**settings.FOOD_IMAGE_CACHE, 'ENABLED': options['llm_cache']}
+
+        results = {}
+        overrides = {
+            'LLM_BACKEND': 'fake',
+            'FAKE_LLM': fake_llm,
+            'LLM_CACHE': llm_cache,
+            'FOOD_IMAGE_CACHE': food_image_cache,
+        }
+        with override_settings(**overrides), throwaway_database():
+            reset_llm_registry()
+            try:
+                seed = seed_benchmark_data()
+                client = APIClient()
+                client.force_authenticate(seed["user"])
+
+                for endpoint in ai_endpoints(seed):
+                    if options['only'] and options['only'] not in endpoint["name"]:
+                        continue
+                    samples = [
+                        measure_request(client, endpoint, FakeChatModel.call_count)
+                        for _ in range(options['runs'])
+                    ]
+                    results[endpoint["name"]] = summarize(samples)
+                    self.report(endpoint["name"], results[endpoint["name"]])
+            finally:
+                reset_llm_registry()
+
+        if options['json']:
+            with open(options['json'], 'w', encoding='utf-8') as f:
+                json.dump(results, f, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Risultati salvati in {options['json']}"))
+
+    def report(self, name, result):
+        status = ",".join(str(code) for code in result["status"])
+        line = (
+            f"{name:<40} {status:>7}  p50 {result['p50_ms']:8.1f} ms  p99 {result['p99_ms']:8.1f} ms  "
+            f"query {result['queries']:>5}  LLM {result['llm_calls']:>3}"
+        )
+        if any(code >= 400 for code in result["status"]):
+            self.stdout.write(self.style.WARNING(line))
+        else:
+            self.stdout.write(line)
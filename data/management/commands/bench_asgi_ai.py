@@ -0,0 +1,164 @@
+import asyncio
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+from django.urls import reverse
+
+from data.benchmarks import throwaway_database, seed_benchmark_data, percentile
+
+# Capacità di richieste LLM concorrenti delle view AI servite da WSGI e da ASGI (SmartFit_Coach_BE/asgi.py).
+# Usa il backend LLM fittizio con latenza simulata e le applicazioni WSGI/ASGI del progetto chiamate in
+# memoria da httpx, con un database di test creato per l'occasione. Due modalità:
+#   wsgi   un worker WSGI con --wsgi-threads thread (come gunicorn --threads): ogni chiamata al modello
+#          occupa un thread, le altre richieste aspettano in coda
+#   asgi   le stesse view sotto ASGI: Django esegue ogni richiesta sync in un proprio thread, quindi
+#          le chiamate in volo non sono limitate da un pool fisso e il limite diventa la CPU
+# Per ogni livello di concorrenza invia N richieste insieme e misura tempo totale, richieste/s, latenza
+# e il massimo di thread attivi.
+#
+# Esempio:
+# python manage.py bench_asgi_ai --latency 2 --concurrency 1,10,50,200 --endpoint gymplan-note
+
+MODES = ["wsgi", "asgi"]
+
+ENDPOINTS = {
+    "weight-analysis": lambda seed: reverse("weight-analysis"),
+    "body-analysis": lambda seed: reverse("body-analysis"),
+    "gymplan-note": lambda seed: reverse("gymplan-generate-note", args=[seed["gym_plan_id"]]),
+    "suggested-weight": lambda seed: reverse("gymplanset-suggested-weight", args=[seed["exercise_id"]]),
+}
+
+
+class ThreadSampler(threading.Thread):
+    """
+    Massimo di thread attivi nel processo durante la prova.
+    """
+
+    def __init__(self):
+        super().__init__(daemon=True)
+        self.peak = threading.active_count()
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(0.01):
+            self.peak = max(self.peak, threading.active_count())
+
+    def stop(self) -> int:
+        self.stopped.set()
+        self.join()
+        return self.peak - 1
+
+
+async def fire_asgi(app, url: str, headers: dict, concurrency: int) -> list[tuple[int, float]]:
+    """
+    Invia `concurrency` richieste GET contemporanee all'applicazione ASGI.
+    """
+    import httpx
+
+    async def one(client):
+        started = time.perf_counter()
+        response = await client.get(url, headers=headers)
+        return response.status_code, (time.perf_counter() - started) * 1000
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://testserver", timeout=None) as client:
+        return await asyncio.gather(*(one(client) for _ in range(concurrency)))
+
+
+def fire_wsgi(app, url: str, headers: dict, concurrency: int, threads: int) -> list[tuple[int, float]]:
+    """
+    Invia `concurrency` richieste GET insieme a un worker WSGI che ne serve `threads` alla volta.
+    """
+    import httpx
+
+    client = httpx.Client(transport=httpx.WSGITransport(app=app), base_url="http://testserver", timeout=None)
+    submitted = time.perf_counter()
+
+    def one(_):
+        # La latenza include l'attesa in coda, come per un client davanti a gunicorn
+        response = client.get(url, headers=headers)
+        return response.status_code, (time.perf_counter() - submitted) * 1000
+
+    with client, ThreadPoolExecutor(max_workers=threads) as pool:
+        return list(pool.map(one, range(concurrency)))
+
+
+def measure(fire, concurrency: int) -> dict:
+    sampler = ThreadSampler()
+    sampler.start()
+    started = time.perf_counter()
+    results = fire()
+    wall = time.perf_counter() - started
+    peak_threads = sampler.stop()
+
+    timings = [ms for _, ms in results]
+    return {
+        "ok": sum(1 for code, _ in results if code == 200),
+        "wall": wall,
+        "throughput": concurrency / wall,
+        "p50": statistics.median(timings),
+        "p95": percentile(timings, 95),
+        "threads": peak_threads,
+    }
+
+
+class Command(BaseCommand):
+    help = "Richieste LLM concorrenti: view AI servite da WSGI contro ASGI (backend fittizio)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--latency', type=float, default=2, help='Latenza simulata per chiamata LLM (s)')
+        parser.add_argument('--concurrency', type=str, default='1,10,50,200',
+                            help='Livelli di concorrenza separati da virgola')
+        parser.add_argument('--endpoint', choices=list(ENDPOINTS), default='weight-analysis')
+        parser.add_argument('--mode', choices=[*MODES, 'all'], default='all')
+        parser.add_argument('--wsgi-threads', type=int, default=8,
+                            help='Thread del worker WSGI simulato (gunicorn --threads)')
+
+    def handle(self, *args, **options):
+        from django.core.asgi import get_asgi_application
+        from django.core.wsgi import get_wsgi_application
+        from rest_framework.authtoken.models import Token
+
+        from data.utils import reset_llm_registry
+
+        levels = [int(level) for level in options['concurrency'].split(',')]
+        overrides = {
+            'LLM_BACKEND': 'fake',
+            'FAKE_LLM': {'LATENCY': options['latency'], 'FIXTURES': None},
+            'LLM_CACHE': {**settings.LLM_CACHE, 'BACKEND': None},
+            'LLM_QUOTA': {**settings.LLM_QUOTA, 'DAILY_TOKENS': None},
+            'REQUEST_METRICS': {**settings.REQUEST_METRICS, 'LOG': False},
+        }
+
+        with override_settings(**overrides), throwaway_database(on_disk=True):
+            reset_llm_registry()
+            try:
+                seed = seed_benchmark_data(filler_food_items=50, filler_exercises=10)
+                headers = {"Authorization": f"Token {Token.objects.create(user=seed['user']).key}"}
+                url = ENDPOINTS[options['endpoint']](seed)
+                asgi_app, wsgi_app = get_asgi_application(), get_wsgi_application()
+                threads = options['wsgi_threads']
+                runners = {
+                    "wsgi": lambda level: fire_wsgi(wsgi_app, url, headers, level, threads),
+                    "asgi": lambda level: asyncio.run(fire_asgi(asgi_app, url, headers, level)),
+                }
+                modes = MODES if options['mode'] == 'all' else [options['mode']]
+
+                self.stdout.write(f"Endpoint '{options['endpoint']}' ({url}), latenza LLM {options['latency']}s")
+                for mode in modes:
+                    fire = runners[mode]
+                    self.stdout.write(self.style.MIGRATE_HEADING(f"{mode} ({threads} thread)" if mode == "wsgi" else mode))
+                    for level in levels:
+                        result = measure(lambda: fire(level), level)
+                        self.stdout.write(
+                            f"  {level:>4} concorrenti  {result['ok']:>4} ok  totale {result['wall']:7.2f}s  "
+                            f"{result['throughput']:7.1f} req/s  p50 {result['p50']:7.0f} ms  p95 {result['p95']:7.0f} ms  "
+                            f"thread {result['threads']}"
+                        )
+            finally:
+                reset_llm_registry()
@@ -0,0 +1,83 @@
+import io
+import json
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+from data.benchmarks import throwaway_database, seed_benchmark_data
+from data.renderers import ORJSONRenderer, ORJSONParser
+
+# Tempo di codifica e decodifica JSON della risposta di /gym-plan/me/ (schede con sezioni, esercizi e serie
+# annidati): JSONRenderer/JSONParser di DRF (modulo json) contro ORJSONRenderer/ORJSONParser (data/renderers.py).
+# La scheda di seed_benchmark_data viene clonata per --weeks settimane in un database di test; i dati del
+# serializer sono calcolati una volta sola, si misura solo la conversione in byte e ritorno.
+# Il comando fallisce se i due renderer producono JSON diversi.
+#
+# Esempio:
+# python manage.py bench_json_renderer --weeks 52 --runs 50
+
+
+def timed(function, runs: int) -> float:
+    """
+    Tempo mediano di `function` in millisecondi su `runs` esecuzioni.
+    """
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        function()
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings)
+
+
+class Command(BaseCommand):
+    help = "Codifica e decodifica JSON di /gym-plan/me/: modulo json di DRF contro orjson"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--weeks', type=int, default=12, help='Schede settimanali dell\'utente')
+        parser.add_argument('--runs', type=int, default=30, help='Esecuzioni per misura')
+
+    def handle(self, *args, **options):
+        from data.cloning import clone_gym_plan
+        from data.models import GymPlan
+        from data.serializers import GymPlanSerializer
+        from data.views import GymPlanListView
+
+        with throwaway_database():
+            seed = seed_benchmark_data(filler_food_items=50, filler_exercises=10)
+            if options['weeks'] > 1:
+                clone_gym_plan(GymPlan.objects.get(id=seed['gym_plan_id']), weeks=options['weeks'] - 1)
+
+            plans = GymPlanListView.queryset.filter(author=seed['user'])
+            data = GymPlanSerializer(plans, many=True).data
+
+        runs = options['runs']
+        context = {"indent": None}
+        stdlib_body = JSONRenderer().render(data, renderer_context=context)
+        orjson_body = ORJSONRenderer().render(data, renderer_context=context)
+        if json.loads(stdlib_body) != json.loads(orjson_body):
+            raise CommandError("ORJSONRenderer e JSONRenderer producono JSON diversi")
+
+        results = {
+            "render": (
+                timed(lambda: JSONRenderer().render(data, renderer_context=context), runs),
+                timed(lambda: ORJSONRenderer().render(data, renderer_context=context), runs),
+            ),
+            "parse": (
+                timed(lambda: JSONParser().parse(io.BytesIO(stdlib_body)), runs),
+                timed(lambda: ORJSONParser().parse(io.BytesIO(orjson_body)), runs),
+            ),
+        }
+
+        identical = "identico" if stdlib_body == orjson_body else "equivalente"
+        self.stdout.write(
+            f"{len(data)} schede, {len(orjson_body) / 1024:.0f} KB di JSON "
+            f"(output {identical} a JSONRenderer), mediana su {runs} esecuzioni"
+        )
+        for label, (stdlib_ms, orjson_ms) in results.items():
+            self.stdout.write(
+                f"  {label:<7} json {stdlib_ms:8.2f} ms   orjson {orjson_ms:8.2f} ms   "
+                f"{stdlib_ms / orjson_ms:5.1f}x"
+            )
@@ -0,0 +1,97 @@
+import statistics
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from data.benchmarks import throwaway_database, seed_time_series
+
+# Verifica dei piani di esecuzione delle letture per utente su serie storiche (pesate, misure, piani):
+# popola un database di test con più anni di storico per molti utenti, poi per ogni query usata dalle
+# view mostra il piano (EXPLAIN QUERY PLAN) e il tempo mediano. Una query che scansiona l'intera
+# tabella o ordina con un B-tree temporaneo è segnalata: con --fail-on-scan il comando fallisce,
+# così la CI si accorge se un indice composito (author, data) smette di essere usato.
+#
+# Esempio:
+# python manage.py bench_query_plans --users 100 --years 5 --fail-on-scan
+
+
+def plan_queries(user) -> dict:
+    """
+    Le letture per utente delle view e delle pipeline AI, con gli stessi filtri e ordinamenti.
+    """
+    from data.models import Weight, BodyMeasurement, FoodPlan, GymPlan
+
+    today = timezone.now().date()
+    last_month = today - timedelta(days=30)
+    return {
+        "weight-list": Weight.objects.filter(author=user).order_by('-date_recorded'),
+        "weight-analysis": Weight.objects.filter(author=user).order_by("date_recorded")
+            .values_list("date_recorded", "weight_value"),
+        "weight-last-30-days": Weight.objects.filter(author=user, date_recorded__gte=last_month)
+            .order_by("date_recorded"),
+        "body-measurement-list": BodyMeasurement.objects.filter(author=user).order_by('-date_recorded'),
+        "body-measurement-last-30-days": BodyMeasurement.objects.filter(author=user, date_recorded__gte=last_month)
+            .order_by("date_recorded"),
+        "food-plan-list": FoodPlan.objects.filter(author=user).order_by('-start_date'),
+        "food-plan-previous": FoodPlan.objects.filter(author=user, start_date__lt=today).order_by("-start_date")[:1],
+        "gym-plan-list": GymPlan.objects.filter(author=user).order_by('-start_date'),
+    }
+
+
+def explain(queryset) -> list[str]:
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f"EXPLAIN QUERY PLAN {sql}", params)
+        return [row[-1] for row in cursor.fetchall()]
+
+
+class Command(BaseCommand):
+    help = "Piani di esecuzione e tempi delle query per utente su uno storico pluriennale"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=50, help='Utenti da generare')
+        parser.add_argument('--years', type=int, default=3, help='Anni di storico per utente')
+        parser.add_argument('--runs', type=int, default=20, help='Esecuzioni per query')
+        parser.add_argument('--fail-on-scan', action='store_true',
+                            help='Errore se una query scansiona la tabella o ordina con un B-tree temporaneo')
+
+    def handle(self, *args, **options):
+        problems = []
+
+        with throwaway_database():
+            started = time.monotonic()
+            users = seed_time_series(options['users'], options['years'])
+            with connection.cursor() as cursor:
+                cursor.execute("ANALYZE")
+            self.stdout.write(f"Dati generati in {time.monotonic() - started:.1f}s "
+                              f"({options['users']} utenti, {options['years']} anni).")
+
+            user = users[len(users) // 2]
+            for name, queryset in plan_queries(user).items():
+                plan = explain(queryset)
+
+                timings = []
+                for _ in range(options['runs']):
+                    started = time.perf_counter()
+                    rows = len(list(queryset.all()))
+                    timings.append((time.perf_counter() - started) * 1000)
+
+                full_scan = any(step.startswith("SCAN") for step in plan)
+                temp_sort = any("TEMP B-TREE" in step for step in plan)
+                if full_scan or temp_sort:
+                    problems.append(name)
+
+                status = "COVERING" if any("COVERING INDEX" in step for step in plan) else "INDEX"
+                if full_scan or temp_sort:
+                    status = "SCAN" if full_scan else "SORT"
+
+                line = f"{name:<32} {status:<9} {rows:>6} righe  {statistics.median(timings):7.2f} ms"
+                self.stdout.write(self.style.WARNING(line) if status in ("SCAN", "SORT") else line)
+                for step in plan:
+                    self.stdout.write(f"    {step}")
+
+        if problems and options['fail_on_scan']:
+            raise CommandError(f"Query senza indice adeguato: {', '.join(problems)}")
@@ -0,0 +1,165 @@
+import multiprocessing
+import random
+import shutil
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, close_old_connections, connection, connections, transaction
+
+from data.benchmarks import percentile, seed_benchmark_data
+
+# Confronta il profilo SQLite di settings.py (WAL, pragma, transazioni IMMEDIATE, connessioni persistenti)
+# con la configurazione predefinita di Django, con più processi che leggono e scrivono sullo stesso file
+# come farebbero più worker gunicorn. Ogni worker alterna letture (storico pesi, piano alimentare) e
+# scritture (un alimento segnato come mangiato) e chiude ogni "richiesta" come fa Django (close_old_connections);
+# un processo a parte ripete il reset di reset_eaten, come il cron che gira mentre gli utenti usano l'app.
+# Il database viene creato in una cartella temporanea: il db.sqlite3 del progetto non viene toccato.
+#
+# Esempio:
+# python manage.py bench_sqlite_concurrency --workers 4 --seconds 10 --write-ratio 0.3
+
+PROFILES = {
+    # Configurazione predefinita: rollback journal, transazioni DEFERRED, una connessione per richiesta
+    "default": {"OPTIONS": {}, "CONN_MAX_AGE": 0},
+    "tuned": {
+        "OPTIONS": settings.DATABASES["default"].get("OPTIONS", {}),
+        "CONN_MAX_AGE": settings.DATABASES["default"].get("CONN_MAX_AGE", 0),
+    },
+}
+
+
+def use_database(name, profile: dict):
+    connections.close_all()
+    connection.settings_dict.update(NAME=str(name), OPTIONS=dict(profile["OPTIONS"]),
+                                    CONN_MAX_AGE=profile["CONN_MAX_AGE"])
+
+
+def read_request(user_id: int, plan_id: int):
+    from data.models import Weight, FoodPlanItem
+
+    list(Weight.objects.filter(author_id=user_id).order_by('-date_recorded')[:100])
+    list(FoodPlanItem.objects.filter(food_plan_id=plan_id).select_related('food_item', 'food_section'))
+
+
+def write_request(item_ids: list[int]):
+    from data.models import FoodPlanItem
+
+    # Lettura e scrittura nella stessa transazione, come l'aggiornamento di un alimento dalla API
+    with transaction.atomic():
+        item = FoodPlanItem.objects.get(pk=random.choice(item_ids))
+        item.eaten = not item.eaten
+        item.save(update_fields=['eaten'])
+
+
+def reset_request():
+    from data.models import FoodPlanItem
+
+    FoodPlanItem.objects.update(eaten=False)
+
+
+def worker(name, profile, seed, kind, deadline, write_ratio, results):
+    use_database(name, profile)
+    random.seed()
+    stats = {"kind": kind, "reads": [], "writes": [], "errors": 0}
+
+    while time.monotonic() < deadline:
+        if kind == "cron":
+            operation, action = "writes", reset_request
+            time.sleep(0.05)
+        elif random.random() < write_ratio:
+            operation, action = "writes", lambda: write_request(seed["item_ids"])
+        else:
+            operation, action = "reads", lambda: read_request(seed["user_id"], seed["plan_id"])
+
+        started = time.perf_counter()
+        try:
+            action()
+            stats[operation].append((time.perf_counter() - started) * 1000)
+        except OperationalError:
+            # "database is locked": la richiesta fallirebbe con un 500
+            stats["errors"] += 1
+        close_old_connections()
+
+    connections.close_all()
+    results.put(stats)
+
+
+class Command(BaseCommand):
+    help = "Throughput in lettura e scrittura di SQLite con più processi: profilo predefinito e profilo di settings.py"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4, help='Processi che simulano i worker gunicorn')
+        parser.add_argument('--seconds', type=float, default=5, help='Durata di ogni prova')
+        parser.add_argument('--write-ratio', type=float, default=0.2, help='Frazione di richieste in scrittura')
+        parser.add_argument('--profile', choices=[*PROFILES, "both"], default="both")
+        parser.add_argument('--no-cron', action='store_true', help='Senza il processo che simula reset_eaten')
+
+    def handle(self, *args, **options):
+        from data.models import FoodPlanItem
+
+        original = {key: connection.settings_dict[key] for key in ("NAME", "OPTIONS", "CONN_MAX_AGE")}
+        directory = Path(tempfile.mkdtemp(prefix="bench-sqlite-"))
+        template = directory / "template.sqlite3"
+
+        try:
+            use_database(template, PROFILES["default"])
+            call_command('migrate', verbosity=0)
+            data = seed_benchmark_data(filler_food_items=50, filler_exercises=10)
+            seed = {
+                "user_id": data["user"].pk,
+                "plan_id": FoodPlanItem.objects.latest('food_plan_id').food_plan_id,
+                "item_ids": list(FoodPlanItem.objects.values_list('pk', flat=True)),
+            }
+            connections.close_all()
+
+            profiles = PROFILES if options['profile'] == "both" else {options['profile']: PROFILES[options['profile']]}
+            for profile_name, profile in profiles.items():
+                name = directory / f"{profile_name}.sqlite3"
+                shutil.copyfile(template, name)
+                self.report(profile_name, self.run_profile(name, profile, seed, options), options)
+        finally:
+            connections.close_all()
+            connection.settings_dict.update(original)
+            shutil.rmtree(directory, ignore_errors=True)
+
+    def run_profile(self, name, profile, seed, options) -> list[dict]:
+        context = multiprocessing.get_context("fork")
+        results = context.Queue()
+        deadline = time.monotonic() + options['seconds']
+
+        kinds = ["request"] * options['workers'] + ([] if options['no_cron'] else ["cron"])
+        processes = [
+            context.Process(target=worker, args=(name, profile, seed, kind, deadline, options['write_ratio'], results))
+            for kind in kinds
+        ]
+        for process in processes:
+            process.start()
+        stats = [results.get() for _ in processes]
+        for process in processes:
+            process.join()
+        return stats
+
+    def report(self, profile_name, stats, options):
+        requests = [s for s in stats if s["kind"] == "request"]
+        reads = [ms for s in requests for ms in s["reads"]]
+        writes = [ms for s in requests for ms in s["writes"]]
+        errors = sum(s["errors"] for s in requests)
+        cron = next((s for s in stats if s["kind"] == "cron"), None)
+        seconds = options['seconds']
+
+        self.stdout.write(self.style.MIGRATE_HEADING(f"Profilo '{profile_name}' ({options['workers']} worker, {seconds:g}s)"))
+        for label, timings in (("letture", reads), ("scritture", writes)):
+            if timings:
+                self.stdout.write(
+                    f"  {label:<10} {len(timings) / seconds:8.0f} req/s   "
+                    f"p50 {statistics.median(timings):6.1f} ms   p95 {percentile(timings, 95):7.1f} ms"
+                )
+        line = f"  errori     {errors} richieste fallite con 'database is locked'"
+        self.stdout.write(self.style.ERROR(line) if errors else line)
+        if cron is not None:
+            self.stdout.write(f"  reset_eaten {len(cron['writes'])} completati, {cron['errors']} falliti")
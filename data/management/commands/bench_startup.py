@@ -0,0 +1,79 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+# Misura il tempo di avvio di Django (django.setup()) in interpreti Python nuovi, come accade
+# a ogni comando di gestione, migrazione o esecuzione dei test. Con --with-ai misura anche
+# il costo spostato al primo utilizzo dell'IA (costruzione di tutti i client e le catene).
+#
+# Esempio:
+# python manage.py bench_startup --runs 10 --with-ai
+
+PROBE = r"""
+import json, os, sys, time
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", sys.argv[1])
+started = time.perf_counter()
+
+import django
+django.setup()
+
+result = {
+    "setup_ms": (time.perf_counter() - started) * 1000,
+    "modules": len(sys.modules),
+    "langchain_loaded": "langchain_core" in sys.modules,
+}
+
+if sys.argv[2] == "1":
+    started = time.perf_counter()
+    from data import utils
+    for name in utils.CHAINS:
+        utils.get_chain(name)
+    result["first_ai_use_ms"] = (time.perf_counter() - started) * 1000
+
+print(json.dumps(result))
+"""
+
+
+class Command(BaseCommand):
+    help = "Misura il tempo di django.setup() (ed eventualmente del primo utilizzo dell'IA) in processi nuovi"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=5, help='Numero di processi da avviare')
+        parser.add_argument('--with-ai', action='store_true', help='Misura anche la costruzione di client e catene LLM')
+
+    def handle(self, *args, **options):
+        env = dict(os.environ)
+        # La costruzione dei client richiede una chiave, anche fittizia (nessuna chiamata viene eseguita)
+        env.setdefault("OPENAI_API_KEY", "sk-bench")
+
+        samples = []
+        for _ in range(options['runs']):
+            completed = subprocess.run(
+                [sys.executable, "-c", PROBE, os.environ.get("DJANGO_SETTINGS_MODULE", settings.SETTINGS_MODULE),
+                 "1" if options['with_ai'] else "0"],
+                cwd=settings.BASE_DIR,
+                env=env,
+                capture_output=True,
+                text=True,
+                check=True
+            )
+            samples.append(json.loads(completed.stdout.strip().splitlines()[-1]))
+
+        self.report("django.setup()", [s["setup_ms"] for s in samples])
+        if options['with_ai']:
+            self.report("primo utilizzo IA", [s["first_ai_use_ms"] for s in samples])
+
+        self.stdout.write(f"moduli caricati dopo setup: {samples[-1]['modules']}")
+        self.stdout.write(f"LangChain caricato durante setup: {'sì' if samples[-1]['langchain_loaded'] else 'no'}")
+
+    def report(self, label, values):
+        self.stdout.write(self.style.SUCCESS(
+            f"{label}: min {min(values):.0f} ms, mediana {statistics.median(values):.0f} ms, "
+            f"max {max(values):.0f} ms ({len(values)} esecuzioni)"
+        ))
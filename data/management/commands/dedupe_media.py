@@ -0,0 +1,106 @@
+import os
+import time
+
+from django.apps import apps
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from data.images import refresh_media_variants
+from data.storage import (
+    CONTENT_ADDRESSED_RE, REFERENCE_FIELDS, content_addressed_name, content_hash, content_storage, is_field_default
+)
+
+# Porta i file già caricati sullo storage per contenuto (data/storage.py): ogni file referenziato
+# viene rinominato con lo sha256 del contenuto e le righe che lo usano vengono aggiornate.
+# I file con lo stesso contenuto (es. 0.jpg, 0_018Bt2I.jpg) confluiscono in un'unica copia,
+# le altre vengono eliminate. Le varianti degli upload passano alla cartella dell'hash (data/images.py),
+# una sola copia per contenuto. I file non referenziati da nessuna riga non vengono toccati.
+#
+# Esempio:
+# python manage.py dedupe_media --dry-run
+
+
+class Command(BaseCommand):
+    help = "Deduplica i file media referenziati spostandoli sullo storage per contenuto"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Mostra cosa verrebbe fatto senza modificare nulla')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        dry_run = options['dry_run']
+        stats = {"files": 0, "moved": 0, "duplicates": 0, "missing": 0, "freed": 0}
+        targets = set()
+
+        for old_name in self.referenced_names():
+            if is_field_default(old_name) or CONTENT_ADDRESSED_RE.search(old_name):
+                continue
+            if not content_storage.exists(old_name):
+                stats["missing"] += 1
+                self.stderr.write(self.style.WARNING(f"File mancante: {old_name}"))
+                continue
+
+            stats["files"] += 1
+            with content_storage.open(old_name) as f:
+                target = content_addressed_name(old_name, content_hash(f))
+
+            duplicate = target in targets or content_storage.exists(target)
+            targets.add(target)
+            if duplicate:
+                stats["duplicates"] += 1
+                stats["freed"] += content_storage.size(old_name)
+            else:
+                stats["moved"] += 1
+
+            if dry_run:
+                continue
+
+            if not duplicate:
+                os.makedirs(os.path.dirname(content_storage.path(target)), exist_ok=True)
+                os.replace(content_storage.path(old_name), content_storage.path(target))
+
+            with transaction.atomic():
+                self.update_references(old_name, target)
+
+            if duplicate:
+                # Nessuna riga usa più il vecchio nome: lo storage lo elimina
+                content_storage.delete(old_name)
+
+            self.refresh_variants(target)
+
+        prefix = "[dry-run] " if dry_run else ""
+        self.stdout.write(self.style.SUCCESS(
+            f"{prefix}{stats['files']} file esaminati: {stats['moved']} spostati, "
+            f"{stats['duplicates']} duplicati eliminati ({stats['freed'] / 1024 / 1024:.1f} MB liberati), "
+            f"{stats['missing']} mancanti, in {time.monotonic() - started:.1f}s."
+        ))
+
+    def referenced_names(self) -> list[str]:
+        """
+        Tutti i nomi di file usati dai campi di REFERENCE_FIELDS, senza ripetizioni.
+        """
+        names = set()
+        for model_label, field_name in REFERENCE_FIELDS:
+            model = apps.get_model(model_label)
+            names.update(
+                model.objects.exclude(**{field_name: ""}).exclude(**{f"{field_name}__isnull": True})
+                .values_list(field_name, flat=True)
+            )
+        return sorted(names)
+
+    def update_references(self, old_name: str, new_name: str):
+        for model_label, field_name in REFERENCE_FIELDS:
+            apps.get_model(model_label).objects.filter(**{field_name: old_name}).update(**{field_name: new_name})
+
+    def refresh_variants(self, name: str):
+        """
+        Porta le varianti (data/images.py) degli upload di `name` sul percorso per contenuto: gli upload
+        confluiti nello stesso file condividono un'unica copia e le varianti precedenti vengono eliminate.
+        """
+        from data.models import GymMediaUpload
+
+        for upload in GymMediaUpload.objects.filter(file=name).order_by("pk"):
+            try:
+                refresh_media_variants(upload)
+            except Exception as e:
+                self.stderr.write(self.style.WARNING(f"Varianti non generate per '{name}': {e}"))
@@ -0,0 +1,63 @@
+import time
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+
+from data.images import refresh_media_variants, variants_are_current
+from data.models import GymMediaUpload
+
+# Genera le versioni ridotte (JPEG e WebP, vedi settings.GYM_MEDIA_VARIANTS) per le immagini
+# degli esercizi caricate prima dell'introduzione delle varianti, o dopo un cambio delle dimensioni.
+# Le varianti ancora nella vecchia cartella per upload vengono spostate in quella dell'hash del file.
+# Gli upload già aggiornati vengono saltati, quindi il comando si può interrompere e rilanciare.
+#
+# Esempio:
+# python manage.py generate_media_variants --force
+
+class Command(BaseCommand):
+    help = "Genera le varianti ridotte delle immagini degli esercizi (GymMediaUpload)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Rigenera anche le varianti già aggiornate')
+        parser.add_argument('--chunk-size', type=int, default=200, help='Upload letti dal database per volta')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        generated = skipped = errors = 0
+        original_bytes = thumb_bytes = 0
+
+        for upload in GymMediaUpload.objects.order_by('id').iterator(chunk_size=options['chunk_size']):
+            if not options['force'] and variants_are_current(upload):
+                skipped += 1
+                continue
+
+            try:
+                if not refresh_media_variants(upload, force=options['force']):
+                    skipped += 1
+                    continue
+            except Exception as e:
+                errors += 1
+                self.stderr.write(self.style.ERROR(f"Errore su '{upload.file.name}': {e}"))
+                continue
+
+            generated += 1
+            original_bytes += default_storage.size(upload.file.name)
+            thumb_bytes += default_storage.size(upload.variants["sizes"][smallest_size(upload)]["webp"])
+
+            if generated % 100 == 0:
+                self.stdout.write(f"{generated} upload elaborati...")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Varianti generate per {generated} upload ({skipped} già aggiornati o senza file, {errors} errori) "
+            f"in {time.monotonic() - started:.1f}s."
+        ))
+        if generated:
+            self.stdout.write(
+                f"Originali: {original_bytes / 1024:.0f} KB, miniature WebP: {thumb_bytes / 1024:.0f} KB "
+                f"(media {original_bytes / generated / 1024:.1f} KB → {thumb_bytes / generated / 1024:.1f} KB)."
+            )
+
+
+def smallest_size(upload) -> str:
+    sizes = upload.variants["sizes"]
+    return min(sizes, key=lambda name: sizes[name]["width"] * sizes[name]["height"])
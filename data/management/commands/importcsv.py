@@ -1,46 +1,158 @@
 import csv
+import json
+import os
+import time
+from itertools import islice
+
 from django.core.management.base import BaseCommand
 from django.contrib.auth import get_user_model
+from django.db import transaction
+
 from data.models import FoodItem
+from data.search import index_food_items
 
 User = get_user_model()
 
+# Import in streaming: il CSV viene letto a blocchi di --chunk-size righe e ogni blocco
+# costa poche query (autori mancanti, duplicati già presenti, bulk_create, indice di ricerca)
+# dentro una sola transazione. Dopo ogni blocco confermato viene aggiornato un file di checkpoint:
+# se l'import si interrompe, `--resume` riparte dalla prima riga non ancora importata.
+#
+# Esempio:
+# python manage.py importcsv alimenti.csv --chunk-size 5000 --resume
+
 class Command(BaseCommand):
     help = "Importa alimenti da un file CSV nella tabella FoodItem"
 
     def add_arguments(self, parser):
         parser.add_argument('csv_path', type=str, help='Percorso del file CSV')
+        parser.add_argument('--chunk-size', type=int, default=2000, help='Righe elaborate per transazione')
+        parser.add_argument('--checkpoint', type=str, help='File di checkpoint (default: <csv_path>.checkpoint)')
+        parser.add_argument('--resume', action='store_true', help="Riprende dall'ultimo blocco confermato")
 
     def handle(self, *args, **options):
         path = options['csv_path']
-        count = 0
-        errors = 0
+        chunk_size = max(1, options['chunk_size'])
+        checkpoint_path = options['checkpoint'] or f"{path}.checkpoint"
+
+        self.known_authors = set()
+        self.missing_authors = set()
+
+        progress = {"rows": 0, "created": 0, "duplicates": 0, "errors": 0}
+        if options['resume'] and os.path.exists(checkpoint_path):
+            with open(checkpoint_path, encoding='utf-8') as f:
+                progress.update(json.load(f))
+            self.stdout.write(f"Ripresa dalla riga {progress['rows'] + 1}.")
+
+        started = time.monotonic()
+        rows_at_start = progress["rows"]
 
         with open(path, newline='', encoding='utf-8') as csvfile:
             reader = csv.DictReader(csvfile)
-            for row in reader:
-                try:
-                    author = User.objects.get(id=row['author_id'])
-
-                    item, created = FoodItem.objects.get_or_create(
-                        name=row['name'].strip(),
-                        barcode=row['barcode'].strip(),
-                        defaults={
-                            'brand': row['brand'].strip(),
-                            'kcal_per_100g': float(row['kcal_per_100g']),
-                            'protein_per_100g': float(row['protein_per_100g']),
-                            'carbs_per_100g': float(row['carbs_per_100g']),
-                            'sugars_per_100g': float(row['sugars_per_100g']),
-                            'fats_per_100g': float(row['fats_per_100g']),
-                            'saturated_fats_per_100g': float(row['saturated_fats_per_100g']),
-                            'fiber_per_100g': float(row['fiber_per_100g']),
-                            'author': author,
-                        }
-                    )
-                    if created:
-                        count += 1
-                except Exception as e:
-                    errors += 1
-                    self.stderr.write(self.style.ERROR(f"Errore su '{row['name']}': {e}"))
-
-        self.stdout.write(self.style.SUCCESS(f"Import completato: {count} elementi creati, {errors} errori."))
\ No newline at end of file
+
+            # Salta le righe già importate in un'esecuzione precedente
+            for _ in islice(reader, progress["rows"]):
+                pass
+
+            while True:
+                rows = list(islice(reader, chunk_size))
+                if not rows:
+                    break
+
+                created, duplicates, errors = self.import_chunk(rows)
+                progress["rows"] += len(rows)
+                progress["created"] += created
+                progress["duplicates"] += duplicates
+                progress["errors"] += errors
+                self.save_checkpoint(checkpoint_path, progress)
+
+                elapsed = time.monotonic() - started
+                throughput = (progress["rows"] - rows_at_start) / elapsed if elapsed else 0
+                self.stdout.write(
+                    f"Righe {progress['rows']}: {progress['created']} creati, {progress['duplicates']} duplicati, "
+                    f"{progress['errors']} errori ({throughput:.0f} righe/s)"
+                )
+
+        if os.path.exists(checkpoint_path):
+            os.remove(checkpoint_path)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Import completato: {progress['created']} elementi creati, {progress['errors']} errori "
+            f"in {time.monotonic() - started:.1f}s."
+        ))
+
+    def import_chunk(self, rows: list[dict]) -> tuple[int, int, int]:
+        """
+        Importa un blocco di righe: ritorna (creati, duplicati, errori).
+        """
+        errors = 0
+        candidates = {}
+
+        self.load_authors({row.get('author_id') for row in rows})
+
+        for row in rows:
+            try:
+                author_id = int(row['author_id'])
+                if author_id not in self.known_authors:
+                    raise User.DoesNotExist("User matching query does not exist.")
+
+                key = (row['name'].strip(), row['barcode'].strip())
+                if key in candidates:
+                    continue
+
+                candidates[key] = FoodItem(
+                    name=key[0],
+                    barcode=key[1],
+                    brand=row['brand'].strip(),
+                    kcal_per_100g=float(row['kcal_per_100g']),
+                    protein_per_100g=float(row['protein_per_100g']),
+                    carbs_per_100g=float(row['carbs_per_100g']),
+                    sugars_per_100g=float(row['sugars_per_100g']),
+                    fats_per_100g=float(row['fats_per_100g']),
+                    saturated_fats_per_100g=float(row['saturated_fats_per_100g']),
+                    fiber_per_100g=float(row['fiber_per_100g']),
+                    author_id=author_id,
+                )
+            except Exception as e:
+                errors += 1
+                self.stderr.write(self.style.ERROR(f"Errore su '{row.get('name')}': {e}"))
+
+        with transaction.atomic():
+            # Una sola query per scartare le coppie (name, barcode) già presenti nel database
+            existing = set(
+                FoodItem.objects
+                .filter(name__in={name for name, _ in candidates}, barcode__in={barcode for _, barcode in candidates})
+                .values_list('name', 'barcode')
+            )
+            new_items = [item for key, item in candidates.items() if key not in existing]
+
+            # bulk_create non invia post_save: l'indice di ricerca va aggiornato esplicitamente
+            created = FoodItem.objects.bulk_create(new_items)
+            index_food_items(created)
+
+        return len(created), len(rows) - errors - len(created), errors
+
+    def load_authors(self, author_ids: set):
+        """
+        Verifica con una sola query gli autori non ancora visti; il risultato resta in cache per i blocchi successivi.
+        """
+        ids = set()
+        for author_id in author_ids:
+            try:
+                ids.add(int(author_id))
+            except (TypeError, ValueError):
+                continue
+
+        unknown = ids - self.known_authors - self.missing_authors
+        if not unknown:
+            return
+
+        found = set(User.objects.filter(id__in=unknown).values_list('id', flat=True))
+        self.known_authors |= found
+        self.missing_authors |= unknown - found
+
+    def save_checkpoint(self, checkpoint_path: str, progress: dict):
+        tmp_path = f"{checkpoint_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(progress, f)
+        os.replace(tmp_path, checkpoint_path)
@@ -0,0 +1,22 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from data.search import rebuild_food_index
+
+# Ricostruisce da zero l'indice di ricerca degli alimenti (FoodItemToken).
+# Normalmente l'indice è aggiornato dai segnali: serve dopo import massivi
+# o modifiche fatte direttamente sul database.
+
+class Command(BaseCommand):
+    help = "Ricostruisce l'indice di ricerca full-text degli alimenti"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=2000, help='Alimenti elaborati per blocco')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        total = rebuild_food_index(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Indicizzati {total} alimenti in {time.monotonic() - started:.1f}s.'
+        ))
@@ -0,0 +1,50 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from data.jobs import claim_next_job, run_job, requeue_stale_jobs
+
+# Worker della coda dei job AI (vedi data/jobs.py).
+# Esegue le pipeline accodate dalle view con `?async=1`, fuori dai worker WSGI.
+
+# COMANDI DA INVIARE
+# python manage.py run_ai_jobs                # resta in ascolto
+# python manage.py run_ai_jobs --once         # svuota la coda ed esce (es. da cron)
+
+class Command(BaseCommand):
+    help = 'Esegue i job AI in coda (AIJob) fuori dal thread della richiesta HTTP'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Esegue i job in coda ed esce')
+        parser.add_argument('--sleep', type=float, default=1.0, help='Attesa in secondi quando la coda è vuota')
+        parser.add_argument('--stale-after', type=int, default=900,
+                            help='Rimette in coda i job "running" da più di N secondi (worker interrotti)')
+
+    def handle(self, *args, **options):
+        requeued = requeue_stale_jobs(options['stale_after'])
+        if requeued:
+            self.stdout.write(self.style.WARNING(f'Rimessi in coda {requeued} job interrotti.'))
+
+        processed = 0
+
+        while True:
+            close_old_connections()
+            job = claim_next_job()
+
+            if job is None:
+                if options['once']:
+                    break
+                time.sleep(options['sleep'])
+                continue
+
+            started = time.monotonic()
+            job = run_job(job)
+            processed += 1
+
+            style = self.style.SUCCESS if job.status == job.STATUS_DONE else self.style.ERROR
+            self.stdout.write(style(
+                f'Job #{job.id} ({job.kind}) {job.status} in {time.monotonic() - started:.1f}s'
+            ))
+
+        self.stdout.write(self.style.SUCCESS(f'Eseguiti {processed} job.'))
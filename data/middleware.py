@@ -0,0 +1,321 @@
+import json
+import logging
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+
+from langchain_core.callbacks.base import BaseCallbackHandler
+
+logger = logging.getLogger("data.metrics")
+
+
+# ======== METRICHE PER RICHIESTA ========
+# Per ogni richiesta vengono raccolti: numero e durata delle query SQL, chiamate LLM per catena
+# (durata, token, risposte servite dalla cache) e tempo totale. In DEBUG le metriche sono inviate
+# nell'header `Server-Timing` (visibile nel pannello Network del browser), altrimenti scritte come
+# riga JSON sul logger "data.metrics": aggregando i log si vede quali endpoint costano di più.
+#
+# Lo stato della richiesta corrente vive in una ContextVar: le query vengono contate da un
+# execute_wrapper sulle connessioni, le chiamate LLM da un callback LangChain registrato su tutti
+# i modelli (data/utils.py::get_llm). I thread del pool LLM (run_concurrently) ricevono una copia
+# del contesto, quindi le loro chiamate finiscono nelle metriche della richiesta che le ha avviate.
+
+class RequestMetrics:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.db_queries = 0
+        self.db_time = 0.0
+        self.chains = {}
+        self._llm_runs = {}
+        self._lock = threading.Lock()
+
+    def record_query(self, duration: float):
+        with self._lock:
+            self.db_queries += 1
+            self.db_time += duration
+
+    def start_llm_run(self, run_id, chain: str, model_name: str = ""):
+        with self._lock:
+            self._llm_runs[run_id] = (chain, model_name, time.perf_counter())
+
+    def end_llm_run(self, run_id, usage: dict, cached: bool):
+        with self._lock:
+            chain, model_name, started = self._llm_runs.pop(run_id, ("llm", "", time.perf_counter()))
+            stats = self.chains.setdefault(chain, {
+                "model": model_name, "calls": 0, "cached": 0, "ms": 0.0, "input_tokens": 0, "output_tokens": 0
+            })
+            stats["calls"] += 1
+            stats["cached"] += int(cached)
+            stats["ms"] += (time.perf_counter() - started) * 1000
+            stats["input_tokens"] += usage.get("input_tokens", 0)
+            stats["output_tokens"] += usage.get("output_tokens", 0)
+
+    def totals(self) -> dict:
+        with self._lock:
+            chains = {name: {**stats, "ms": round(stats["ms"], 1)} for name, stats in self.chains.items()}
+        return {
+            "duration_ms": round((time.perf_counter() - self.started) * 1000, 1),
+            "db_queries": self.db_queries,
+            "db_ms": round(self.db_time * 1000, 1),
+            "llm_calls": sum(stats["calls"] for stats in chains.values()),
+            "llm_cached": sum(stats["cached"] for stats in chains.values()),
+            "llm_ms": round(sum(stats["ms"] for stats in chains.values()), 1),
+            "input_tokens": sum(stats["input_tokens"] for stats in chains.values()),
+            "output_tokens": sum(stats["output_tokens"] for stats in chains.values()),
+            "chains": chains,
+        }
+
+
+current_metrics: ContextVar[RequestMetrics | None] = ContextVar("current_metrics", default=None)
+
+
+def _record_query(execute, sql, params, many, context):
+    metrics = current_metrics.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.record_query(time.perf_counter() - started)
+
+
+@contextmanager
+def collect_metrics():
+    """
+    Raccoglie le metriche del blocco di codice (fuori da una richiesta HTTP, es. un job del worker).
+    """
+    metrics = RequestMetrics()
+    token = current_metrics.set(metrics)
+    try:
+        with track_queries():
+            yield metrics
+    finally:
+        current_metrics.reset(token)
+
+
+@contextmanager
+def track_queries():
+    """
+    Conta le query eseguite nel thread corrente (su tutti i database configurati) nelle metriche
+    della richiesta attiva. Le connessioni sono per-thread: i thread del pool LLM lo attivano da sé.
+    """
+    with ExitStack() as stack:
+        for alias in connections:
+            stack.enter_context(connections[alias].execute_wrapper(_record_query))
+        yield
+
+
+class LLMMetricsCallback(BaseCallbackHandler):
+    """
+    Callback LangChain che registra durata, token e cache hit di ogni chiamata al modello.
+    La catena è letta dai metadata impostati in get_chain (`{"chain": nome}`).
+    """
+    def on_chat_model_start(self, serialized, messages, *, run_id, metadata=None, **kwargs):
+        self._start(run_id, metadata)
+
+    def on_llm_start(self, serialized, prompts, *, run_id, metadata=None, **kwargs):
+        self._start(run_id, metadata)
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        metrics = current_metrics.get()
+        if metrics is None:
+            return
+
+        usage = {}
+        cached = False
+        for generations in response.generations:
+            for generation in generations:
+                message = getattr(generation, "message", None)
+                if message is None:
+                    continue
+                for key, value in (getattr(message, "usage_metadata", None) or {}).items():
+                    if key in ("input_tokens", "output_tokens"):
+                        usage[key] = usage.get(key, 0) + value
+                cached = cached or bool(message.response_metadata.get("cached"))
+
+        # Una risposta dalla cache non consuma token del provider
+        metrics.end_llm_run(run_id, {} if cached else usage, cached)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        metrics = current_metrics.get()
+        if metrics is not None:
+            metrics.end_llm_run(run_id, {}, False)
+
+    def _start(self, run_id, metadata):
+        metrics = current_metrics.get()
+        if metrics is not None:
+            metadata = metadata or {}
+            metrics.start_llm_run(run_id, metadata.get("chain", "llm"), metadata.get("ls_model_name", ""))
+
+
+llm_metrics_callback = LLMMetricsCallback()
+
+
+def server_timing(totals: dict) -> str:
+    """
+    Valore dell'header Server-Timing: totale, database, LLM e una voce per ogni catena usata.
+    """
+    entries = [
+        f'total;dur={totals["duration_ms"]}',
+        f'db;dur={totals["db_ms"]};desc="{totals["db_queries"]} query"',
+        f'llm;dur={totals["llm_ms"]};desc="{totals["llm_calls"]} chiamate, '
+        f'{totals["input_tokens"]}+{totals["output_tokens"]} token"',
+    ]
+    for name, stats in totals["chains"].items():
+        entries.append(f'llm-{name};dur={stats["ms"]};desc="{stats["calls"]} chiamate, {stats["cached"]} in cache"')
+    return ", ".join(entries)
+
+
+class RequestMetricsMiddleware:
+    """
+    Va messo in cima a MIDDLEWARE per misurare l'intera richiesta.
+    Configurazione in settings.REQUEST_METRICS: "SERVER_TIMING" (header) e "LOG" (riga JSON).
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        # Sotto ASGI resta async: Django non deve adattarlo con un passaggio in thread in più
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+
+        with collect_metrics() as metrics:
+            response = self.get_response(request)
+
+        if getattr(response, "streaming", False):
+            # Le risposte SSE generano il testo (e chiamano il modello) dopo l'uscita dal middleware:
+            # le metriche vengono chiuse solo quando lo stream è stato consumato
+            response.streaming_content = self.finish_after_stream(
+                request, response, metrics, response.streaming_content
+            )
+            if settings.REQUEST_METRICS["SERVER_TIMING"]:
+                response["Server-Timing"] = server_timing(metrics.totals())
+            return response
+
+        if settings.REQUEST_METRICS["SERVER_TIMING"]:
+            response["Server-Timing"] = server_timing(metrics.totals())
+        self.finish(request, response, metrics)
+        return response
+
+    async def __acall__(self, request):
+        with collect_metrics() as metrics:
+            response = await self.get_response(request)
+
+        if getattr(response, "streaming", False):
+            content = response.streaming_content
+            if response.is_async:
+                response.streaming_content = self.afinish_after_stream(request, response, metrics, content)
+            else:
+                response.streaming_content = self.finish_after_stream(request, response, metrics, content)
+            if settings.REQUEST_METRICS["SERVER_TIMING"]:
+                response["Server-Timing"] = server_timing(metrics.totals())
+            return response
+
+        if settings.REQUEST_METRICS["SERVER_TIMING"]:
+            response["Server-Timing"] = server_timing(metrics.totals())
+        await sync_to_async(self.finish)(request, response, metrics)
+        return response
+
+    def finish_after_stream(self, request, response, metrics, content):
+        token = current_metrics.set(metrics)
+        try:
+            with track_queries():
+                yield from content
+        finally:
+            current_metrics.reset(token)
+            self.finish(request, response, metrics)
+
+    async def afinish_after_stream(self, request, response, metrics, content):
+        token = current_metrics.set(metrics)
+        try:
+            with track_queries():
+                async for chunk in content:
+                    yield chunk
+        finally:
+            current_metrics.reset(token)
+            await sync_to_async(self.finish)(request, response, metrics)
+
+    def finish(self, request, response, metrics):
+        """
+        Registra i token consumati dall'utente (data/usage.py) e scrive la riga di log.
+        """
+        totals = metrics.totals()
+
+        user = getattr(request, "user", None)
+        if totals["chains"] and user is not None and user.is_authenticated:
+            from data.usage import record_llm_usage
+            record_llm_usage(user, totals["chains"])
+
+        if not settings.REQUEST_METRICS["LOG"]:
+            return
+        logger.info(json.dumps({
+            "method": request.method,
+            "path": request.path,
+            "status": response.status_code,
+            **totals,
+        }, ensure_ascii=False))
+
+
+# ======== ROUTING DEL DATABASE ========
+class DatabaseRoutingMiddleware:
+    """
+    Ogni richiesta parte con uno stato di routing pulito (data/routers.py). Se la view ha scritto,
+    l'utente resta sul primario per qualche secondo: le sue letture successive non finiscono su una
+    replica che non ha ancora ricevuto le modifiche. Va messo in fondo a MIDDLEWARE, così contano
+    solo le scritture della view (non quelle della sessione o delle metriche).
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        from data.routers import is_pinned_to_primary, routing_scope
+
+        if self.async_mode:
+            return self.__acall__(request)
+
+        with routing_scope():
+            response = self.get_response(request)
+            wrote = is_pinned_to_primary()
+
+        self.remember_write(request, wrote)
+        return response
+
+    async def __acall__(self, request):
+        from data.routers import is_pinned_to_primary, routing_scope
+
+        # Lo stato di routing è in ContextVar: le chiamate all'ORM con sync_to_async lo ricevono dal contesto
+        with routing_scope():
+            response = await self.get_response(request)
+            wrote = is_pinned_to_primary()
+
+        if wrote:
+            await sync_to_async(self.remember_write)(request, wrote)
+        return response
+
+    def remember_write(self, request, wrote: bool):
+        from data.routers import remember_write
+
+        user = getattr(request, "user", None)
+        if wrote and user is not None and user.is_authenticated:
+            remember_write(user)
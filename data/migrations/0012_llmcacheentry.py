@@ -0,0 +1,24 @@
+# Generated by Django 5.2 on 2026-10-17 02:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('data', '0011_detailsaccount_goal_targets_explanation_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LLMCacheEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=64, unique=True)),
+                ('model_name', models.CharField(blank=True, max_length=100)),
+                ('response', models.TextField(help_text='Generazioni LangChain serializzate')),
+                ('created_at', models.DateTimeField()),
+                ('last_accessed_at', models.DateTimeField(db_index=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2 on 2026-10-17 02:36
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('data', '0012_llmcacheentry'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AIJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(help_text='Pipeline da eseguire, vedi data/jobs.py', max_length=50)),
+                ('status', models.CharField(choices=[('pending', 'In coda'), ('running', 'In esecuzione'), ('done', 'Completato'), ('failed', 'Fallito')], db_index=True, default='pending', max_length=10)),
+                ('payload', models.JSONField(blank=True, default=dict)),
+                ('attachment', models.FileField(blank=True, null=True, upload_to='ai_jobs/')),
+                ('result', models.JSONField(blank=True, null=True)),
+                ('result_status', models.PositiveIntegerField(blank=True, help_text='Status HTTP equivalente del risultato', null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('author', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
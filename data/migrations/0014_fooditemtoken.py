@@ -0,0 +1,51 @@
+# Generated by Django 5.2 on 2026-10-17 02:37
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+from data.search import tokenize, NAME_WEIGHT, BRAND_WEIGHT
+
+
+def build_index(apps, schema_editor):
+    # Indicizza gli alimenti già presenti, a blocchi
+    FoodItem = apps.get_model('data', 'FoodItem')
+    FoodItemToken = apps.get_model('data', 'FoodItemToken')
+
+    last_pk = 0
+    while True:
+        batch = list(FoodItem.objects.filter(pk__gt=last_pk).order_by('pk').only('pk', 'name', 'brand')[:2000])
+        if not batch:
+            break
+        rows = []
+        for item in batch:
+            weights = {}
+            for token in tokenize(item.name):
+                weights[token] = weights.get(token, 0) + NAME_WEIGHT
+            for token in tokenize(item.brand or ''):
+                weights[token] = weights.get(token, 0) + BRAND_WEIGHT
+            rows.extend(FoodItemToken(token=t, food_item_id=item.pk, weight=w) for t, w in weights.items())
+        FoodItemToken.objects.bulk_create(rows, batch_size=2000)
+        last_pk = batch[-1].pk
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('data', '0013_aijob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FoodItemToken',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('token', models.CharField(max_length=64)),
+                ('weight', models.PositiveSmallIntegerField(default=1)),
+                ('food_item', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_tokens', to='data.fooditem')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['token', 'food_item', 'weight'], name='fooditemtoken_lookup_idx')],
+            },
+        ),
+        migrations.RunPython(build_index, migrations.RunPython.noop),
+    ]
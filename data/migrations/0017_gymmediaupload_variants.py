@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-17 02:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('data', '0016_foodimageanalysis'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='gymmediaupload',
+            name='variants',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2 on 2026-10-17 03:00
+
+import data.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('data', '0017_gymmediaupload_variants'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='detailsaccount',
+            name='profile_picture',
+            field=models.ImageField(blank=True, default='profile_pics/default.jpg', null=True, storage=data.storage.ContentAddressedStorage(), upload_to='profile_pics/'),
+        ),
+        migrations.AlterField(
+            model_name='gymmediaupload',
+            name='file',
+            field=models.FileField(storage=data.storage.ContentAddressedStorage(), upload_to='gym_media/'),
+        ),
+    ]
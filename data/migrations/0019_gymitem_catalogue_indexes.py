@@ -0,0 +1,43 @@
+# Generated by Django 5.2 on 2026-10-17 03:01
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('data', '0018_content_addressed_media'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='gymitem',
+            index=models.Index(fields=['name', 'id'], name='gymitem_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='gymitem',
+            index=models.Index(fields=['primary_muscle', 'name', 'id'], name='gymitem_muscle_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='gymitem',
+            index=models.Index(fields=['equipment', 'name', 'id'], name='gymitem_equipment_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='gymitem',
+            index=models.Index(fields=['level', 'name', 'id'], name='gymitem_level_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='gymitem',
+            index=models.Index(fields=['category', 'name', 'id'], name='gymitem_category_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='gymitem',
+            index=models.Index(fields=['mechanic', 'name', 'id'], name='gymitem_mechanic_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='gymitem',
+            index=models.Index(fields=['force', 'name', 'id'], name='gymitem_force_name_idx'),
+        ),
+    ]
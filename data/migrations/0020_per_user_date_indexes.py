@@ -0,0 +1,31 @@
+# Generated by Django 5.2 on 2026-10-17 03:02
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('data', '0019_gymitem_catalogue_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='bodymeasurement',
+            index=models.Index(fields=['author', 'date_recorded'], name='bodymeas_author_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='foodplan',
+            index=models.Index(fields=['author', 'start_date'], name='foodplan_author_start_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='gymplan',
+            index=models.Index(fields=['author', 'start_date'], name='gymplan_author_start_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='weight',
+            index=models.Index(fields=['author', 'date_recorded', 'weight_value'], name='weight_author_date_idx'),
+        ),
+    ]
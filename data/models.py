@@ -1,10 +1,10 @@
 from django.core.exceptions import ValidationError
 from django.utils import timezone
-from django.db import models
+from django.db import models, transaction
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.contrib.auth import get_user_model
 
-from data.utils import infer_goal_target, explain_goal_target  # importa la funzione dalla fase 2
+from data.storage import content_storage
 
 class DetailsAccount(models.Model):
     author = models.ForeignKey(get_user_model(), on_delete=models.CASCADE)
@@ -14,6 +14,7 @@ class DetailsAccount(models.Model):
 
     profile_picture = models.ImageField(
         upload_to='profile_pics/',
+        storage=content_storage,
         null=True,
         blank=True,
         default='profile_pics/default.jpg'
@@ -41,25 +42,39 @@ class DetailsAccount(models.Model):
         help_text="Spiegazione generata dall'IA sul perché è stato selezionato questo obiettivo."
     )
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Valore letto dal DB: permette a save() di capire se l'obiettivo è cambiato senza rileggere la riga
+        if 'goal_description' in field_names:
+            instance._loaded_goal_description = values[field_names.index('goal_description')]
+        return instance
+
     def save(self, *args, **kwargs):
-        if self.goal_description:
-            try:
-                if self.pk:
-                    previous = DetailsAccount.objects.get(pk=self.pk)
-                    if previous.goal_description != self.goal_description:
-                        inferred = infer_goal_target(self.goal_description)
-                        if inferred in dict(self.GOAL_CHOICES):
-                            self.goal_targets = inferred
-                        self.goal_targets_explanation = explain_goal_target(self.goal_description, self.goal_targets)
-                else:
-                    inferred = infer_goal_target(self.goal_description)
-                    if inferred in dict(self.GOAL_CHOICES):
-                        self.goal_targets = inferred
-                    self.goal_targets_explanation = explain_goal_target(self.goal_description, self.goal_targets)
-            except Exception as e:
-                print(f"Errore durante l'inferenza del goal: {e}")
+        goal_changed = bool(self.goal_description) and (
+            self._state.adding or self.goal_description != getattr(self, '_loaded_goal_description', None)
+        )
         super().save(*args, **kwargs)
 
+        if goal_changed:
+            self._loaded_goal_description = self.goal_description
+            # La classificazione dell'obiettivo (due chiamate LLM) non blocca più il salvataggio:
+            # a transazione confermata viene accodato un job che compila goal_targets e
+            # goal_targets_explanation in un secondo momento (vedi data/pipelines.py)
+            goal_description = self.goal_description
+            transaction.on_commit(lambda: self.enqueue_goal_inference(goal_description))
+
+    def enqueue_goal_inference(self, goal_description: str):
+        from data.jobs import enqueue_job
+
+        try:
+            enqueue_job(self.author, "goal_inference", {
+                "details_id": self.pk,
+                "goal_description": goal_description
+            })
+        except Exception as e:
+            print(f"Errore durante l'accodamento dell'inferenza del goal: {e}")
+
     def __str__(self):
         return f"{self.author.first_name} {self.author.last_name} ({self.author.username})"
 
@@ -69,6 +84,12 @@ class Weight(models.Model):
     date_recorded = models.DateField()
     weight_value = models.FloatField(validators=[MinValueValidator(0)])
 
+    class Meta:
+        indexes = [
+            # Storico per utente ordinato per data; include il valore, quindi le analisi leggono solo l'indice
+            models.Index(fields=['author', 'date_recorded', 'weight_value'], name='weight_author_date_idx'),
+        ]
+
     def __str__(self):
         return f"[{self.author}] {self.weight_value}kg - {self.date_recorded}"
 
@@ -90,6 +111,11 @@ class BodyMeasurement(models.Model):
     # Data della misurazione
     date_recorded = models.DateField(default=timezone.now)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['author', 'date_recorded'], name='bodymeas_author_date_idx'),
+        ]
+
     def __str__(self):
         return f"Misure per {self.author.username} - {self.date_recorded}"
 
@@ -123,6 +149,21 @@ class FoodItem(models.Model):
         return self.name
 
 
+class FoodItemToken(models.Model):
+    # Indice invertito su nome e brand degli alimenti, vedi data/search.py
+    token = models.CharField(max_length=64)
+    food_item = models.ForeignKey(FoodItem, on_delete=models.CASCADE, related_name='search_tokens')
+    weight = models.PositiveSmallIntegerField(default=1)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['token', 'food_item', 'weight'], name='fooditemtoken_lookup_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.token} → {self.food_item_id} ({self.weight})"
+
+
 class FoodPlan(models.Model):
     author = models.ForeignKey(get_user_model(), on_delete=models.CASCADE)
 
@@ -134,6 +175,11 @@ class FoodPlan(models.Model):
     max_carbs = models.FloatField()
     max_fats = models.FloatField()
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['author', 'start_date'], name='foodplan_author_start_idx'),
+        ]
+
     def __str__(self):
         return f"Food Plan {self.start_date} - {self.end_date}"
 
@@ -160,6 +206,11 @@ class GymPlan(models.Model):
     end_date = models.DateField()
     note = models.TextField(blank=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['author', 'start_date'], name='gymplan_author_start_idx'),
+        ]
+
     def clean(self):
         super().clean()
 
@@ -237,8 +288,10 @@ class GymPlanSetDetail(models.Model):
             plan_item.delete()
 
 class GymMediaUpload(models.Model):
-    file = models.FileField(upload_to='gym_media/')
+    file = models.FileField(upload_to='gym_media/', storage=content_storage)
     uploaded_at = models.DateTimeField(auto_now_add=True)
+    # Versioni ridotte (JPEG e WebP) generate da data/images.py: {"source": file, "sizes": {nome: {...}}}
+    variants = models.JSONField(default=dict, blank=True)
 
 class GymItem(models.Model):
     author = models.ForeignKey(get_user_model(), on_delete=models.CASCADE)
@@ -319,6 +372,20 @@ class GymItem(models.Model):
 
     image_urls = models.ManyToManyField(GymMediaUpload)
 
+    # Campi filtrabili del catalogo (GymItemListView): ogni indice copre filtro + ordinamento per nome
+    CATALOGUE_FILTERS = ['primary_muscle', 'equipment', 'level', 'category', 'mechanic', 'force']
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['name', 'id'], name='gymitem_name_idx'),
+            models.Index(fields=['primary_muscle', 'name', 'id'], name='gymitem_muscle_name_idx'),
+            models.Index(fields=['equipment', 'name', 'id'], name='gymitem_equipment_name_idx'),
+            models.Index(fields=['level', 'name', 'id'], name='gymitem_level_name_idx'),
+            models.Index(fields=['category', 'name', 'id'], name='gymitem_category_name_idx'),
+            models.Index(fields=['mechanic', 'name', 'id'], name='gymitem_mechanic_name_idx'),
+            models.Index(fields=['force', 'name', 'id'], name='gymitem_force_name_idx'),
+        ]
+
     def __str__(self):
         return self.name
 
@@ -368,4 +435,108 @@ class GymPlanItem(models.Model):
         ordering = ['order']
 
     def __str__(self):
-        return f"{self.notes}"
\ No newline at end of file
+        return f"{self.notes}"
+
+class LLMCacheEntry(models.Model):
+    # Chiave sha256 di (configurazione modello + prompt renderizzato), vedi data/llm_cache.py
+    key = models.CharField(max_length=64, unique=True)
+    model_name = models.CharField(max_length=100, blank=True)
+    response = models.TextField(help_text="Generazioni LangChain serializzate")
+    created_at = models.DateTimeField()
+    last_accessed_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f"[{self.model_name}] {self.key[:12]} - {self.created_at}"
+
+
+class AIJob(models.Model):
+    author = models.ForeignKey(get_user_model(), on_delete=models.CASCADE)
+
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'In coda'),
+        (STATUS_RUNNING, 'In esecuzione'),
+        (STATUS_DONE, 'Completato'),
+        (STATUS_FAILED, 'Fallito'),
+    ]
+
+    kind = models.CharField(max_length=50, help_text="Pipeline da eseguire, vedi data/jobs.py")
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING, db_index=True)
+    payload = models.JSONField(default=dict, blank=True)
+    attachment = models.FileField(upload_to='ai_jobs/', null=True, blank=True)
+
+    result = models.JSONField(null=True, blank=True)
+    result_status = models.PositiveIntegerField(null=True, blank=True, help_text="Status HTTP equivalente del risultato")
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"[{self.author}] Job {self.kind} #{self.pk} - {self.status}"
+
+
+class LLMUsage(models.Model):
+    # Registro dei consumi LLM: una riga per catena e modello usati da una richiesta o da un job, vedi data/usage.py
+    author = models.ForeignKey(get_user_model(), on_delete=models.CASCADE, related_name='llm_usage')
+    chain = models.CharField(max_length=100)
+    model_name = models.CharField(max_length=100, blank=True)
+    calls = models.PositiveIntegerField(default=0)
+    cached_calls = models.PositiveIntegerField(default=0, help_text="Chiamate servite dalla cache LLM (senza token)")
+    input_tokens = models.PositiveIntegerField(default=0)
+    output_tokens = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return f"[{self.author}] {self.chain} - {self.input_tokens}+{self.output_tokens} token"
+
+
+class LLMUsageDaily(models.Model):
+    # Totali giornalieri per utente, catena e modello: aggiornati insieme al registro, letti dal controllo quota
+    author = models.ForeignKey(get_user_model(), on_delete=models.CASCADE, related_name='llm_usage_daily')
+    day = models.DateField()
+    chain = models.CharField(max_length=100)
+    model_name = models.CharField(max_length=100, blank=True)
+    calls = models.PositiveIntegerField(default=0)
+    cached_calls = models.PositiveIntegerField(default=0)
+    input_tokens = models.PositiveIntegerField(default=0)
+    output_tokens = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['author', 'day', 'chain', 'model_name'], name='llmusagedaily_unique'),
+        ]
+
+    def __str__(self):
+        return f"[{self.author}] {self.day} {self.chain} - {self.input_tokens + self.output_tokens} token"
+
+
+class LLMQuota(models.Model):
+    # Quota giornaliera personalizzata; senza riga vale settings.LLM_QUOTA["DAILY_TOKENS"]
+    author = models.OneToOneField(get_user_model(), on_delete=models.CASCADE, related_name='llm_quota')
+    daily_tokens = models.PositiveIntegerField(null=True, blank=True, help_text="Vuoto = nessun limite")
+
+    def __str__(self):
+        return f"[{self.author}] {self.daily_tokens or 'illimitata'}"
+
+
+class FoodImageAnalysis(models.Model):
+    # Analisi vision già eseguite, indicizzate per hash percettivo (dHash) della foto, vedi data/images.py
+    author = models.ForeignKey(get_user_model(), on_delete=models.CASCADE, related_name='food_image_analyses')
+    image_hash = models.CharField(max_length=16, help_text="dHash a 64 bit in esadecimale")
+    meals = models.JSONField(help_text="Pasti riconosciuti dal modello vision")
+    hits = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_used_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['author', 'created_at'], name='foodimageanalysis_recent_idx'),
+        ]
+
+    def __str__(self):
+        return f"[{self.author}] {self.image_hash} - {len(self.meals)} pasti"
@@ -0,0 +1,19 @@
+from rest_framework.pagination import CursorPagination
+
+
+class GymItemCursorPagination(CursorPagination):
+    """
+    Paginazione a cursore del catalogo esercizi: ogni pagina costa una query sull'indice (name, id),
+    indipendentemente da quanto si è avanti nella lista (nessun OFFSET).
+    """
+    ordering = ('name', 'id')
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+
+    def paginate_queryset(self, queryset, request, view=None):
+        # Opt-in: senza `cursor` né `page_size` la risposta resta la lista completa usata dai client esistenti
+        if self.cursor_query_param not in request.query_params and \
+                self.page_size_query_param not in request.query_params:
+            return None
+        return super().paginate_queryset(queryset, request, view)
@@ -0,0 +1,302 @@
+import json
+from datetime import timedelta
+
+from django.utils import timezone
+from django.utils.timezone import now
+
+from .models import (
+    DetailsAccount, Weight, BodyMeasurement, FoodPlan, FoodPlanItem, FoodPlanSection, GymItem, GymPlan,
+    GymPlanItem, GymPlanSection, GymPlanSetDetail
+)
+from data.utils import match_meals_to_food_items, generate_food_analysis_from_image_file, \
+    generate_food_plan_from_context, get_chain, parse_exercise_name, run_concurrently, infer_goal_target, \
+    explain_goal_target
+
+
+# ======== PIPELINE AI ========
+# Le pipeline che richiedono più chiamate LLM in sequenza vivono qui, fuori dalle view,
+# così possono essere eseguite sia nella richiesta HTTP sia dal worker della coda (data/jobs.py).
+# Ogni pipeline riceve (user, payload, attachment) e ritorna (dati_risposta, status_http).
+
+
+def run_food_image_parsing(user, payload, attachment):
+    from data.images import compute_dhash, find_cached_food_analysis, store_food_analysis
+
+    # Foto già analizzata (o quasi identica): si riusano i pasti riconosciuti senza chiamare il modello vision
+    image_hash = compute_dhash(attachment)
+    meals = find_cached_food_analysis(user, image_hash)
+    if meals is None:
+        meals = generate_food_analysis_from_image_file(attachment)
+        store_food_analysis(user, image_hash, meals)
+
+    food_items = match_meals_to_food_items(meals, user)
+    enriched = []
+
+    for meal, food_item in zip(meals, food_items):
+        if not food_item:
+            continue
+
+        enriched.append({
+            "meal": meal.get("meal"),
+            "keywords": meal.get("keywords", []),
+            "quantity": meal.get("quantity"),
+            "matched_food_item": {
+                "id": food_item.id,
+                "name": food_item.name
+            }
+        })
+
+    return {"meals": enriched}, 200
+
+
+DEFAULT_SECTION_TIMES = {
+    "colazione": 8,
+    "spuntino": 10,
+    "pranzo": 13,
+    "merenda": 16,
+    "cena": 20,
+    "pre nanna": 22
+}
+
+def get_or_create_section(section_name: str, section_keywords: list, user, existing_sections: list) -> FoodPlanSection:
+    def normalize(text): return text.strip().lower()
+    normalized_name = normalize(section_name)
+    keyword_set = set(normalize(k) for k in section_keywords + [normalized_name])
+
+    for s in existing_sections:
+        if normalize(s.name) in keyword_set:
+            return s
+        expected_time = DEFAULT_SECTION_TIMES.get(normalized_name)
+        if expected_time and abs(s.start_time - expected_time) <= 1:
+            return s
+
+    start_time = DEFAULT_SECTION_TIMES.get(normalized_name, 12)
+    new_section = FoodPlanSection.objects.create(
+        author=user,
+        name=section_name.strip().capitalize(),
+        start_time=start_time
+    )
+    existing_sections.append(new_section)
+    return new_section
+
+
+def run_food_plan_generation(user, payload, attachment=None):
+    try:
+        food_plan = FoodPlan.objects.get(id=payload["plan_id"], author=user)
+    except FoodPlan.DoesNotExist:
+        return {"error": "Piano alimentare non trovato"}, 404
+
+    try:
+        details = DetailsAccount.objects.get(author=user)
+    except DetailsAccount.DoesNotExist:
+        return {"error": "Profilo utente non trovato"}, 404
+
+    # Dati ultimi 30 giorni
+    today = timezone.now().date()
+    last_month = today - timedelta(days=30)
+
+    weights = Weight.objects.filter(author=user, date_recorded__gte=last_month)
+    weights_data = [(w.date_recorded.strftime("%Y-%m-%d"), w.weight_value) for w in weights]
+
+    measurements = BodyMeasurement.objects.filter(author=user, date_recorded__gte=last_month)
+    measurements_data = []
+    for m in measurements:
+        row = {"date": m.date_recorded.strftime("%Y-%m-%d")}
+        for f in ["chest", "waist", "hips", "arm", "leg"]:
+            value = getattr(m, f, None)
+            if value is not None:
+                row[f] = value
+        measurements_data.append(row)
+
+    # Macro attuali del piano
+    prev_macros = {
+        "max_protein": round(food_plan.max_protein),
+        "max_carbs": round(food_plan.max_carbs),
+        "max_fats": round(food_plan.max_fats),
+        "max_kcal": round(food_plan.max_kcal)
+    }
+
+    # ⚙️ Chiamata AI
+    ai_meals = generate_food_plan_from_context(
+        details.goal_targets,
+        weights_data,
+        measurements_data,
+        prev_macros
+    )
+
+    if not ai_meals:
+        return {"error": "Piano non generato"}, 500
+
+    # 🔁 Applica piano
+    # Rimuove eventuali item esistenti
+    FoodPlanItem.objects.filter(food_plan=food_plan).delete()
+    sections = list(FoodPlanSection.objects.filter(author=user))
+
+    created_items = []
+
+    # Alimenti: un'unica chiamata IA per abbinare tutti i pasti della giornata
+    food_items = match_meals_to_food_items(ai_meals, user)
+
+    for meal, food_item in zip(ai_meals, food_items):
+        if not food_item:
+            continue
+
+        meal_name = meal["meal"]
+        quantity = meal["quantity"]
+        section_name = meal.get("section", "")
+        section_keywords = meal.get("section_keywords", [])
+
+        # Sezione
+        section = get_or_create_section(section_name, section_keywords, user, sections)
+
+        # Item
+        FoodPlanItem.objects.create(
+            eaten=False,
+            food_plan=food_plan,
+            food_item=food_item,
+            food_section=section,
+            quantity_in_grams=quantity
+        )
+
+        created_items.append({
+            "meal": meal_name,
+            "food_item": food_item.name,
+            "quantity": quantity,
+            "section": section.name
+        })
+
+    return {
+        "message": "Piano generato con successo",
+        "created_items": created_items
+    }, 200
+
+
+def run_gym_plan_generation(user, payload, attachment=None):
+    try:
+        plan = GymPlan.objects.get(id=payload["plan_id"], author=user)
+    except GymPlan.DoesNotExist:
+        return {"error": "GymPlan non trovata."}, 404
+
+    days = payload.get("days")
+
+    if not days or not isinstance(days, list):
+        return {"error": "Devi specificare una lista di giorni (es. ['lun', 'mer', 'ven'])."}, 400
+
+    # === Recupera obiettivo dell'utente ===
+    details = DetailsAccount.objects.filter(author=user).first()
+    goal = details.goal_targets if details and details.goal_targets else "Non specificato"
+
+    # === Recupera pesi e misurazioni ultimi 30 giorni ===
+    cutoff_date = now().date() - timedelta(days=30)
+
+    weights = list(Weight.objects.filter(author=user, date_recorded__gte=cutoff_date)
+                   .values_list("weight_value", flat=True))
+    weight_str = ", ".join(str(w) for w in weights) or "Nessun dato"
+
+    measurements = BodyMeasurement.objects.filter(
+        author=user,
+        date_recorded__gte=cutoff_date
+    )
+
+    measurement_str = "; ".join(
+        f"{m.date_recorded}: {round(m.average_measurement(), 2)} cm"
+        for m in measurements
+        if m.average_measurement() is not None
+    ) or "Nessun dato"
+
+    db_ex_names = list(GymItem.objects.values_list("name", flat=True))
+
+    result = get_chain("generate_plan").invoke({
+        "days": ", ".join(days),
+        "goal": goal,
+        "body_measurements": measurement_str,
+        "weights": weight_str
+    })
+
+    # La risposta del modello è solo dato: mai valutarla come codice (la pipeline gira anche nel worker dei job)
+    content = getattr(result, "content", "{}").strip()
+    try:
+        day_plan = json.loads(content)
+    except json.JSONDecodeError:
+        day_plan = None
+    if not isinstance(day_plan, dict):
+        return {"error": "Il modello ha restituito un JSON non valido."}, 502
+
+    existing_sections = {
+        section.day: section
+        for section in GymPlanSection.objects.filter(gym_plan=plan)
+    }
+
+    day_plan = {
+        day_code: esercizi
+        for day_code, esercizi in day_plan.items()
+        if day_code in existing_sections
+    }
+
+    # Normalizzazione dei nomi di tutti gli esercizi in parallelo (chiamate LLM indipendenti)
+    exercise_names = [ex["name"] for esercizi in day_plan.values() for ex in esercizi]
+    parsed_names = iter(run_concurrently(parse_exercise_name, [(name, db_ex_names) for name in exercise_names]))
+
+    for day_code, esercizi in day_plan.items():
+        section = existing_sections[day_code]
+
+        for ex in esercizi:
+            parsed_name = next(parsed_names)
+            try:
+                gym_item = GymItem.objects.get(name__iexact=parsed_name)
+            except GymItem.DoesNotExist:
+                continue
+
+            item = GymPlanItem.objects.create(
+                section=section,
+                order=ex.get("order", 0),
+                intensity_techniques=[ex.get("technique")] if ex.get("technique") else [],
+                notes=ex.get("notes", "")
+            )
+
+            total_sets = ex.get("sets", 3)
+            for set_index in range(1, total_sets + 1):
+                GymPlanSetDetail.objects.create(
+                    plan_item=item,
+                    exercise=gym_item,
+                    order=set_index,
+                    set_number=set_index,
+                    prescribed_reps_1=ex.get("prescribed_reps_1", 8),
+                    prescribed_reps_2=ex.get("prescribed_reps_2", 8),
+                    tempo_fcr=ex.get("tempo_fcr", "2-0-2"),
+                    rir=ex.get("rir", 2),
+                    weight=ex.get("weight", 0),
+                    rest_seconds=ex.get("rest_seconds", 90)
+                )
+
+    return {"status": "Scheda generata correttamente."}, 201
+
+
+def run_goal_inference(user, payload, attachment=None):
+    """
+    Classifica l'obiettivo del profilo (goal_targets) e ne genera la spiegazione, fuori dal salvataggio
+    di DetailsAccount. Se nel frattempo l'utente ha cambiato di nuovo obiettivo, il job non scrive nulla:
+    l'UPDATE è condizionato al goal_description da cui è partita l'inferenza.
+    """
+    goal_description = payload["goal_description"]
+
+    details = DetailsAccount.objects.filter(pk=payload["details_id"]).only("goal_description", "goal_targets").first()
+    if not details or details.goal_description != goal_description:
+        return {"status": "Obiettivo modificato nel frattempo, inferenza ignorata."}, 200
+
+    goal_targets = details.goal_targets
+    inferred = infer_goal_target(goal_description)
+    if inferred in dict(DetailsAccount.GOAL_CHOICES):
+        goal_targets = inferred
+    explanation = explain_goal_target(goal_description, goal_targets)
+
+    updated = DetailsAccount.objects.filter(pk=details.pk, goal_description=goal_description).update(
+        goal_targets=goal_targets,
+        goal_targets_explanation=explanation
+    )
+
+    return {
+        "goal_targets": goal_targets,
+        "goal_targets_explanation": explanation,
+        "updated": bool(updated)
+    }, 200
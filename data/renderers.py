@@ -0,0 +1,105 @@
+import datetime
+import decimal
+import uuid
+
+import orjson
+from django.db.models.query import QuerySet
+from django.utils.encoding import force_str
+from django.utils.functional import Promise
+from rest_framework import fields
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.settings import api_settings
+
+
+# ======== JSON CON ORJSON ========
+# Renderer e parser JSON di DRF (REST_FRAMEWORK in settings.py) basati su orjson invece del modulo json:
+# le risposte grandi (es. /gym-plan/me/ con sezioni, esercizi e serie annidati) si codificano in una
+# frazione del tempo. L'output è quello di JSONRenderer: compatto, UTF-8 senza escape, U+2028/U+2029
+# con escape. Date, orari e Decimal passati alla Response senza serializer seguono le impostazioni di
+# REST_FRAMEWORK (DATE_FORMAT, DATETIME_FORMAT, COERCE_DECIMAL_TO_STRING) come i campi dei serializer.
+# Verifica con: python manage.py bench_json_renderer
+
+ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+
+
+def default(obj):
+    """
+    Tipi che orjson non serializza da sé, convertiti come fa il JSONEncoder di DRF.
+    """
+    if isinstance(obj, datetime.datetime):
+        return fields.DateTimeField().to_representation(obj)
+    if isinstance(obj, datetime.date):
+        return fields.DateField().to_representation(obj)
+    if isinstance(obj, datetime.time):
+        return fields.TimeField().to_representation(obj)
+    if isinstance(obj, decimal.Decimal):
+        return str(obj) if api_settings.COERCE_DECIMAL_TO_STRING else float(obj)
+    if isinstance(obj, datetime.timedelta):
+        return str(obj.total_seconds())
+    if isinstance(obj, Promise):
+        return force_str(obj)
+    if isinstance(obj, uuid.UUID):
+        return str(obj)
+    if isinstance(obj, QuerySet):
+        return list(obj)
+    if isinstance(obj, bytes):
+        return obj.decode()
+    if hasattr(obj, 'tolist'):
+        return obj.tolist()
+    if hasattr(obj, '__getitem__') and hasattr(obj, 'keys'):
+        return dict(obj)
+    if hasattr(obj, '__iter__'):
+        return list(obj)
+    raise TypeError(f"Oggetto di tipo {type(obj).__name__} non serializzabile in JSON")
+
+
+class ORJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer con orjson. orjson indenta solo di 2 spazi: qualsiasi `indent` richiesto
+    (header Accept o Browsable API) produce un output indentato di 2.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+
+        options = ORJSON_OPTIONS
+        if self.get_indent(accepted_media_type, renderer_context or {}):
+            options |= orjson.OPT_INDENT_2
+
+        ret = orjson.dumps(data, default=default, option=options)
+        # Come JSONRenderer: U+2028 e U+2029 sono validi in JSON ma non nelle stringhe JavaScript
+        if b'\xe2\x80\xa8' in ret or b'\xe2\x80\xa9' in ret:
+            ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+        return ret
+
+
+class ORJSONParser(JSONParser):
+    """
+    JSONParser con orjson. Come JSONParser rifiuta NaN e Infinity.
+    """
+    renderer_class = ORJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            return orjson.loads(stream.read())
+        except orjson.JSONDecodeError as exc:
+            raise ParseError(f'JSON parse error - {exc}')
+
+
+# ======== SERVER-SENT EVENTS ========
+# I client SSE (EventSource) inviano `Accept: text/event-stream`: senza un renderer per quel tipo la
+# negoziazione dei contenuti di DRF risponde 406 prima di arrivare alla view. Le risposte in streaming
+# (sse_response in data/views.py) non passano dal renderer; le altre (es. errori 404) diventano un evento `error`.
+
+class EventStreamRenderer(BaseRenderer):
+    media_type = "text/event-stream"
+    format = "sse"
+    charset = "utf-8"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return b"event: error\ndata: " + orjson.dumps(data, default=default, option=ORJSON_OPTIONS) + b"\n\n"
@@ -0,0 +1,100 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+
+
+# ======== ROUTING PRIMARIO / REPLICA ========
+# Le scritture vanno sempre sul database primario ("default"). Le letture vanno sulla replica
+# (settings.DATABASE_REPLICA["ALIAS"]) solo dentro read_from_replica(), usata dalle liste e dalle
+# analisi più pesanti, e solo finché nella richiesta non c'è stata una scrittura: dopo la prima
+# scrittura la richiesta resta sul primario (pin), così rilegge i dati appena salvati.
+# Il middleware DatabaseRoutingMiddleware prolunga il pin per PIN_SECONDS sulle richieste successive
+# dello stesso utente, il tempo che la replica impiega a ricevere le modifiche. Il pin è salvato nella
+# cache, che con più worker deve essere condivisa (CACHES in settings.py) perché lo veda il worker successivo.
+#
+# In locale (SQLite) l'alias della replica punta allo stesso file; nei test è un MIRROR di "default".
+
+_use_replica = ContextVar("use_replica", default=False)
+_pinned_to_primary = ContextVar("pinned_to_primary", default=False)
+
+
+def replica_alias() -> str | None:
+    """
+    Alias della replica, se configurata in DATABASES.
+    """
+    alias = settings.DATABASE_REPLICA["ALIAS"]
+    return alias if alias in settings.DATABASES else None
+
+
+def _pin_cache_key(user_id: int) -> str:
+    return f"db-primary-pin:{user_id}"
+
+
+def pin_to_primary():
+    _pinned_to_primary.set(True)
+
+
+def is_pinned_to_primary() -> bool:
+    return _pinned_to_primary.get()
+
+
+def remember_write(user):
+    """
+    Tiene l'utente sul primario per PIN_SECONDS dopo una richiesta che ha scritto.
+    """
+    cache.set(_pin_cache_key(user.pk), True, settings.DATABASE_REPLICA["PIN_SECONDS"])
+
+
+def recently_wrote(user) -> bool:
+    return bool(user and user.is_authenticated and cache.get(_pin_cache_key(user.pk)))
+
+
+@contextmanager
+def read_from_replica():
+    """
+    Le letture eseguite nel blocco (se non c'è già stata una scrittura) vanno sulla replica.
+    """
+    token = _use_replica.set(True)
+    try:
+        yield
+    finally:
+        _use_replica.reset(token)
+
+
+@contextmanager
+def routing_scope():
+    """
+    Stato di routing pulito per una richiesta o un job: i thread dei worker vengono riutilizzati,
+    il pin di una richiesta non deve passare alla successiva.
+    """
+    replica_token = _use_replica.set(False)
+    pin_token = _pinned_to_primary.set(False)
+    try:
+        yield
+    finally:
+        _pinned_to_primary.reset(pin_token)
+        _use_replica.reset(replica_token)
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        alias = replica_alias()
+        if alias and _use_replica.get() and not _pinned_to_primary.get():
+            return alias
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        pin_to_primary()
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Primario e replica contengono gli stessi dati
+        databases = {DEFAULT_DB_ALIAS, replica_alias()}
+        return obj1._state.db in databases and obj2._state.db in databases
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Lo schema della replica arriva dalla replica stessa
+        return db == DEFAULT_DB_ALIAS
@@ -0,0 +1,160 @@
+import re
+import unicodedata
+
+from django.db import transaction
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import Coalesce
+
+
+# ======== INDICE DI RICERCA DEGLI ALIMENTI ========
+# Indice invertito su FoodItem.name e FoodItem.brand mantenuto nella tabella FoodItemToken:
+# una riga per ogni coppia (token, alimento). La ricerca usa solo `token IN (...)` e intervalli
+# `token >= 'poll' AND token < 'poll\U0010ffff'` (prefissi, così "poll" trova ancora "pollo" come faceva
+# icontains) sull'indice composto (token, food_item, weight): non scansiona più l'intera tabella con
+# LIKE '%kw%' e la latenza resta stabile anche con centinaia di migliaia di alimenti importati.
+# L'indice viene aggiornato dai segnali di FoodItem (data/signals.py).
+
+NAME_WEIGHT = 2
+BRAND_WEIGHT = 1
+MIN_TOKEN_LENGTH = 2
+# I token più corti cercano solo la parola esatta: "pa" come prefisso troverebbe metà del catalogo
+MIN_PREFIX_LENGTH = 3
+PREFIX_END = "\U0010ffff"
+DEFAULT_SEARCH_LIMIT = 25
+
+STOP_WORDS = {
+    "di", "del", "della", "dello", "dei", "degli", "delle", "con", "al", "alla", "allo", "alle", "ai", "agli",
+    "in", "da", "su", "per", "il", "la", "lo", "le", "gli", "un", "una", "uno", "ed", "od",
+}
+
+TOKEN_RE = re.compile(r"\w+")
+
+
+def normalize_text(text: str) -> str:
+    """
+    Porta il testo in minuscolo e rimuove gli accenti ("Lunedì" → "lunedi"),
+    così che ricerca e indicizzazione confrontino sempre la stessa forma.
+    """
+    decomposed = unicodedata.normalize("NFKD", text or "")
+    return "".join(c for c in decomposed if not unicodedata.combining(c)).lower()
+
+
+def tokenize(text: str) -> list[str]:
+    """
+    Estrae i token significativi (senza duplicati e senza stop word) da un testo.
+    """
+    tokens = []
+    for token in TOKEN_RE.findall(normalize_text(text)):
+        if len(token) >= MIN_TOKEN_LENGTH and token not in STOP_WORDS and token not in tokens:
+            tokens.append(token[:64])
+    return tokens
+
+
+def build_item_tokens(food_item) -> list:
+    """
+    Costruisce le righe dell'indice per un alimento: i token del nome pesano più di quelli del brand.
+    """
+    from data.models import FoodItemToken
+
+    weights = {}
+    for token in tokenize(food_item.name):
+        weights[token] = weights.get(token, 0) + NAME_WEIGHT
+    for token in tokenize(food_item.brand or ""):
+        weights[token] = weights.get(token, 0) + BRAND_WEIGHT
+
+    return [
+        FoodItemToken(token=token, food_item_id=food_item.pk, weight=weight)
+        for token, weight in weights.items()
+    ]
+
+
+def index_food_items(food_items, batch_size: int = 1000):
+    """
+    (Re)indicizza gli alimenti indicati, sostituendo le righe precedenti dell'indice.
+
+    :param food_items: iterabile di istanze `FoodItem` già salvate (con pk)
+    """
+    from data.models import FoodItemToken
+
+    food_items = list(food_items)
+    if not food_items:
+        return
+
+    rows = []
+    for item in food_items:
+        rows.extend(build_item_tokens(item))
+
+    with transaction.atomic():
+        FoodItemToken.objects.filter(food_item_id__in=[item.pk for item in food_items]).delete()
+        FoodItemToken.objects.bulk_create(rows, batch_size=batch_size)
+
+
+def rebuild_food_index(batch_size: int = 2000) -> int:
+    """
+    Ricostruisce da zero l'intero indice, a blocchi per contenere la memoria.
+    Ritorna il numero di alimenti indicizzati.
+    """
+    from data.models import FoodItem, FoodItemToken
+
+    FoodItemToken.objects.all().delete()
+
+    total = 0
+    last_pk = 0
+    while True:
+        batch = list(FoodItem.objects.filter(pk__gt=last_pk).order_by("pk").only("pk", "name", "brand")[:batch_size])
+        if not batch:
+            break
+        rows = []
+        for item in batch:
+            rows.extend(build_item_tokens(item))
+        FoodItemToken.objects.bulk_create(rows, batch_size=batch_size)
+        total += len(batch)
+        last_pk = batch[-1].pk
+
+    return total
+
+
+def search_food_items(keywords: list[str], limit: int = DEFAULT_SEARCH_LIMIT) -> list[tuple]:
+    """
+    Ricerca ordinata degli alimenti che contengono le parole chiave indicate, anche come inizio
+    di parola ("yog" trova "yogurt").
+
+    :param keywords: parole o frasi libere (es. ["patata", "patate", "fritte"])
+    :param limit: numero massimo di candidati restituiti
+    :return: lista di tuple (FoodItem, score): prima gli alimenti con più peso sulle parole esatte,
+             poi per score decrescente. Lo score è la somma dei pesi dei token trovati (nome 2, brand 1).
+    """
+    from data.models import FoodItem, FoodItemToken
+
+    tokens = []
+    for kw in keywords:
+        for token in tokenize(kw):
+            if token not in tokens:
+                tokens.append(token)
+
+    if not tokens:
+        return []
+
+    lookup = Q(token__in=tokens)
+    for token in tokens:
+        if len(token) >= MIN_PREFIX_LENGTH:
+            lookup |= Q(token__gte=token, token__lt=token + PREFIX_END)
+
+    ranked = list(
+        FoodItemToken.objects
+        .filter(lookup)
+        .values("food_item_id")
+        .annotate(
+            exact=Coalesce(Sum("weight", filter=Q(token__in=tokens)), 0),
+            score=Sum("weight"),
+            matched=Count("token")
+        )
+        .order_by("-exact", "-score", "-matched", "food_item_id")[:limit]
+    )
+
+    items = FoodItem.objects.in_bulk([row["food_item_id"] for row in ranked])
+    return [
+        (items[row["food_item_id"]], row["score"])
+        for row in ranked
+        if row["food_item_id"] in items
+    ]
@@ -1,6 +1,8 @@
+from django.db.models import Prefetch
+from django.core.files.storage import default_storage
 from rest_framework import serializers
 from .models import DetailsAccount, Weight, BodyMeasurement, FoodItem, FoodPlanItem, FoodPlan, FoodPlanSection, GymItem, \
-    GymPlan, GymPlanItem, GymPlanSection, GymPlanSetDetail, GymMediaUpload
+    GymPlan, GymPlanItem, GymPlanSection, GymPlanSetDetail, GymMediaUpload, AIJob
 
 
 class DetailsAccountSerializer(serializers.ModelSerializer):
@@ -52,7 +54,47 @@ class FoodPlanSectionSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
 
-class GymItemSerializer(serializers.ModelSerializer):
+def media_upload_urls(upload, request=None) -> dict:
+    """
+    URL dell'immagine originale e delle sue varianti (JPEG e WebP per dimensione, vedi data/images.py).
+    Le liste possono così scaricare la miniatura invece dell'originale.
+    """
+    def absolute(path):
+        url = default_storage.url(path)
+        return request.build_absolute_uri(url) if request else url
+
+    sizes = {}
+    for size_name, size in (upload.variants or {}).get("sizes", {}).items():
+        sizes[size_name] = {
+            "width": size["width"],
+            "height": size["height"],
+            "jpeg": absolute(size["jpeg"]),
+            "webp": absolute(size["webp"]),
+        }
+
+    return {
+        "id": upload.id,
+        "original": absolute(upload.file.name) if upload.file else None,
+        "sizes": sizes,
+    }
+
+
+class SparseFieldsMixin:
+    """
+    Proiezione dei campi: se la view passa `fields` nel contesto (es. da `?fields=id,name`),
+    il serializer restituisce solo quei campi e non calcola gli altri.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        requested = self.context.get("fields")
+        if requested:
+            for name in set(self.fields) - set(requested) - {"id"}:
+                self.fields.pop(name)
+
+
+class GymItemSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    images = serializers.SerializerMethodField()
     force_display = serializers.SerializerMethodField()
     level_display = serializers.SerializerMethodField()
     mechanic_display = serializers.SerializerMethodField()
@@ -75,8 +117,13 @@ class GymItemSerializer(serializers.ModelSerializer):
             'secondary_muscles',
             'instructions',
             'image_urls',
+            'images',
         ]
 
+    def get_images(self, obj):
+        request = self.context.get("request")
+        return [media_upload_urls(upload, request) for upload in obj.image_urls.all()]
+
     def get_force_display(self, obj):
         return obj.get_force_display() if obj.force else None
 
@@ -95,6 +142,29 @@ class GymItemSerializer(serializers.ModelSerializer):
     def get_primary_muscle_display(self, obj):
         return obj.get_primary_muscle_display() if obj.primary_muscle else None
 
+def gym_plan_sets_prefetch():
+    """
+    Set di un GymPlanItem con l'esercizio e le sue immagini, caricati in due query
+    per tutti gli item invece di due query per ogni set.
+    """
+    return Prefetch(
+        'sets',
+        queryset=GymPlanSetDetail.objects.select_related('exercise').prefetch_related('exercise__image_urls')
+    )
+
+def gym_plan_tree_prefetch():
+    """
+    Albero completo di una scheda (sezioni → item → set → esercizio → immagini) da usare con
+    `GymPlan.objects.prefetch_related(...)`: il numero di query resta costante qualunque sia
+    il numero di schede, sezioni, item o set serializzati da GymPlanSerializer.
+    """
+    return Prefetch(
+        'gymplansection_set',
+        queryset=GymPlanSection.objects.prefetch_related(
+            Prefetch('gymplanitem_set', queryset=GymPlanItem.objects.prefetch_related(gym_plan_sets_prefetch()))
+        )
+    )
+
 class GymPlanSerializer(serializers.ModelSerializer):
     gym_plan_items = serializers.SerializerMethodField()
 
@@ -103,10 +173,19 @@ class GymPlanSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
     def get_gym_plan_items(self, obj):
-        return GymPlanItemSerializer(
-            GymPlanItem.objects.filter(section__gym_plan=obj),
-            many=True
-        ).data
+        if 'gymplansection_set' in getattr(obj, '_prefetched_objects_cache', {}):
+            # Albero già caricato dalla view con gym_plan_tree_prefetch(): nessuna query aggiuntiva
+            items = [item for section in obj.gymplansection_set.all() for item in section.gymplanitem_set.all()]
+            items.sort(key=lambda item: (item.order, item.pk))
+        else:
+            items = (
+                GymPlanItem.objects.filter(section__gym_plan=obj)
+                .select_related('section')
+                .prefetch_related(gym_plan_sets_prefetch())
+                .order_by('order', 'pk')
+            )
+
+        return GymPlanItemSerializer(items, many=True).data
 
 class GymPlanSynthesizedSerializer(serializers.ModelSerializer):
     class Meta:
@@ -147,9 +226,14 @@ class GymPlanSetDetailSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
 class GymMediaUploadSerializer(serializers.ModelSerializer):
+    sizes = serializers.SerializerMethodField()
+
     class Meta:
         model = GymMediaUpload
-        fields = '__all__'
+        fields = ['id', 'file', 'uploaded_at', 'sizes']
+
+    def get_sizes(self, obj):
+        return media_upload_urls(obj, self.context.get("request"))["sizes"]
 
 class GymPlanItemSerializer(serializers.ModelSerializer):
     section_id = serializers.PrimaryKeyRelatedField(
@@ -182,3 +266,9 @@ class GymPlanItemSerializer(serializers.ModelSerializer):
             for tech in obj.intensity_techniques
             if tech in GymPlanItem.TechniqueType.values
         ]
+
+
+class AIJobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = AIJob
+        fields = ['id', 'kind', 'status', 'result', 'result_status', 'created_at', 'started_at', 'finished_at']
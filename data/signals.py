@@ -0,0 +1,74 @@
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+
+from data.models import DetailsAccount, FoodItem, GymMediaUpload
+from data.search import index_food_items
+
+
+# Mantiene allineato l'indice di ricerca degli alimenti (data/search.py).
+# Le righe dell'indice di un alimento eliminato spariscono da sole grazie al CASCADE.
+@receiver(post_save, sender=FoodItem)
+def reindex_food_item(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    index_food_items([instance])
+
+
+# Genera le versioni ridotte delle immagini degli esercizi al caricamento (o al cambio del file), vedi data/images.py
+@receiver(post_save, sender=GymMediaUpload)
+def generate_gym_media_variants(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+
+    from data.images import refresh_media_variants
+
+    try:
+        refresh_media_variants(instance)
+    except Exception as e:
+        # L'upload resta valido anche senza varianti: il comando `generate_media_variants` può recuperarle
+        print(f"Errore nella generazione delle varianti di {instance.file.name}: {e}")
+
+
+@receiver(post_delete, sender=GymMediaUpload)
+def delete_gym_media_variants(sender, instance, **kwargs):
+    from data.images import delete_media_variants
+
+    delete_media_variants(instance.variants)
+
+
+# ======== FILE CONDIVISI (data/storage.py) ========
+# Con lo storage per contenuto più righe possono usare lo stesso file: alla cancellazione di una riga,
+# o alla sostituzione del file, lo storage elimina il vecchio file solo se nessun'altra riga lo usa.
+MEDIA_FILE_FIELDS = {
+    GymMediaUpload: "file",
+    DetailsAccount: "profile_picture",
+}
+
+
+@receiver(pre_save, sender=GymMediaUpload)
+@receiver(pre_save, sender=DetailsAccount)
+def remember_replaced_file(sender, instance, raw=False, **kwargs):
+    field_file = getattr(instance, MEDIA_FILE_FIELDS[sender])
+    # Solo quando arriva un nuovo file (non ancora salvato) serve leggere quello precedente
+    if raw or instance._state.adding or not field_file or field_file._committed:
+        return
+    instance._replaced_file = sender.objects.filter(pk=instance.pk).values_list(
+        MEDIA_FILE_FIELDS[sender], flat=True
+    ).first()
+
+
+@receiver(post_save, sender=GymMediaUpload)
+@receiver(post_save, sender=DetailsAccount)
+def delete_replaced_file(sender, instance, raw=False, **kwargs):
+    old_name = instance.__dict__.pop("_replaced_file", None)
+    field_file = getattr(instance, MEDIA_FILE_FIELDS[sender])
+    if old_name and old_name != field_file.name:
+        field_file.storage.delete(old_name)
+
+
+@receiver(post_delete, sender=GymMediaUpload)
+@receiver(post_delete, sender=DetailsAccount)
+def delete_unreferenced_file(sender, instance, **kwargs):
+    field_file = getattr(instance, MEDIA_FILE_FIELDS[sender])
+    if field_file:
+        field_file.storage.delete(field_file.name)
@@ -0,0 +1,125 @@
+import hashlib
+import os
+import re
+import threading
+
+from django.apps import apps
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.db import transaction
+from django.utils.deconstruct import deconstructible
+
+
+# ======== STORAGE DEDUPLICATO PER CONTENUTO ========
+# I file caricati vengono salvati con il nome derivato dallo sha256 del contenuto
+# (es. gym_media/3f/3fa9…e1.jpg): la stessa immagine caricata più volte occupa spazio una sola volta
+# e più righe puntano allo stesso file. Per questo un file viene eliminato solo quando nessuna
+# riga dei campi in REFERENCE_FIELDS lo usa più. Il conteggio dei riferimenti e la cancellazione avvengono
+# dopo il commit della transazione che ha rimosso la riga (con un rollback il file resta) e sotto un lock
+# condiviso con save: nello stesso processo un upload dello stesso contenuto non si intreccia con la cancellazione.
+
+REFERENCE_FIELDS = [
+    ("data.GymMediaUpload", "file"),
+    ("data.DetailsAccount", "profile_picture"),
+]
+
+HASH_CHUNK_SIZE = 64 * 1024
+
+CONTENT_ADDRESSED_RE = re.compile(r"(^|/)[0-9a-f]{2}/(?P<digest>[0-9a-f]{64})(\.\w+)?$")
+
+# Serializza, per processo, controllo dei riferimenti e cancellazione rispetto ai salvataggi
+references_lock = threading.Lock()
+
+
+def content_hash(content) -> str:
+    """
+    sha256 del contenuto di un file Django (File/UploadedFile), letto a blocchi.
+    """
+    digest = hashlib.sha256()
+    for chunk in content.chunks(HASH_CHUNK_SIZE):
+        digest.update(chunk)
+    content.seek(0)
+    return digest.hexdigest()
+
+
+def content_addressed_name(name: str, digest: str) -> str:
+    """
+    Nome definitivo di un file: cartella di upload_to + primi due caratteri dell'hash + hash + estensione.
+    """
+    directory, filename = os.path.split(name)
+    extension = os.path.splitext(filename)[1].lower()
+    return os.path.join(directory, digest[:2], f"{digest}{extension}").replace(os.sep, "/")
+
+
+def name_digest(name: str) -> str | None:
+    """
+    Hash contenuto nel nome di un file dello storage per contenuto, None per i nomi di altro tipo.
+    """
+    match = CONTENT_ADDRESSED_RE.search(name or "")
+    return match.group("digest") if match else None
+
+
+def count_references(name: str) -> int:
+    """
+    Numero di righe che usano il file `name` in tutti i campi di REFERENCE_FIELDS.
+    """
+    total = 0
+    for model_label, field_name in REFERENCE_FIELDS:
+        model = apps.get_model(model_label)
+        total += model.objects.filter(**{field_name: name}).count()
+    return total
+
+
+def is_field_default(name: str) -> bool:
+    """
+    I file usati come default di un campo (es. profile_pics/default.jpg) non vanno mai eliminati.
+    """
+    for model_label, field_name in REFERENCE_FIELDS:
+        field = apps.get_model(model_label)._meta.get_field(field_name)
+        if field.has_default() and field.get_default() == name:
+            return True
+    return False
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    FileSystemStorage che salva ogni contenuto una sola volta e cancella solo i file non più referenziati.
+    """
+
+    def __init__(self, *args, **kwargs):
+        # Lo stesso nome contiene sempre gli stessi byte: sovrascrivere è innocuo e non servono suffissi
+        kwargs.setdefault("allow_overwrite", True)
+        super().__init__(*args, **kwargs)
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, "chunks"):
+            content = File(content, name)
+
+        name = content_addressed_name(self.generate_filename(name), content_hash(content))
+        with references_lock:
+            if self.exists(name):
+                return name
+            return super().save(name, content, max_length=max_length)
+
+    def get_available_name(self, name, max_length=None):
+        return name
+
+    def delete(self, name):
+        """
+        Elimina il file, dopo il commit della transazione in corso, solo se nessuna riga lo usa più.
+        Va chiamata dopo aver rimosso o aggiornato il riferimento (es. in post_delete).
+        """
+        if not name or is_field_default(name):
+            return
+        transaction.on_commit(lambda: self.delete_unreferenced(name))
+
+    def delete_unreferenced(self, name):
+        with references_lock:
+            if not count_references(name):
+                super().delete(name)
+
+
+content_storage = ContentAddressedStorage()
@@ -1,3 +1,1205 @@
-from django.test import TestCase
+import csv
+import io
+import json
+import os
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connections
+from django.db.models.query import QuerySet
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from langchain_core.globals import set_llm_cache
+from rest_framework.authtoken.models import Token
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from .cloning import clone_food_plan, clone_gym_plan
+from .fake_llm import FakeChatModel
+from .jobs import claim_next_job, enqueue_job, requeue_stale_jobs, run_job
+from .llm_cache import DatabaseLLMCache, FileSystemLLMCache
+from .models import (
+    AIJob, DetailsAccount, FoodImageAnalysis, FoodItem, FoodItemToken, FoodPlan, FoodPlanItem, FoodPlanSection, GymItem, GymMediaUpload, GymPlan,
+    GymPlanItem, GymPlanSection, GymPlanSetDetail, LLMCacheEntry, LLMQuota, LLMUsage, LLMUsageDaily, Weight
+)
+from .renderers import ORJSONRenderer
+from .routers import PrimaryReplicaRouter, read_from_replica, routing_scope
+from .search import search_food_items, tokenize
+from .utils import optimize_foodplan_quantities, reset_llm_registry, select_best_food_items
+
+
+class GymPlanQueryCountTests(TestCase):
+    """
+    La lettura delle schede deve usare un numero costante di query, indipendente
+    dal numero di schede, sezioni, item, set ed esercizi (nessun N+1).
+    """
+    databases = {"default", "replica"}
+
+    # scheda + sezioni + item + set (con esercizio) + immagini degli esercizi
+    EXPECTED_QUERIES = 5
+
+    def setUp(self):
+        cache.clear()
+        self.user = get_user_model().objects.create_user(username="atleta", password="password")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def create_plan(self, days=("lun", "mer"), items_per_section=3, sets_per_item=3):
+        plan = GymPlan.objects.create(author=self.user, start_date=date(2025, 1, 6), end_date=date(2025, 1, 12))
+
+        for day in days:
+            section = GymPlanSection.objects.create(author=self.user, gym_plan=plan, day=day)
+            for order in range(items_per_section):
+                exercise = GymItem.objects.create(author=self.user, name=f"Esercizio {day} {order}")
+                exercise.image_urls.add(GymMediaUpload.objects.create(file=f"gym_media/{day}_{order}.jpg"))
+
+                item = GymPlanItem.objects.create(section=section, order=order)
+                for set_number in range(1, sets_per_item + 1):
+                    GymPlanSetDetail.objects.create(
+                        plan_item=item,
+                        exercise=exercise,
+                        order=set_number,
+                        set_number=set_number
+                    )
+
+        return plan
+
+    def test_list_query_count_is_constant(self):
+        self.create_plan()
+
+        # La lista delle schede legge dalla replica (data/routers.py)
+        with self.assertNumQueries(self.EXPECTED_QUERIES, using="replica"):
+            response = self.client.get(reverse("gymplan-list"))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data[0]["gym_plan_items"]), 6)
+
+        self.create_plan(days=("lun", "mar", "gio", "sab"), items_per_section=4)
+        self.create_plan(days=("ven",), items_per_section=1, sets_per_item=5)
+
+        with self.assertNumQueries(self.EXPECTED_QUERIES, using="replica"):
+            response = self.client.get(reverse("gymplan-list"))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data), 3)
+
+    def test_retrieve_query_count_is_constant(self):
+        plan = self.create_plan(days=("lun", "mar", "mer", "gio", "ven"), items_per_section=5)
+
+        with self.assertNumQueries(self.EXPECTED_QUERIES):
+            response = self.client.get(reverse("gymplan-detail", args=[plan.pk]))
+        self.assertEqual(response.status_code, 200)
+
+        items = response.data["gym_plan_items"]
+        self.assertEqual(len(items), 25)
+        self.assertEqual([item["order"] for item in items], sorted(item["order"] for item in items))
+        self.assertEqual(len(items[0]["sets"]), 3)
+        self.assertEqual(len(items[0]["sets"][0]["exercise"]["image_urls"]), 1)
+        self.assertIn(items[0]["section"]["day"], ("lun", "mar", "mer", "gio", "ven"))
+
+
+@override_settings(
+    LLM_BACKEND="fake",
+    FAKE_LLM={"LATENCY": 0, "FIXTURES": None},
+    LLM_CACHE={"BACKEND": None},
+    LLM_QUOTA={"DAILY_TOKENS": None},
+)
+class LLMQuotaTests(TestCase):
+    """
+    I token spesi dalle view AI vengono registrati per utente e catena;
+    a quota esaurita la view risponde 429 senza chiamare il modello.
+    """
+    databases = {"default", "replica"}
+
+    def setUp(self):
+        reset_llm_registry()
+        self.addCleanup(reset_llm_registry)
+        cache.clear()
+
+        self.user = get_user_model().objects.create_user(username="atleta", password="password")
+        DetailsAccount.objects.create(author=self.user, date_of_birth=date(1990, 1, 1), biological_gender="M",
+                                      height_cm=180, goal_targets="fitness")
+        Weight.objects.create(author=self.user, weight_value=80, date_recorded=date(2025, 1, 6))
+
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_usage_is_recorded(self):
+        response = self.client.get(reverse("weight-analysis"))
+        self.assertEqual(response.status_code, 200)
+
+        usage = LLMUsage.objects.get(author=self.user)
+        self.assertEqual(usage.chain, "weight_analysis")
+        self.assertEqual(usage.calls, 1)
+        self.assertGreater(usage.input_tokens, 0)
+
+        self.client.get(reverse("weight-analysis"))
+        daily = LLMUsageDaily.objects.get(author=self.user, chain="weight_analysis")
+        self.assertEqual(daily.calls, 2)
+        self.assertEqual(daily.input_tokens, usage.input_tokens * 2)
+
+    def test_streamed_usage_is_recorded(self):
+        response = self.client.get(reverse("weight-analysis-stream"))
+        self.assertEqual(response.status_code, 200)
+        b"".join(response.streaming_content)
+
+        # Il modello fittizio, come ChatOpenAI, riporta i token in streaming solo con stream_usage=True
+        usage = LLMUsage.objects.get(author=self.user, chain="weight_analysis")
+        self.assertEqual(usage.calls, 1)
+        self.assertGreater(usage.output_tokens, 0)
+
+    def test_exhausted_quota_blocks_ai_views(self):
+        LLMQuota.objects.create(author=self.user, daily_tokens=10)
+
+        self.assertEqual(self.client.get(reverse("weight-analysis")).status_code, 200)
+
+        calls = FakeChatModel.call_count()
+        response = self.client.get(reverse("weight-analysis"))
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(FakeChatModel.call_count(), calls)
+
+    def test_quota_counts_usage_recorded_by_other_workers(self):
+        # Nessun totale in cache: i consumi registrati da un altro processo valgono subito
+        LLMQuota.objects.create(author=self.user, daily_tokens=100)
+        LLMUsageDaily.objects.create(author=self.user, day=timezone.localdate(), chain="weight_analysis",
+                                     input_tokens=80, output_tokens=20)
+
+        calls = FakeChatModel.call_count()
+        self.assertEqual(self.client.get(reverse("weight-analysis")).status_code, 429)
+        self.assertEqual(FakeChatModel.call_count(), calls)
+
+    def test_ai_views_require_authentication(self):
+        from rest_framework.permissions import IsAuthenticated
+
+        from .throttles import LLMQuotaThrottle
+        from .urls import urlpatterns
+
+        ai_views = [
+            pattern.callback.cls for pattern in urlpatterns
+            if LLMQuotaThrottle in getattr(getattr(pattern.callback, "cls", None), "throttle_classes", ())
+        ]
+        self.assertGreater(len(ai_views), 20)
+        for view in ai_views:
+            with self.subTest(view=view.__name__):
+                self.assertIn(IsAuthenticated, view.permission_classes)
+
+        calls = FakeChatModel.call_count()
+        self.assertEqual(APIClient().get(reverse("weight-analysis")).status_code, 403)
+        self.assertEqual(APIClient().get(reverse("gymplan-generate-note", args=[1])).status_code, 403)
+        self.assertEqual(FakeChatModel.call_count(), calls)
+        self.assertFalse(LLMUsage.objects.exists())
+
+    async def test_asgi_requests_record_usage_and_respect_quota(self):
+        # AsyncClient passa dall'handler ASGI: middleware in modalità async, view sync in un thread
+        token = await Token.objects.acreate(user=self.user)
+        headers = {"Authorization": f"Token {token.key}"}
+
+        response = await self.async_client.get(reverse("weight-analysis"), headers=headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((await LLMUsage.objects.aget(author=self.user)).chain, "weight_analysis")
+
+        await LLMQuota.objects.acreate(author=self.user, daily_tokens=10)
+        calls = FakeChatModel.call_count()
+        response = await self.async_client.get(reverse("weight-analysis"), headers=headers)
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(FakeChatModel.call_count(), calls)
+
+
+@override_settings(
+    LLM_BACKEND="fake",
+    FAKE_LLM={"LATENCY": 0, "FIXTURES": None},
+    LLM_CACHE={"BACKEND": None},
+    FOOD_IMAGE_CACHE={"ENABLED": True, "THRESHOLD": 6, "RETENTION_DAYS": 30, "MAX_ENTRIES": 2},
+)
+class FoodImageCacheTests(TestCase):
+    """
+    Una foto quasi identica (ricompressa e ridimensionata) a una già analizzata
+    riusa i pasti riconosciuti senza una nuova chiamata vision.
+    """
+
+    def setUp(self):
+        reset_llm_registry()
+        self.addCleanup(reset_llm_registry)
+
+        self.user = get_user_model().objects.create_user(username="atleta", password="password")
+        FoodItem.objects.create(author=self.user, name="Pasta al pomodoro", kcal_per_100g=150, protein_per_100g=5,
+                                carbs_per_100g=30, fats_per_100g=2, fiber_per_100g=2)
+
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def upload(self, color, size=(800, 600), quality=90):
+        from PIL import Image, ImageDraw
+
+        image = Image.new("RGB", size, (240, 230, 200))
+        draw = ImageDraw.Draw(image)
+        draw.ellipse([size[0] // 4, size[1] // 4, size[0] // 2, size[1] // 2], fill=color)
+        draw.rectangle([size[0] // 2, size[1] // 2, size[0] - 10, size[1] - 10], fill=(30, 60, 90))
+
+        buffer = io.BytesIO()
+        image.save(buffer, format="JPEG", quality=quality)
+        return self.client.post(reverse("foodplan-image-parsing"), {
+            "image": SimpleUploadedFile("pasto.jpg", buffer.getvalue(), content_type="image/jpeg")
+        }, format="multipart")
+
+    def test_near_duplicate_reuses_analysis(self):
+        first = self.upload((200, 40, 40))
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(FoodImageAnalysis.objects.count(), 1)
+
+        calls = FakeChatModel.call_count()
+        second = self.upload((200, 40, 40), size=(400, 300), quality=60)
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(second.data["meals"], first.data["meals"])
+        # Nessuna chiamata vision: resta solo la selezione degli alimenti per i pasti riconosciuti
+        self.assertEqual(FakeChatModel.call_count() - calls, 1)
+        self.assertEqual(FoodImageAnalysis.objects.get().hits, 1)
+
+    def test_entries_beyond_max_are_evicted(self):
+        from data.images import store_food_analysis
+
+        for image_hash in (0x0, 0xFFFF, 0xFFFFFFFF):
+            store_food_analysis(self.user, image_hash, [{"meal": "Mela"}])
+
+        self.assertEqual(FoodImageAnalysis.objects.count(), 2)
+        self.assertFalse(FoodImageAnalysis.objects.filter(image_hash=f"{0:016x}").exists())
+
+
+class GymItemCatalogueTests(TestCase):
+    """
+    Catalogo esercizi: filtri, proiezione dei campi e paginazione a cursore opzionale.
+    """
+    databases = {"default", "replica"}
+
+    def setUp(self):
+        cache.clear()
+        self.user = get_user_model().objects.create_user(username="atleta", password="password")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+        for index in range(30):
+            item = GymItem.objects.create(
+                author=self.user,
+                name=f"Esercizio {index:02d}",
+                primary_muscle="chest" if index % 3 == 0 else "lats",
+                equipment="barbell" if index % 2 == 0 else "dumbbell",
+                level="beginner",
+            )
+            item.image_urls.add(GymMediaUpload.objects.create(file=f"gym_media/{index}.jpg"))
+
+    def test_without_pagination_params_returns_full_list(self):
+        response = self.client.get(reverse("gymitem-list"))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data), 30)
+
+    def test_filters_accept_multiple_values(self):
+        response = self.client.get(reverse("gymitem-list"), {"primary_muscle": "chest", "equipment": "barbell,dumbbell"})
+        self.assertEqual(len(response.data), 10)
+        self.assertTrue(all(item["primary_muscle"] == "chest" for item in response.data))
+
+        response = self.client.get(reverse("gymitem-list"), {"primary_muscle": "chest", "equipment": "barbell"})
+        self.assertEqual(len(response.data), 5)
+
+    def test_sparse_fields_skip_images(self):
+        with self.assertNumQueries(1, using="replica"):
+            response = self.client.get(reverse("gymitem-list"), {"fields": "id,name"})
+        self.assertEqual(set(response.data[0]), {"id", "name"})
+
+    def test_cursor_pagination_walks_the_catalogue(self):
+        names = []
+        url, params = reverse("gymitem-list"), {"page_size": 8, "fields": "name"}
+        while url:
+            with self.assertNumQueries(1, using="replica"):
+                response = self.client.get(url, params)
+            names.extend(item["name"] for item in response.data["results"])
+            url, params = response.data["next"], None
+
+        self.assertEqual(names, [f"Esercizio {index:02d}" for index in range(30)])
+
+
+class ReplicaRoutingTests(TestCase):
+    """
+    Le liste pesanti leggono dalla replica; scritture e letture subito dopo una scrittura restano sul primario.
+    In locale e nei test la replica è un secondo alias SQLite sullo stesso database (TEST MIRROR).
+    """
+    databases = {"default", "replica"}
+
+    def setUp(self):
+        cache.clear()
+        self.user = get_user_model().objects.create_user(username="replica", password="password")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        GymPlan.objects.create(author=self.user, start_date=date(2025, 1, 6), end_date=date(2025, 1, 12))
+
+    def test_list_reads_from_replica(self):
+        with self.assertNumQueries(0, using="default"):
+            response = self.client.get(reverse("gymplan-list"))
+        self.assertEqual(len(response.data), 1)
+
+    def test_write_pins_following_reads_to_primary(self):
+        response = self.client.post(
+            reverse("weight-create"), {"author": self.user.pk, "weight_value": 80, "date_recorded": "2025-01-01"}
+        )
+        self.assertEqual(response.status_code, 201)
+
+        with self.assertNumQueries(0, using="replica"):
+            self.client.get(reverse("gymplan-list"))
+
+        cache.clear()
+        with self.assertNumQueries(0, using="default"):
+            self.client.get(reverse("gymplan-list"))
+
+    def test_pin_reaches_another_worker_through_a_shared_cache(self):
+        # Due worker = due istanze della cache. Con un backend condiviso (Redis in produzione, qui su file)
+        # il pin scritto dal primo worker vale per il secondo; con cache locali al processo no
+        from django.core.cache import caches
+
+        def worker_cache(backend, location):
+            with override_settings(CACHES={"default": {"BACKEND": backend, "LOCATION": location}}):
+                return caches.create_connection("default")
+
+        def write_then_read(first, second):
+            with mock.patch("data.routers.cache", first):
+                response = self.client.post(
+                    reverse("weight-create"), {"author": self.user.pk, "weight_value": 80, "date_recorded": "2025-01-01"}
+                )
+                self.assertEqual(response.status_code, 201)
+            with mock.patch("data.routers.cache", second), CaptureQueriesContext(connections["replica"]) as replica:
+                self.client.get(reverse("gymplan-list"))
+            return len(replica)
+
+        shared = "django.core.cache.backends.filebased.FileBasedCache"
+        with tempfile.TemporaryDirectory() as location:
+            self.assertEqual(write_then_read(worker_cache(shared, location), worker_cache(shared, location)), 0)
+
+        local = "django.core.cache.backends.locmem.LocMemCache"
+        self.assertGreater(write_then_read(worker_cache(local, "worker-1"), worker_cache(local, "worker-2")), 0)
+
+    def test_write_inside_replica_block_pins_the_rest_to_primary(self):
+        router = PrimaryReplicaRouter()
+        with routing_scope(), read_from_replica():
+            self.assertEqual(router.db_for_read(GymPlan), "replica")
+            Weight.objects.create(author=self.user, weight_value=80, date_recorded=date(2025, 1, 1))
+            self.assertEqual(router.db_for_read(GymPlan), "default")
+        self.assertEqual(router.db_for_read(GymPlan), "default")
+
+
+class ORJSONRendererTests(TestCase):
+    """
+    Renderer e parser orjson (data/renderers.py): stesso JSON di JSONRenderer, date e Decimal come i serializer.
+    """
+
+    def test_output_matches_drf_json_renderer(self):
+        data = {"nome": "Crêpe", "sep": "a\u2028b", 1: [None, True, 1.5], "nested": {"x": []}}
+        self.assertEqual(ORJSONRenderer().render(data), JSONRenderer().render(data))
+
+    def test_dates_and_decimals_follow_rest_framework_settings(self):
+        body = ORJSONRenderer().render({"day": date(2025, 1, 6), "waist": Decimal("80.50")})
+        self.assertEqual(body, b'{"day":"06/01/2025","waist":"80.50"}')
+
+    def test_api_parses_and_renders_json(self):
+        user = get_user_model().objects.create_user(username="orjson", password="password")
+        client = APIClient()
+        client.force_authenticate(user)
+
+        response = client.post(
+            reverse("weight-create"),
+            {"author": user.pk, "weight_value": 80.5, "date_recorded": "2025-01-06"},
+            format="json"
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()["date_recorded"], "06/01/2025")
+
+        response = client.post(reverse("weight-create"), "{", content_type="application/json")
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(LLM_BACKEND="fake", FAKE_LLM={"LATENCY": 0, "FIXTURES": None}, LLM_CACHE={"BACKEND": None})
+class FoodPlanNumericOptimizationTests(TestCase):
+    """
+    Ottimizzazione numerica delle grammature (optimize_foodplan_quantities): dopo l'arrotondamento
+    nessun massimo del piano viene superato e ogni alimento resta tra min_grams e max_grams.
+    """
+    # (nome, proteine, carboidrati, grassi, kcal per 100g)
+    FOODS = [
+        ("Petto di pollo", 31, 0, 3.6, 165),
+        ("Riso basmati", 7, 77, 1, 360),
+        ("Olio extravergine", 0, 0, 100, 884),
+        ("Yogurt greco", 10, 4, 5, 97),
+    ]
+
+    def setUp(self):
+        reset_llm_registry()
+        self.addCleanup(reset_llm_registry)
+        cache.clear()
+        self.user = get_user_model().objects.create_user(username="dieta", password="password")
+        self.section = FoodPlanSection.objects.create(author=self.user, name="Pranzo", start_time=13)
+
+    def create_plan(self, max_protein=60, max_carbs=120, max_fats=30, max_kcal=1000, quantity=150):
+        plan = FoodPlan.objects.create(
+            author=self.user, start_date=date(2025, 1, 6), end_date=date(2025, 1, 12),
+            max_kcal=max_kcal, max_protein=max_protein, max_carbs=max_carbs, max_fats=max_fats
+        )
+        for name, protein, carbs, fats, kcal in self.FOODS:
+            food = FoodItem.objects.create(author=self.user, name=name, kcal_per_100g=kcal, protein_per_100g=protein,
+                                           carbs_per_100g=carbs, fats_per_100g=fats, fiber_per_100g=0)
+            FoodPlanItem.objects.create(food_plan=plan, food_item=food, food_section=self.section,
+                                        quantity_in_grams=quantity)
+        return plan
+
+    def totals(self, result: list[dict]) -> dict:
+        grams = {entry["id"]: entry["adjusted_quantity_in_grams"] for entry in result}
+        totals = {"protein": 0, "carbs": 0, "fats": 0, "kcal": 0}
+        for item in FoodPlanItem.objects.filter(id__in=grams).select_related("food_item"):
+            food = item.food_item
+            for key, per_100g in (("protein", food.protein_per_100g), ("carbs", food.carbs_per_100g),
+                                  ("fats", food.fats_per_100g), ("kcal", food.kcal_per_100g)):
+                totals[key] += per_100g * grams[item.id] / 100
+        return totals
+
+    def test_rounded_quantities_respect_macro_caps(self):
+        plan = self.create_plan()
+        result = optimize_foodplan_quantities(plan)
+
+        self.assertEqual(len(result), len(self.FOODS))
+        self.assertTrue(all(isinstance(entry["adjusted_quantity_in_grams"], int) for entry in result))
+        totals = self.totals(result)
+        self.assertLessEqual(totals["protein"], plan.max_protein)
+        self.assertLessEqual(totals["carbs"], plan.max_carbs)
+        self.assertLessEqual(totals["fats"], plan.max_fats)
+        self.assertLessEqual(totals["kcal"], plan.max_kcal)
+        # Il vincolo più stretto viene avvicinato, non solo rispettato
+        self.assertGreater(totals["protein"], plan.max_protein * 0.8)
+
+    def test_quantities_stay_within_gram_bounds(self):
+        plan = self.create_plan(max_protein=500, max_carbs=500, max_fats=500, max_kcal=10000)
+        result = optimize_foodplan_quantities(plan, min_grams=20, max_grams=80)
+
+        for entry in result:
+            self.assertGreaterEqual(entry["adjusted_quantity_in_grams"], 20)
+            self.assertLessEqual(entry["adjusted_quantity_in_grams"], 80)
+
+    def test_empty_plan(self):
+        plan = FoodPlan.objects.create(author=self.user, start_date=date(2025, 1, 6), end_date=date(2025, 1, 12),
+                                       max_kcal=2000, max_protein=150, max_carbs=200, max_fats=60)
+        self.assertEqual(optimize_foodplan_quantities(plan), [])
+
+    def test_infeasible_caps_fall_back_to_minimum_quantities(self):
+        # Anche 10g per alimento superano i massimi: nessun errore, tutto al minimo
+        plan = self.create_plan(max_protein=1, max_carbs=1, max_fats=1, max_kcal=10)
+        result = optimize_foodplan_quantities(plan, min_grams=10)
+
+        self.assertEqual({entry["adjusted_quantity_in_grams"] for entry in result}, {10})
+
+    def test_numeric_mode_view_updates_items_without_llm(self):
+        plan = self.create_plan()
+        client = APIClient()
+        client.force_authenticate(self.user)
+
+        calls = FakeChatModel.call_count()
+        response = client.get(reverse("foodplan-optimize-grams", args=[plan.id]), {"mode": "numeric"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(FakeChatModel.call_count(), calls)
+        self.assertEqual(response.data["updated_count"], len(response.data["updated_items"]))
+        self.assertGreater(response.data["updated_count"], 0)
+
+        result = [{"id": item.id, "adjusted_quantity_in_grams": item.quantity_in_grams}
+                  for item in plan.foodplanitem_set.all()]
+        self.assertLessEqual(self.totals(result)["protein"], plan.max_protein)
+
+        response = client.get(reverse("foodplan-optimize-grams", args=[plan.id]), {"mode": "simplex"})
+        self.assertEqual(response.status_code, 400)
+
+
+class FoodSearchTests(TestCase):
+    """
+    Indice di ricerca degli alimenti (data/search.py): tokenizzazione, ordinamento, prefissi
+    e allineamento dell'indice al salvataggio e alla cancellazione.
+    """
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username="ricerca", password="password")
+
+    def food(self, name: str, brand: str = None) -> FoodItem:
+        return FoodItem.objects.create(author=self.user, name=name, brand=brand, kcal_per_100g=100,
+                                       protein_per_100g=10, carbs_per_100g=10, fats_per_100g=1, fiber_per_100g=0)
+
+    def names(self, keywords: list[str]) -> list[str]:
+        return [item.name for item, score in search_food_items(keywords)]
+
+    def test_tokenize(self):
+        self.assertEqual(tokenize("Caffè d'orzo con LATTE e Più"), ["caffe", "orzo", "latte", "piu"])
+        self.assertEqual(tokenize("Pasta di pasta al pomodoro"), ["pasta", "pomodoro"])
+
+    def test_name_matches_rank_above_brand_matches(self):
+        self.food("Biscotti integrali", brand="Mulino")
+        self.food("Mulino integrale", brand="Granarolo")
+        self.food("Pane integrale", brand="Mulino")
+
+        self.assertEqual(self.names(["mulino"]), ["Mulino integrale", "Biscotti integrali", "Pane integrale"])
+        self.assertEqual(self.names(["pane", "mulino"])[0], "Pane integrale")
+
+    def test_prefix_matches(self):
+        self.food("Petto di pollo")
+        self.food("Yogurt greco")
+        self.food("Pollock surgelato")
+
+        self.assertEqual(self.names(["poll"]), ["Petto di pollo", "Pollock surgelato"])
+        self.assertEqual(self.names(["yog"]), ["Yogurt greco"])
+        # La parola esatta viene prima di quelle che la contengono come prefisso, anche se pesano di più
+        self.food("Pollock", brand="Pollock")
+        self.assertEqual(self.names(["pollo"]), ["Petto di pollo", "Pollock", "Pollock surgelato"])
+        self.assertEqual(self.names(["po"]), [])
+
+    def test_index_follows_save_and_delete(self):
+        item = self.food("Riso basmati")
+        self.assertEqual(self.names(["basmati"]), ["Riso basmati"])
+
+        item.name = "Riso venere"
+        item.save()
+        self.assertEqual(self.names(["basmati"]), [])
+        self.assertEqual(self.names(["venere"]), ["Riso venere"])
+
+        item.delete()
+        self.assertFalse(FoodItemToken.objects.exists())
+
+
+@override_settings(LLM_BACKEND="fake", FAKE_LLM={"LATENCY": 0, "FIXTURES": None}, LLM_CACHE={"BACKEND": None})
+class AIJobQueueTests(TestCase):
+    """
+    Coda dei job AI (data/jobs.py): 202 con status_url, presa in carico esclusiva, esecuzione e rimessa in coda.
+    """
+
+    def setUp(self):
+        reset_llm_registry()
+        self.addCleanup(reset_llm_registry)
+        cache.clear()
+        self.user = get_user_model().objects.create_user(username="coda", password="password")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        for name in ("Panca piana", "Squat", "Stacco da terra", "Trazioni"):
+            GymItem.objects.create(author=self.user, name=name)
+        self.plan = GymPlan.objects.create(author=self.user, start_date=date(2025, 1, 6), end_date=date(2025, 1, 12))
+
+    def test_async_request_is_queued_and_run_for_the_requester(self):
+        url = reverse("gymplan-generate_entire", args=[self.plan.id])
+        calls = FakeChatModel.call_count()
+        response = self.client.post(f"{url}?async=1", {"days": ["lun", "gio"]}, format="json")
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.data["status"], AIJob.STATUS_PENDING)
+        self.assertEqual(FakeChatModel.call_count(), calls)
+
+        job = claim_next_job()
+        self.assertEqual((job.pk, job.author, job.status), (response.data["job_id"], self.user, AIJob.STATUS_RUNNING))
+        self.assertIsNone(claim_next_job())
+
+        run_job(job)
+        polled = self.client.get(response.data["status_url"])
+        self.assertEqual(polled.status_code, 200)
+        self.assertEqual(polled.data["status"], AIJob.STATUS_DONE)
+        self.assertTrue(LLMUsage.objects.filter(author=self.user).exists())
+
+        # Il job è visibile solo al suo autore
+        other = APIClient()
+        other.force_authenticate(get_user_model().objects.create_user(username="altro", password="password"))
+        self.assertEqual(other.get(response.data["status_url"]).status_code, 404)
+
+    def test_other_users_plan_is_not_found(self):
+        other = APIClient()
+        other.force_authenticate(get_user_model().objects.create_user(username="altro", password="password"))
+        url = reverse("gymplan-generate_entire", args=[self.plan.id])
+
+        response = other.post(f"{url}?async=1", {"days": ["lun"]}, format="json")
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(AIJob.objects.exists())
+
+    def test_malformed_plan_response_fails_the_job_without_evaluating_it(self):
+        job = enqueue_job(self.user, "gym_plan_generation", {"plan_id": self.plan.id, "days": ["lun"]})
+        section = GymPlanSection.objects.create(author=self.user, gym_plan=self.plan, day="lun")
+        # Letterale Python, non JSON: prima veniva passato a eval()
+        malformed = SimpleNamespace(invoke=lambda inputs: SimpleNamespace(
+            content="{'lun': [{'name': 'Squat', 'sets': __import__('os').getpid()}]}"
+        ))
+
+        with mock.patch("data.pipelines.get_chain", return_value=malformed):
+            run_job(claim_next_job())
+
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.result_status), (AIJob.STATUS_FAILED, 502))
+        self.assertEqual(job.result, {"error": "Il modello ha restituito un JSON non valido."})
+        self.assertFalse(GymPlanItem.objects.filter(section=section).exists())
+
+    def test_concurrent_workers_never_claim_the_same_job(self):
+        first = enqueue_job(self.user, "goal_inference", {})
+        second = enqueue_job(self.user, "goal_inference", {})
+
+        # Un altro worker prende `first` tra la SELECT e l'UPDATE condizionale di questo worker
+        original_first = QuerySet.first
+        stolen = []
+
+        def first_then_steal(queryset):
+            job = original_first(queryset)
+            if job is not None and not stolen:
+                stolen.append(job.pk)
+                AIJob.objects.filter(pk=job.pk, status=AIJob.STATUS_PENDING).update(
+                    status=AIJob.STATUS_RUNNING, started_at=timezone.now()
+                )
+            return job
+
+        with mock.patch.object(QuerySet, "first", first_then_steal):
+            claimed = claim_next_job()
+
+        self.assertEqual(stolen, [first.pk])
+        self.assertEqual(claimed.pk, second.pk)
+        self.assertFalse(AIJob.objects.filter(status=AIJob.STATUS_PENDING).exists())
+
+    def test_stale_running_jobs_are_requeued(self):
+        stale = enqueue_job(self.user, "goal_inference", {})
+        fresh = enqueue_job(self.user, "goal_inference", {})
+        AIJob.objects.filter(pk=stale.pk).update(status=AIJob.STATUS_RUNNING,
+                                                 started_at=timezone.now() - timedelta(hours=1))
+        AIJob.objects.filter(pk=fresh.pk).update(status=AIJob.STATUS_RUNNING, started_at=timezone.now())
+
+        self.assertEqual(requeue_stale_jobs(600), 1)
+        self.assertEqual(claim_next_job().pk, stale.pk)
+
+
+class PlanCloningTests(TestCase):
+    """
+    Clonazione dei piani sulle settimane successive (data/cloning.py): date spostate, figli collegati
+    ai nuovi piani, originali invariati.
+    """
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username="cloni", password="password")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.exercise = GymItem.objects.create(author=self.user, name="Squat")
+
+        self.gym_plan = GymPlan.objects.create(author=self.user, start_date=date(2025, 1, 6),
+                                               end_date=date(2025, 1, 12), note="Forza")
+        for day in ("lun", "gio"):
+            section = GymPlanSection.objects.create(author=self.user, gym_plan=self.gym_plan, day=day, type="Full Body")
+            for order in (1, 2):
+                item = GymPlanItem.objects.create(section=section, order=order)
+                for number in (1, 2, 3):
+                    GymPlanSetDetail.objects.create(plan_item=item, exercise=self.exercise, order=number,
+                                                    set_number=number, prescribed_reps_1=8, weight=60 + number)
+
+        self.food_plan = FoodPlan.objects.create(author=self.user, start_date=date(2025, 1, 6), end_date=date(2025, 1, 12),
+                                                 max_kcal=2000, max_protein=150, max_carbs=200, max_fats=60)
+        food = FoodItem.objects.create(author=self.user, name="Riso", kcal_per_100g=360, protein_per_100g=7,
+                                       carbs_per_100g=77, fats_per_100g=1, fiber_per_100g=1)
+        for name, hour in (("Pranzo", 13), ("Cena", 20)):
+            section = FoodPlanSection.objects.create(author=self.user, name=name, start_time=hour)
+            FoodPlanItem.objects.create(food_plan=self.food_plan, food_item=food, food_section=section,
+                                        quantity_in_grams=120, eaten=True)
+
+    def gym_tree(self, plan) -> list[tuple]:
+        return list(GymPlanSetDetail.objects.filter(plan_item__section__gym_plan=plan).order_by(
+            "plan_item__section__day", "plan_item__order", "order"
+        ).values_list("plan_item__section__day", "plan_item__order", "set_number", "exercise_id", "weight"))
+
+    def test_gym_plan_is_cloned_over_several_weeks(self):
+        original_tree = self.gym_tree(self.gym_plan)
+        original_ids = set(GymPlanSetDetail.objects.values_list("id", flat=True))
+
+        new_plans = clone_gym_plan(self.gym_plan, weeks=3)
+
+        self.assertEqual([plan.start_date for plan in new_plans],
+                         [date(2025, 1, 13), date(2025, 1, 20), date(2025, 1, 27)])
+        self.assertEqual([plan.end_date for plan in new_plans],
+                         [date(2025, 1, 19), date(2025, 1, 26), date(2025, 2, 2)])
+        for plan in new_plans:
+            self.assertEqual(plan.note, "Forza")
+            self.assertEqual(GymPlanSection.objects.filter(gym_plan=plan).count(), 2)
+            self.assertEqual(GymPlanItem.objects.filter(section__gym_plan=plan).count(), 4)
+            self.assertEqual(self.gym_tree(plan), original_tree)
+
+        # L'originale non cambia e nessun set originale viene riassegnato
+        self.assertEqual(self.gym_tree(self.gym_plan), original_tree)
+        self.assertEqual(
+            set(GymPlanSetDetail.objects.filter(plan_item__section__gym_plan=self.gym_plan).values_list("id", flat=True)),
+            original_ids
+        )
+        self.assertEqual(GymItem.objects.count(), 1)
+
+    def test_food_plan_is_cloned_over_several_weeks(self):
+        new_plans = clone_food_plan(self.food_plan, weeks=2)
+
+        self.assertEqual([plan.start_date for plan in new_plans], [date(2025, 1, 13), date(2025, 1, 20)])
+        for plan in new_plans:
+            items = list(plan.foodplanitem_set.values_list("food_section__name", "quantity_in_grams", "eaten"))
+            self.assertEqual(sorted(items), [("Cena", 120, False), ("Pranzo", 120, False)])
+
+        self.assertEqual(self.food_plan.foodplanitem_set.count(), 2)
+        self.assertTrue(all(self.food_plan.foodplanitem_set.values_list("eaten", flat=True)))
+        self.assertEqual(FoodPlanSection.objects.count(), 2)
+
+    def test_weeks_outside_range_are_rejected(self):
+        for weeks in (0, 53):
+            with self.assertRaises(ValueError):
+                clone_gym_plan(self.gym_plan, weeks=weeks)
+            with self.assertRaises(ValueError):
+                clone_food_plan(self.food_plan, weeks=weeks)
+
+        for weeks in ("0", "53", "due"):
+            response = self.client.get(reverse("gymplan-clone", args=[self.gym_plan.id]), {"weeks": weeks})
+            self.assertEqual(response.status_code, 400)
+            response = self.client.get(reverse("foodplan-clone", args=[self.food_plan.id]), {"weeks": weeks})
+            self.assertEqual(response.status_code, 400)
+        self.assertEqual(GymPlan.objects.count(), 1)
+        self.assertEqual(FoodPlan.objects.count(), 1)
+
+        response = self.client.get(reverse("gymplan-clone", args=[self.gym_plan.id]), {"weeks": 2})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.data["new_plan_ids"]), 2)
+
+
+class BatchedFoodSelectionTests(SimpleTestCase):
+    """
+    Lettura della risposta unica del modello in select_best_food_items: le scelte non valide
+    lasciano None solo per il pasto interessato.
+    """
+    RICE, CHICKEN, APPLE = SimpleNamespace(name="Riso basmati"), SimpleNamespace(name="Pollo"), SimpleNamespace(name="Mela")
+
+    def select(self, meals, reply: str):
+        chain = mock.Mock()
+        chain.invoke.return_value = SimpleNamespace(content=reply)
+        with mock.patch("data.utils.get_chain", return_value=chain), mock.patch("builtins.print"):
+            return select_best_food_items(meals), chain
+
+    def test_valid_reply_with_surrounding_text(self):
+        meals = [("riso con pollo", [self.RICE, self.CHICKEN]), ("mela", [self.APPLE])]
+        selected, chain = self.select(meals, 'Ecco: [{"meal": 1, "candidate": 2}, {"meal": "2", "candidate": "1"}]')
+
+        self.assertEqual(selected, [self.CHICKEN, self.APPLE])
+        self.assertEqual(chain.invoke.call_count, 1)
+
+    def test_malformed_json_falls_back_to_none(self):
+        meals = [("riso", [self.RICE]), ("mela", [self.APPLE])]
+        self.assertEqual(self.select(meals, "Non saprei")[0], [None, None])
+        self.assertEqual(self.select(meals, '[{"meal": 1, "candidate": 1},')[0], [None, None])
+
+    def test_out_of_range_and_invalid_choices_are_ignored(self):
+        meals = [("riso", [self.RICE]), ("mela", [self.APPLE])]
+        reply = '[{"meal": 1, "candidate": 5}, {"meal": 7, "candidate": 1}, {"meal": 2, "candidate": "x"}, "mela"]'
+        self.assertEqual(self.select(meals, reply)[0], [None, None])
+
+    def test_partial_reply(self):
+        meals = [("riso", [self.RICE]), ("mela", [self.APPLE])]
+        self.assertEqual(self.select(meals, '[{"meal": 2, "candidate": 1}]')[0], [None, self.APPLE])
+
+    def test_meals_without_candidates_are_not_sent(self):
+        meals = [("tisana", []), ("riso con pollo", [self.RICE, self.CHICKEN])]
+        selected, chain = self.select(meals, '[{"meal": 1, "candidate": 1}]')
+
+        self.assertEqual(selected, [None, self.RICE])
+        prompt = chain.invoke.call_args.args[0]["meals"]
+        self.assertNotIn("tisana", prompt)
+        self.assertIn('Pasto 1: "riso con pollo"', prompt)
+
+        self.assertEqual(self.select([("tisana", [])], "[]")[1].invoke.call_count, 0)
+
+
+@override_settings(LLM_BACKEND="fake", FAKE_LLM={"LATENCY": 0, "FIXTURES": None}, LLM_CACHE={"BACKEND": None})
+class GoalInferenceJobTests(TestCase):
+    """
+    Il salvataggio del profilo non chiama il modello: l'inferenza dell'obiettivo viene accodata
+    a transazione confermata e solo quando goal_description cambia.
+    """
+
+    def setUp(self):
+        reset_llm_registry()
+        self.addCleanup(reset_llm_registry)
+        self.user = get_user_model().objects.create_user(username="obiettivo", password="password")
+
+    def create_details(self, **kwargs) -> DetailsAccount:
+        return DetailsAccount.objects.create(author=self.user, date_of_birth=date(1990, 1, 1), biological_gender="F",
+                                             height_cm=170, **kwargs)
+
+    def test_save_makes_no_llm_call_and_enqueues_on_commit(self):
+        calls = FakeChatModel.call_count()
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            details = self.create_details(goal_description="Voglio perdere 5 kg")
+
+        self.assertEqual(FakeChatModel.call_count(), calls)
+        self.assertFalse(AIJob.objects.exists())
+        self.assertEqual(len(callbacks), 1)
+
+        callbacks[0]()
+        job = AIJob.objects.get()
+        self.assertEqual((job.author, job.kind), (self.user, "goal_inference"))
+        self.assertEqual(job.payload, {"details_id": details.pk, "goal_description": "Voglio perdere 5 kg"})
+
+        run_job(claim_next_job())
+        details.refresh_from_db()
+        self.assertTrue(details.goal_targets)
+
+    def test_job_is_enqueued_only_when_the_description_changes(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            details = self.create_details(goal_description="Aumentare la massa")
+        self.assertEqual(AIJob.objects.count(), 1)
+
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            details.height_cm = 171
+            details.save()
+            reloaded = DetailsAccount.objects.get(pk=details.pk)
+            reloaded.save()
+        self.assertEqual(callbacks, [])
+
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            reloaded.goal_description = "Preparare una maratona"
+            reloaded.save()
+        self.assertEqual(len(callbacks), 1)
+        self.assertEqual(AIJob.objects.latest("id").payload["goal_description"], "Preparare una maratona")
+
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            self.create_details(goal_description="")
+        self.assertEqual(callbacks, [])
+
+
+class ImportCsvTests(TestCase):
+    """
+    Import a blocchi di `importcsv`: duplicati scartati (nel file e nel database), ripresa dal checkpoint,
+    alimenti importati presenti nell'indice di ricerca.
+    """
+    FIELDS = ["name", "barcode", "brand", "kcal_per_100g", "protein_per_100g", "carbs_per_100g", "sugars_per_100g",
+              "fats_per_100g", "saturated_fats_per_100g", "fiber_per_100g", "author_id"]
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username="import", password="password")
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "alimenti.csv")
+
+    def write_csv(self, rows: list[tuple]):
+        with open(self.path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(self.FIELDS)
+            for name, barcode, author_id in rows:
+                writer.writerow([name, barcode, "Marca", 100, 10, 20, 5, 3, 1, 2, author_id])
+
+    def run_import(self, *args):
+        call_command("importcsv", self.path, "--chunk-size", "2", *args, stdout=io.StringIO(), stderr=io.StringIO())
+
+    def test_import_skips_duplicates_and_indexes_tokens(self):
+        FoodItem.objects.create(author=self.user, name="Yogurt greco", barcode="003", kcal_per_100g=97,
+                                protein_per_100g=10, carbs_per_100g=4, fats_per_100g=5, fiber_per_100g=0)
+        self.write_csv([
+            ("Riso basmati", "001", self.user.pk),
+            ("Petto di pollo", "002", self.user.pk),
+            ("Riso basmati", "001", self.user.pk),    # duplicato nel file (altro blocco)
+            ("Yogurt greco", "003", self.user.pk),    # già nel database
+            ("Mela golden", "004", 999),              # autore inesistente
+            ("Riso basmati", "005", self.user.pk),    # stesso nome, barcode diverso
+        ])
+
+        self.run_import()
+
+        self.assertEqual(
+            sorted(FoodItem.objects.values_list("name", "barcode")),
+            [("Petto di pollo", "002"), ("Riso basmati", "001"), ("Riso basmati", "005"), ("Yogurt greco", "003")]
+        )
+        self.assertEqual([item.barcode for item, score in search_food_items(["pollo"])], ["002"])
+        self.assertEqual(FoodItemToken.objects.filter(token="basmati").count(), 2)
+        self.assertFalse(os.path.exists(f"{self.path}.checkpoint"))
+
+    def test_resume_starts_after_the_last_committed_chunk(self):
+        self.write_csv([
+            ("Riso basmati", "001", self.user.pk),
+            ("Petto di pollo", "002", self.user.pk),
+            ("Mela golden", "004", self.user.pk),
+        ])
+        # Interrotto dopo il primo blocco confermato (righe 1-2)
+        with open(f"{self.path}.checkpoint", "w", encoding="utf-8") as f:
+            json.dump({"rows": 2, "created": 2, "duplicates": 0, "errors": 0}, f)
+
+        self.run_import("--resume")
+
+        self.assertEqual(list(FoodItem.objects.values_list("name", flat=True)), ["Mela golden"])
+        self.assertEqual([item.name for item, score in search_food_items(["mela"])], ["Mela golden"])
+        self.assertFalse(os.path.exists(f"{self.path}.checkpoint"))
+
+
+class LLMCacheTests(TestCase):
+    """
+    Backend della cache delle risposte LLM (data/llm_cache.py): hit, scadenza dopo il TTL ed eviction LRU.
+    """
+    LLM_STRING = '{"kwargs": {"model_name": "gpt-4o"}}---[]'
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.location = directory.name
+
+    def backends(self, ttl=None, max_entries=None) -> list:
+        LLMCacheEntry.objects.all().delete()
+        for path in os.listdir(self.location):
+            os.remove(os.path.join(self.location, path))
+        return [
+            DatabaseLLMCache(ttl=ttl, max_entries=max_entries),
+            FileSystemLLMCache(self.location, ttl=ttl, max_entries=max_entries),
+        ]
+
+    def store(self, backend, prompt: str):
+        from langchain_core.messages import AIMessage
+        from langchain_core.outputs import ChatGeneration
+
+        backend.update(prompt, self.LLM_STRING, [ChatGeneration(message=AIMessage(content=f"risposta a {prompt}"))])
+
+    def set_last_access(self, backend, prompt: str, seconds_ago: int):
+        from data.llm_cache import make_cache_key
+
+        key = make_cache_key(prompt, self.LLM_STRING)
+        moment = time.time() - seconds_ago
+        if isinstance(backend, DatabaseLLMCache):
+            LLMCacheEntry.objects.filter(key=key).update(
+                last_accessed_at=timezone.make_aware(datetime.fromtimestamp(moment))
+            )
+        else:
+            os.utime(backend._path(key), (moment, moment))
+
+    def test_hit_and_miss(self):
+        for backend in self.backends(ttl=60):
+            with self.subTest(backend=type(backend).__name__):
+                self.assertIsNone(backend.lookup("ciao", self.LLM_STRING))
+                self.store(backend, "ciao")
+
+                generations = backend.lookup("ciao", self.LLM_STRING)
+                self.assertEqual(generations[0].message.content, "risposta a ciao")
+                self.assertTrue(generations[0].message.response_metadata["cached"])
+                self.assertIsNone(backend.lookup("ciao", '{"kwargs": {"model_name": "gpt-4o-mini"}}---[]'))
+
+    def test_entry_expires_after_ttl(self):
+        for backend in self.backends(ttl=60):
+            with self.subTest(backend=type(backend).__name__):
+                self.store(backend, "ciao")
+                later = time.time() + 61
+                with mock.patch("data.llm_cache.time.time", return_value=later), \
+                        mock.patch("data.llm_cache.timezone.now",
+                                   return_value=timezone.make_aware(datetime.fromtimestamp(later))):
+                    self.assertIsNone(backend.lookup("ciao", self.LLM_STRING))
+                self.assertIsNone(backend.lookup("ciao", self.LLM_STRING))
+
+    def test_least_recently_used_entries_are_evicted(self):
+        for backend in self.backends(max_entries=2):
+            with self.subTest(backend=type(backend).__name__):
+                self.store(backend, "primo")
+                self.store(backend, "secondo")
+                self.set_last_access(backend, "primo", 20)
+                self.set_last_access(backend, "secondo", 10)
+
+                # Letto di recente: sopravvive anche se è il più vecchio
+                self.assertIsNotNone(backend.lookup("primo", self.LLM_STRING))
+                self.store(backend, "terzo")
+
+                self.assertIsNone(backend.lookup("secondo", self.LLM_STRING))
+                self.assertIsNotNone(backend.lookup("primo", self.LLM_STRING))
+                self.assertIsNotNone(backend.lookup("terzo", self.LLM_STRING))
+
+
+    def test_eviction_runs_once_per_interval(self):
+        for backend in self.backends(max_entries=1):
+            backend.evict_interval = 60
+            with self.subTest(backend=type(backend).__name__):
+                started = time.monotonic()
+                with mock.patch("data.llm_cache.time.monotonic", return_value=started):
+                    self.store(backend, "primo")
+                    self.set_last_access(backend, "primo", 10)
+                    self.store(backend, "secondo")
+                # Nessuna pulizia nell'intervallo: entrambe le voci restano
+                self.assertIsNotNone(backend.lookup("primo", self.LLM_STRING))
+                self.set_last_access(backend, "primo", 10)
+
+                with mock.patch("data.llm_cache.time.monotonic", return_value=started + 61):
+                    self.store(backend, "terzo")
+                self.assertIsNone(backend.lookup("primo", self.LLM_STRING))
+                self.assertIsNone(backend.lookup("secondo", self.LLM_STRING))
+                self.assertIsNotNone(backend.lookup("terzo", self.LLM_STRING))
+
+    @override_settings(LLM_BACKEND="fake", FAKE_LLM={"LATENCY": 0, "FIXTURES": None},
+                       LLM_CACHE={"BACKEND": "database", "TTL": None, "MAX_ENTRIES": None})
+    def test_creative_models_and_regenerated_texts_skip_the_cache(self):
+        from .utils import get_chain, get_llm
+
+        reset_llm_registry()
+        self.addCleanup(reset_llm_registry)
+        self.addCleanup(set_llm_cache, None)
+
+        self.assertIs(get_llm("llm_4o_creativa").cache, False)
+        self.assertIs(get_llm("llm_4o_semicreativa", cached=True).cache, False)
+        self.assertIsNone(get_llm("llm_3_5_turbo").cache)
+
+        inputs = {"weights": "2025-01-06: 80 kg", "goal": "fitness"}
+        calls = FakeChatModel.call_count()
+        get_chain("weight_analysis").invoke(inputs)
+        get_chain("weight_analysis").invoke(inputs)
+        self.assertEqual(FakeChatModel.call_count() - calls, 1)
+
+        note_inputs = {"plan_data": "lun: Panca piana 4x8"}
+        calls = FakeChatModel.call_count()
+        get_chain("food_plan_note").invoke(note_inputs)
+        get_chain("food_plan_note").invoke(note_inputs)
+        self.assertEqual(FakeChatModel.call_count() - calls, 2)
+
+
+class ContentAddressedMediaTests(TestCase):
+    """
+    I file e le varianti condivisi tra più upload vengono eliminati solo dopo il commit
+    e solo quando nessun upload li usa più.
+    """
+
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        self.media_root = media_root.name
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def image_bytes(self, color=(200, 40, 40)):
+        from PIL import Image
+
+        buffer = io.BytesIO()
+        Image.new("RGB", (800, 600), color).save(buffer, format="JPEG")
+        return buffer.getvalue()
+
+    def upload(self, name="esercizio.jpg", color=(200, 40, 40)):
+        return GymMediaUpload.objects.create(file=SimpleUploadedFile(name, self.image_bytes(color)))
+
+    def exists(self, name):
+        return os.path.exists(os.path.join(self.media_root, name))
+
+    def variant_files(self, upload):
+        return [size[key] for size in upload.variants["sizes"].values() for key in ("jpeg", "webp")]
+
+    def test_variants_are_shared_by_content_hash(self):
+        first, second = self.upload("a.jpg"), self.upload("b.jpg")
+
+        self.assertEqual(first.file.name, second.file.name)
+        self.assertEqual(first.variants, second.variants)
+        digest = os.path.splitext(os.path.basename(first.file.name))[0]
+        for path in self.variant_files(first):
+            self.assertIn(f"/{digest[:2]}/{digest}/", path)
+            self.assertTrue(self.exists(path))
+
+    def test_shared_files_are_deleted_after_commit_with_the_last_upload(self):
+        first, second = self.upload("a.jpg"), self.upload("b.jpg")
+        files = [first.file.name, *self.variant_files(first)]
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertTrue(all(self.exists(name) for name in files))
+
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            second.delete()
+            # Prima del commit la riga potrebbe ancora tornare (rollback): i file restano
+            self.assertTrue(all(self.exists(name) for name in files))
+        self.assertEqual(len(callbacks), 2)
+        self.assertFalse(any(self.exists(name) for name in files))
+
+    def test_rolled_back_delete_keeps_the_file(self):
+        from django.db import transaction
+
+        upload = self.upload()
+
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            with self.assertRaises(RuntimeError), transaction.atomic():
+                GymMediaUpload.objects.get(pk=upload.pk).delete()
+                raise RuntimeError
+        self.assertEqual(callbacks, [])
+        self.assertTrue(GymMediaUpload.objects.filter(pk=upload.pk).exists())
+        self.assertTrue(self.exists(upload.file.name))
+
+    def test_dedupe_media_collapses_files_and_variants(self):
+        uploads = []
+        for name in ("gym_media/0.jpg", "gym_media/0_018Bt2I.jpg"):
+            path = os.path.join(self.media_root, name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "wb") as f:
+                f.write(self.image_bytes())
+
+            # Upload con nome e varianti precedenti allo storage per contenuto (una cartella per upload)
+            upload = GymMediaUpload.objects.create(file=name)
+            legacy = f"gym_media/variants/{upload.pk}/thumb.jpg"
+            os.makedirs(os.path.join(self.media_root, os.path.dirname(legacy)), exist_ok=True)
+            open(os.path.join(self.media_root, legacy), "wb").close()
+            GymMediaUpload.objects.filter(pk=upload.pk).update(variants={
+                "source": name, "sizes": {"thumb": {"jpeg": legacy, "width": 160, "height": 120}},
+            })
+            uploads.append((upload.pk, name, legacy))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command("dedupe_media", stdout=io.StringIO(), stderr=io.StringIO())
+
+        first, second = (GymMediaUpload.objects.get(pk=pk) for pk, _, _ in uploads)
+        self.assertEqual(first.file.name, second.file.name)
+        self.assertEqual(first.variants, second.variants)
+        self.assertEqual(len(self.variant_files(first)), 6)
+        self.assertTrue(all(self.exists(path) for path in self.variant_files(first)))
+        for _, name, legacy in uploads:
+            self.assertFalse(self.exists(name))
+            self.assertFalse(self.exists(legacy))
+
+
+@override_settings(LLM_BACKEND="fake", FAKE_LLM={"LATENCY": 0, "FIXTURES": None}, LLM_CACHE={"BACKEND": None})
+class ServerSentEventsTests(TestCase):
+    """
+    Le view in streaming rispondono ai client SSE (Accept: text/event-stream) con eventi `data:`
+    e richiedono l'autenticazione.
+    """
+    databases = {"default", "replica"}
+
+    def setUp(self):
+        reset_llm_registry()
+        self.addCleanup(reset_llm_registry)
+        cache.clear()
+
+        self.user = get_user_model().objects.create_user(username="atleta", password="password")
+        DetailsAccount.objects.create(author=self.user, date_of_birth=date(1990, 1, 1), biological_gender="M",
+                                      height_cm=180, goal_targets="fitness")
+        Weight.objects.create(author=self.user, weight_value=80, date_recorded=date(2025, 1, 6))
+        self.plan = GymPlan.objects.create(author=self.user, start_date=date(2025, 1, 6), end_date=date(2025, 1, 12))
+
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def events(self, response):
+        return [frame for frame in b"".join(response.streaming_content).decode().split("\n\n") if frame]
+
+    def test_event_stream_accept_header_streams_data_frames(self):
+        for url in (reverse("weight-analysis-stream"), reverse("gymplan-generate-note-stream", args=[self.plan.pk])):
+            with self.subTest(url=url):
+                response = self.client.get(url, HTTP_ACCEPT="text/event-stream")
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response["Content-Type"], "text/event-stream")
+
+                events = self.events(response)
+                self.assertGreater(len(events), 1)
+                self.assertTrue(all(frame.startswith("data: ") for frame in events[:-1]))
+                self.assertTrue(events[-1].startswith("event: done\ndata: "))
+                deltas = "".join(json.loads(frame[len("data: "):])["delta"] for frame in events[:-1])
+                self.assertEqual(json.loads(events[-1].split("data: ", 1)[1])["text"], deltas.strip())
+
+    def test_errors_are_sent_as_error_event(self):
+        response = self.client.get(reverse("gymplan-generate-note-stream", args=[self.plan.pk + 1]),
+                                   HTTP_ACCEPT="text/event-stream")
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.content.decode(), 'event: error\ndata: {"error":"GymPlan non trovata."}\n\n')
+
+    def test_function_stream_views_require_authentication(self):
+        anonymous = APIClient()
+        for name in ("gymplansection-generate-note-stream", "gymplan-generate-note-stream",
+                     "gymplanitem-generate-note-stream"):
+            with self.subTest(name=name):
+                response = anonymous.get(reverse(name, args=[self.plan.pk]), HTTP_ACCEPT="text/event-stream")
+                self.assertEqual(response.status_code, 403)
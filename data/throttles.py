@@ -0,0 +1,19 @@
+from rest_framework.throttling import BaseThrottle
+
+from data.usage import quota_exceeded, seconds_until_reset
+
+
+class LLMQuotaThrottle(BaseThrottle):
+    """
+    Blocca con 429 le view AI quando l'utente ha esaurito la quota giornaliera di token
+    (data/usage.py). Le view AI richiedono l'autenticazione: i consumi sono sempre di un utente.
+    """
+
+    def allow_request(self, request, view):
+        user = request.user
+        if not user or not user.is_authenticated:
+            return True
+        return not quota_exceeded(user)
+
+    def wait(self):
+        return seconds_until_reset()
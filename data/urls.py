@@ -25,7 +25,9 @@ from .views import (
     FoodPlanGenerateAlternativeAIView, FoodPlanCloneView, GymPlanCloneView, GymPlanClassifyDectionAIView,
     GymPlanGenerateNoteAIView, GymPlanSectionGenerateNoteAIView, GymPlanItemGenerateNoteAIView,
     GymPlanGenerateEntirePlanAIView, GymPlanItemGenerateAlternativeAIView, GymPlanItemGenerateWarmupAIView,
-    GymPlanSetDetailGenerateSuggestedWeightAIView
+    GymPlanSetDetailGenerateSuggestedWeightAIView, AIJobRetrieveView, WeightAnalysisStreamAIView,
+    BodyMeasurementAnalysisStreamView, GymPlanGenerateNoteStreamAIView, GymPlanSectionGenerateNoteStreamAIView,
+    GymPlanItemGenerateNoteStreamAIView
 )
 
 urlpatterns = [
@@ -39,6 +41,7 @@ urlpatterns = [
     path('weight/update/<int:pk>/', WeightUpdateView.as_view(), name='weight-update'),
     path('weight/delete/<int:pk>/', WeightDeleteView.as_view(), name='weight-delete'),
     path("weight/analysis/", WeightAnalysisAIView.as_view(), name="weight-analysis"),
+    path("weight/analysis/stream/", WeightAnalysisStreamAIView.as_view(), name="weight-analysis-stream"),
 
     # Body Measurements
     path('body-measurement/me/', BodyMeasurementListView.as_view(), name='body-list'),
@@ -47,6 +50,7 @@ urlpatterns = [
     path('body-measurement/update/<int:pk>/', BodyMeasurementUpdateView.as_view(), name='body-update'),
     path('body-measurement/delete/<int:pk>/', BodyMeasurementDeleteView.as_view(), name='body-delete'),
     path("body-measurement/analysis/", BodyMeasurementAnalysisView.as_view(), name="body-analysis"),
+    path("body-measurement/analysis/stream/", BodyMeasurementAnalysisStreamView.as_view(), name="body-analysis-stream"),
 
     # Food Items
     path('food-item/', FoodItemListView.as_view(), name='fooditem-list'),
@@ -100,6 +104,7 @@ urlpatterns = [
     path('gym-plan/delete/<int:pk>/', GymPlanDeleteView.as_view(), name='gymplan-delete'),
     path('gym-plan/clone/<int:pk>/', GymPlanCloneView, name='gymplan-clone'),
     path('gym-plan/generate-note/<int:pk>/', GymPlanGenerateNoteAIView, name='gymplan-generate-note'),
+    path('gym-plan/generate-note/<int:pk>/stream/', GymPlanGenerateNoteStreamAIView, name='gymplan-generate-note-stream'),
     path('gym-plan/generate-entire/<int:pk>/', GymPlanGenerateEntirePlanAIView, name='gymplan-generate_entire'),
 
     # Gym Plan Items
@@ -109,6 +114,7 @@ urlpatterns = [
     path('gym-plan-item/delete/<int:pk>/', GymPlanItemDeleteView.as_view(), name='gymplanitem-delete'),
     path('gym-plan-item/first-available-order/<int:section_id>/', get_first_available_order, name='first_available_order'),
     path('gym-plan-item/generate-note/<int:pk>/', GymPlanItemGenerateNoteAIView, name='gymplanitem-generate-note'),
+    path('gym-plan-item/generate-note/<int:pk>/stream/', GymPlanItemGenerateNoteStreamAIView, name='gymplanitem-generate-note-stream'),
     path('gym-plan-item/generate-alternative/<int:pk>/', GymPlanItemGenerateAlternativeAIView, name='gymplanitem-generate-alternative'),
     path('gym-plan-item/generate-warmup/<int:pk>/', GymPlanItemGenerateWarmupAIView, name='gymplanitem-generate-warmup'),
 
@@ -120,6 +126,7 @@ urlpatterns = [
     path('gym-plan-section/delete/<int:pk>/', GymPlanSectionDeleteView.as_view(), name='gymplansection-delete'),
     path('gym-plan-section/classify/<int:pk>/', GymPlanClassifyDectionAIView, name='gymplansection-classify'),
     path('gym-plan-section/generate-note/<int:pk>/', GymPlanSectionGenerateNoteAIView, name='gymplansection-generate-note'),
+    path('gym-plan-section/generate-note/<int:pk>/stream/', GymPlanSectionGenerateNoteStreamAIView, name='gymplansection-generate-note-stream'),
 
     # Gym Plan Set Detail
     path('gym-plan-set/<int:pk>/', GymPlanSetDetailRetrieveView.as_view(), name='gymplanset-detail'),
@@ -133,4 +140,7 @@ urlpatterns = [
     path('gym-media-upload/create/', GymMediaUploadCreateView.as_view(), name='gymmediaupload-create'),
     path('gym-media-upload/update/<int:pk>/', GymMediaUploadUpdateView.as_view(), name='gymmediaupload-update'),
     path('gym-media-upload/delete/<int:pk>/', GymMediaUploadDeleteView.as_view(), name='gymmediaupload-delete'),
+
+    # AI Job (pipeline eseguite in coda, vedi data/jobs.py)
+    path('ai-job/<int:pk>/', AIJobRetrieveView.as_view(), name='aijob-detail'),
 ]
@@ -0,0 +1,103 @@
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+
+
+# ======== CONSUMO DI TOKEN E QUOTE ========
+# I token spesi da ogni richiesta (o job) vengono registrati per utente, catena e modello
+# (LLMUsage) e sommati nei totali giornalieri (LLMUsageDaily). Prima di eseguire una view AI
+# o un job si controlla che l'utente non abbia superato la sua quota giornaliera. Il totale del
+# giorno viene letto da LLMUsageDaily (una query sull'indice di author e day): una cache locale al
+# processo non vedrebbe i consumi registrati dagli altri worker e moltiplicherebbe la quota.
+#
+# Le risposte servite dalla cache LLM non consumano token e non pesano sulla quota.
+
+def seconds_until_reset() -> int:
+    """
+    Secondi mancanti alla mezzanotte locale, quando la quota giornaliera si azzera.
+    """
+    now = timezone.localtime()
+    midnight = timezone.make_aware(datetime.combine(now.date() + timedelta(days=1), time.min))
+    return max(1, int((midnight - now).total_seconds()))
+
+
+def get_daily_quota(user) -> int | None:
+    """
+    Quota giornaliera di token dell'utente: quella personalizzata (LLMQuota) se presente,
+    altrimenti settings.LLM_QUOTA["DAILY_TOKENS"]. None = nessun limite.
+    """
+    from data.models import LLMQuota
+
+    quota = LLMQuota.objects.filter(author=user).first()
+    if quota is not None:
+        return quota.daily_tokens
+    return settings.LLM_QUOTA["DAILY_TOKENS"]
+
+
+def get_quota_status(user) -> tuple[int, int | None]:
+    """
+    Ritorna (token usati oggi, quota giornaliera).
+    """
+    from data.models import LLMUsageDaily
+
+    quota = get_daily_quota(user)
+    used = LLMUsageDaily.objects.filter(author=user, day=timezone.localdate()).aggregate(
+        total=Sum(F("input_tokens") + F("output_tokens"))
+    )["total"] or 0
+    return used, quota
+
+
+def quota_exceeded(user) -> bool:
+    used, quota = get_quota_status(user)
+    return quota is not None and used >= quota
+
+
+def record_llm_usage(user, chains: dict):
+    """
+    Registra i consumi di una richiesta o di un job e aggiorna i totali giornalieri.
+
+    :param user: utente a cui addebitare i token
+    :param chains: statistiche per catena raccolte da data/middleware.py
+                   ({nome: {"model", "calls", "cached", "input_tokens", "output_tokens", ...}})
+    """
+    from data.models import LLMUsage, LLMUsageDaily
+
+    day = timezone.localdate()
+    with transaction.atomic():
+        LLMUsage.objects.bulk_create([
+            LLMUsage(
+                author=user,
+                chain=chain,
+                model_name=stats["model"],
+                calls=stats["calls"],
+                cached_calls=stats["cached"],
+                input_tokens=stats["input_tokens"],
+                output_tokens=stats["output_tokens"],
+            )
+            for chain, stats in chains.items()
+        ])
+
+        for chain, stats in chains.items():
+            increments = {
+                "calls": F("calls") + stats["calls"],
+                "cached_calls": F("cached_calls") + stats["cached"],
+                "input_tokens": F("input_tokens") + stats["input_tokens"],
+                "output_tokens": F("output_tokens") + stats["output_tokens"],
+            }
+            rollup = LLMUsageDaily.objects.filter(author=user, day=day, chain=chain, model_name=stats["model"])
+            if rollup.update(**increments):
+                continue
+            try:
+                with transaction.atomic():
+                    LLMUsageDaily.objects.create(
+                        author=user, day=day, chain=chain, model_name=stats["model"],
+                        calls=stats["calls"], cached_calls=stats["cached"],
+                        input_tokens=stats["input_tokens"], output_tokens=stats["output_tokens"],
+                    )
+            except IntegrityError:
+                # Un'altra richiesta ha creato la riga nel frattempo
+                rollup.update(**increments)
+
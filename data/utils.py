@@ -1,47 +1,228 @@
-import base64
+import contextvars
 import json
 import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
-from django.db import transaction
-from django.db.models import Q
+from django.conf import settings
+from django.db import connections, transaction
 
-from langchain_openai import ChatOpenAI
-from langchain_core.prompts import PromptTemplate
-from langchain_core.messages import HumanMessage
+from data.search import search_food_items, DEFAULT_SEARCH_LIMIT
 
 import os
-from dotenv import load_dotenv
 
-# Carica variabili da .env (OPENAI_API_KEY)
-load_dotenv()
-
-def find_matching_food_items(keywords: list[str]):
-    from data.models import FoodItem
-    query = Q()
-    for kw in keywords:
-        query |= Q(name__icontains=kw)
-    return list(FoodItem.objects.filter(query).distinct())
+def find_matching_food_items(keywords: list[str], limit: int = DEFAULT_SEARCH_LIMIT):
+    """
+    Restituisce i migliori candidati (al massimo `limit`) per le parole chiave indicate,
+    usando l'indice di ricerca degli alimenti invece di una scansione con LIKE '%kw%'.
+    """
+    return [item for item, score in search_food_items(keywords, limit=limit)]
 
 # === Configurazione LLM ===
-llm_3_5_turbo = ChatOpenAI(temperature=0, model="gpt-3.5-turbo", api_key=os.getenv("OPENAI_API_KEY"))
+# Client e catene vengono costruiti solo al primo utilizzo (get_llm / get_chain): importare questo
+# modulo non carica LangChain né crea client OpenAI, quindi django.setup(), le migrazioni e i comandi
+# di gestione che non usano l'IA partono senza pagarne il costo.
+# I prompt restano semplici stringhe e ogni catena è registrata in CHAINS come (prompt, nome_modello).
+
+LLM_MODELS = {
+    "llm_3_5_turbo": {"model": "gpt-3.5-turbo", "temperature": 0},
+    "llm_4o_mini": {"model": "gpt-4o-mini", "temperature": 0},
+    "llm_4o": {"model": "gpt-4o", "temperature": 0},
+    "llm_4o_semicreativa": {"model": "gpt-4o", "temperature": 0.5},
+    "llm_4o_creativa": {"model": "gpt-4o", "temperature": 0.9},
+}
+
+CHAINS = {}
+
+# Catene che a ogni richiesta devono dare un testo nuovo ("genera alternativa", note rigenerabili):
+# non passano mai dalla cache delle risposte (data/llm_cache.py), come i modelli con temperatura > 0
+UNCACHED_CHAINS = {
+    "food_plan_alternative_meals",
+    "gym_item_generate_alternative",
+    "food_plan_section_note",
+    "food_plan_note",
+    "food_plan_item_note",
+}
+
+_llms = {}
+_chains = {}
+_llm_registry_lock = threading.RLock()
+
+def get_llm(name: str, cached: bool = True):
+    """
+    Ritorna il client indicato in LLM_MODELS, creandolo al primo utilizzo: `ChatOpenAI`, oppure
+    il modello fittizio di data/fake_llm.py se settings.LLM_BACKEND == "fake".
+    La prima costruzione carica anche il file .env (OPENAI_API_KEY) e configura la cache
+    persistente delle risposte (data/llm_cache.py).
+
+    :param cached: False per un client che non usa la cache delle risposte; i modelli con
+                   temperatura > 0 non la usano mai, altrimenti risponderebbero sempre con lo stesso testo
+    """
+    with _llm_registry_lock:
+        config = LLM_MODELS[name]
+        cached = cached and config["temperature"] == 0
+        key = (name, cached)
+        if key not in _llms:
+            from dotenv import load_dotenv
+            from data.llm_cache import configure_llm_cache
+            from data.middleware import llm_metrics_callback
+
+            if not _llms:
+                # Carica variabili da .env (OPENAI_API_KEY)
+                load_dotenv()
+                # Cache persistente delle risposte: prompt identici (stesso modello e temperatura)
+                # non vengono più pagati né attesi una seconda volta
+                configure_llm_cache()
+
+            # None = cache globale di LangChain, False = nessuna cache
+            cache = None if cached else False
+
+            if settings.LLM_BACKEND == "fake":
+                from data.fake_llm import FakeChatModel, load_fixtures
+
+                _llms[key] = FakeChatModel(
+                    model_name=config["model"],
+                    temperature=config["temperature"],
+                    latency=settings.FAKE_LLM["LATENCY"],
+                    fixtures=load_fixtures(settings.FAKE_LLM["FIXTURES"]),
+                    stream_usage=True,
+                    cache=cache,
+                    callbacks=[llm_metrics_callback]
+                )
+            else:
+                from langchain_openai import ChatOpenAI
+
+                _llms[key] = ChatOpenAI(
+                    api_key=os.getenv("OPENAI_API_KEY"),
+                    # Senza, le risposte in streaming non riportano i token: niente metriche né quota
+                    stream_usage=True,
+                    cache=cache,
+                    callbacks=[llm_metrics_callback],
+                    **config
+                )
+        return _llms[key]
+
+
+def reset_llm_registry():
+    """
+    Svuota client e catene già costruiti: alla prossima richiesta vengono ricreati con i settings correnti
+    (es. dopo aver cambiato LLM_BACKEND o LLM_CACHE in un benchmark).
+    """
+    with _llm_registry_lock:
+        _llms.clear()
+        _chains.clear()
+
+
+def get_chain(name: str):
+    """
+    Ritorna la catena LangChain (prompt | modello) registrata in CHAINS, costruendola al primo utilizzo.
+    """
+    with _llm_registry_lock:
+        if name not in _chains:
+            from langchain_core.prompts import PromptTemplate
+
+            prompt, llm_name = CHAINS[name]
+            llm = get_llm(llm_name, cached=name not in UNCACHED_CHAINS)
+            # Il nome della catena viaggia nei metadata della run: lo usano il backend fittizio e le callback
+            _chains[name] = (PromptTemplate.from_template(prompt) | llm).with_config(
+                run_name=name,
+                metadata={"chain": name}
+            )
+        return _chains[name]
+
+
+def stream_chain(name: str, inputs: dict, on_complete=None):
+    """
+    Generatore che restituisce i frammenti di testo della catena `name` man mano che il modello li produce
+    (usato dalle view SSE per inviare i token al client senza attendere la risposta completa).
+
+    :param name: nome della catena registrata in CHAINS
+    :param inputs: variabili del prompt
+    :param on_complete: funzione opzionale chiamata con il testo finale completo (es. per salvarlo nel DB)
+    """
+    parts = []
+    for chunk in get_chain(name).stream(inputs):
+        text = getattr(chunk, "content", "") or ""
+        if text:
+            parts.append(text)
+            yield text
+
+    if on_complete:
+        on_complete("".join(parts).strip())
+
+
+# === Esecuzione concorrente delle chiamate LLM ===
+# Le chiamate indipendenti (es. un alimento da generare per ogni pasto, un nome da normalizzare per
+# ogni esercizio) vengono inviate insieme a un pool di thread condiviso: la latenza complessiva si
+# avvicina a quella della chiamata più lenta invece che alla somma. Il pool è unico per processo,
+# quindi settings.LLM_MAX_CONCURRENCY limita le richieste simultanee verso il provider anche quando
+# più view lo usano contemporaneamente.
+
+_llm_executor = None
+_llm_executor_lock = threading.Lock()
+
+def get_llm_executor() -> ThreadPoolExecutor:
+    global _llm_executor
+    with _llm_executor_lock:
+        if _llm_executor is None:
+            _llm_executor = ThreadPoolExecutor(
+                max_workers=max(1, settings.LLM_MAX_CONCURRENCY),
+                thread_name_prefix="llm"
+            )
+    return _llm_executor
+
+
+def _run_in_worker(func, *args):
+    from data.middleware import track_queries
+
+    try:
+        with track_queries():
+            return func(*args)
+    finally:
+        # Le eventuali connessioni al DB aperte dal thread del pool non devono restare appese
+        connections.close_all()
 
-llm_4o_mini = ChatOpenAI(temperature=0, model="gpt-4o-mini", api_key=os.getenv("OPENAI_API_KEY"))
 
-llm_4o = ChatOpenAI(model="gpt-4o", temperature=0, api_key=os.getenv("OPENAI_API_KEY"))
-llm_4o_semicreativa = ChatOpenAI(model="gpt-4o", temperature=0.5, api_key=os.getenv("OPENAI_API_KEY"))
-llm_4o_creativa = ChatOpenAI(model="gpt-4o", temperature=0.9, api_key=os.getenv("OPENAI_API_KEY"))
+def run_concurrently(func, args_list: list) -> list:
+    """
+    Esegue `func` su ogni elemento di `args_list` in parallelo (al massimo LLM_MAX_CONCURRENCY
+    chiamate alla volta) e ritorna i risultati nello stesso ordine degli argomenti.
+
+    :param func: funzione da eseguire; riceve l'elemento così com'è, oppure spacchettato se è una tupla
+    :param args_list: lista di argomenti, uno per chiamata
+    :return: lista dei risultati; un'eccezione sollevata da una chiamata viene rilanciata qui
+
+    Le funzioni inviate dovrebbero limitarsi alla chiamata LLM: le scritture sul DB vanno fatte
+    dal chiamante, sul thread della richiesta, dopo aver raccolto i risultati.
+
+    Esempio:
+        run_concurrently(parse_exercise_name, [("Squat", names), ("Panca piana", names)])
+        → ["Barbell Squat", "Bench Press"]
+    """
+    calls = [args if isinstance(args, tuple) else (args,) for args in args_list]
+    if len(calls) <= 1:
+        return [func(*args) for args in calls]
+
+    executor = get_llm_executor()
+    # Ogni chiamata gira in una copia del contesto corrente: le metriche della richiesta
+    # (data/middleware.py) raccolgono anche query e chiamate LLM eseguite nei thread del pool
+    futures = [
+        executor.submit(contextvars.copy_context().run, _run_in_worker, func, *args)
+        for args in calls
+    ]
+    return [future.result() for future in futures]
 
 
 
 
-goals_target_prompt = PromptTemplate.from_template("""
+goals_target_prompt = """
 Dato il seguente obiettivo descritto da un utente, restituisci una sola parola tra:
 fitness, bodybuilding, powerlifting, streetlifting.
 
 Descrizione: "{description}"
 
 Risposta:
-""")
+"""
 
 # Questa riga crea una catena LangChain combinando il prompt definito sopra con un modello linguistico (ad es. GPT-3.5).
 # La catena si occupa di ricevere in input una descrizione testuale dell'obiettivo dell'utente
@@ -55,7 +236,7 @@ Risposta:
 #
 # Questo approccio consente di offrire una classificazione intelligente e flessibile, utile per personalizzare 
 # programmi di allenamento, raccomandazioni nutrizionali o percorsi utente su piattaforme fitness.
-goals_target_chain = goals_target_prompt | llm_3_5_turbo
+CHAINS["goals_target"] = (goals_target_prompt, "llm_3_5_turbo")
 
 def infer_goal_target(description: str) -> str:
     """
@@ -74,7 +255,7 @@ def infer_goal_target(description: str) -> str:
         infer_goal_target("Voglio migliorare la mia forza massimale nello squat") --> "powerlifting"
     """
     try:
-        result = goals_target_chain.invoke({"description": description})
+        result = get_chain("goals_target").invoke({"description": description})
         return getattr(result, "content", "").strip().lower()
     except Exception as e:
         print(f"Errore LangChain/OpenAI: {e}")
@@ -83,13 +264,13 @@ def infer_goal_target(description: str) -> str:
 
 
 
-goal_description_prompt = PromptTemplate.from_template("""
+goal_description_prompt = """
 Hai classificato l'obiettivo utente come "{category}".
 Obiettivo dell'utente: "{description}"
 
 Spiega brevemente (massimo 300 caratteri) perché questa categoria è la più adatta.
 Risposta:
-""")
+"""
 
 # Questa catena LangChain utilizza un modello linguistico (es. GPT-3.5) per generare una spiegazione sintetica
 # della classificazione precedentemente assegnata all’obiettivo dell’utente.
@@ -99,7 +280,7 @@ Risposta:
 #
 # Questo è utile per mostrare all’utente una giustificazione “umana” alla categorizzazione ricevuta,
 # migliorando la fiducia nell’algoritmo e facilitando eventuali correzioni o interventi da parte di un trainer.
-goal_description_chain = goal_description_prompt | llm_3_5_turbo
+CHAINS["goal_description"] = (goal_description_prompt, "llm_3_5_turbo")
 
 def explain_goal_target(description: str, category: str) -> str:
     """
@@ -120,7 +301,7 @@ def explain_goal_target(description: str, category: str) -> str:
         --> "Perché l'obiettivo si concentra sull'estetica muscolare, tipico del bodybuilding."
     """
     try:
-        result = goal_description_chain.invoke({
+        result = get_chain("goal_description").invoke({
             "description": description,
             "category": category
         })
@@ -132,7 +313,7 @@ def explain_goal_target(description: str, category: str) -> str:
 
     
 
-weight_analysis_prompt = PromptTemplate.from_template("""
+weight_analysis_prompt = """
 L'utente ha come obiettivo "{goal}".
 Ecco i suoi dati di peso nel tempo:
 
@@ -140,7 +321,7 @@ Ecco i suoi dati di peso nel tempo:
 
 Scrivi un'analisi sintetica (massimo 500 caratteri) sull'andamento del peso rispetto all'obiettivo.
 Sii chiaro, professionale e conciso.
-""")
+"""
 
 # Questa catena LangChain prende in input:
 # - l’obiettivo dell’utente (es. "bodybuilding", "fitness", ecc.)
@@ -150,7 +331,7 @@ Sii chiaro, professionale e conciso.
 # L'analisi è pensata per essere utile come feedback automatico nei report utente, dashboard, o interfacce di coaching.
 # Il modello valuta se il trend del peso è coerente con l’obiettivo indicato (es. aumento per bodybuilding, calo per fitness),
 # e restituisce un testo sintetico, massimo 500 caratteri, che commenta in modo chiaro e oggettivo l’andamento registrato.
-weight_analysis_chain = weight_analysis_prompt | llm_3_5_turbo
+CHAINS["weight_analysis"] = (weight_analysis_prompt, "llm_3_5_turbo")
 
 def generate_weight_analysis(weights: list, goal: str) -> str:
     """
@@ -170,19 +351,30 @@ def generate_weight_analysis(weights: list, goal: str) -> str:
     Questo tipo di feedback può essere integrato in app di monitoraggio o dashboard fitness per fornire
     valutazioni intelligenti e contestuali, migliorando l’interazione e la motivazione dell’utente.
     """
-    weights_str = "\n".join(f"{date}: {weight}kg" for date, weight in weights)
     try:
-        result = weight_analysis_chain.invoke({"goal": goal, "weights": weights_str})
+        result = get_chain("weight_analysis").invoke({"goal": goal, "weights": format_weight_history(weights)})
         text = getattr(result, "content", "").strip()
         return text.strip()
     except Exception as e:
         print(f"Errore durante l'analisi IA: {e}")
         return "Errore durante l'analisi IA."
+
+
+def format_weight_history(weights: list) -> str:
+    # Una riga per pesata, es. "2025-04-01: 83.2kg"
+    return "\n".join(f"{date}: {weight}kg" for date, weight in weights)
+
+
+def stream_weight_analysis(weights: list, goal: str):
+    """
+    Variante in streaming di `generate_weight_analysis`: genera i frammenti dell'analisi man mano che arrivano.
+    """
+    return stream_chain("weight_analysis", {"goal": goal, "weights": format_weight_history(weights)})
     
 
 
 
-body_measurement_analysis_prompt = PromptTemplate.from_template("""
+body_measurement_analysis_prompt = """
 L'utente ha come obiettivo: "{goal}".
 Questi sono i suoi dati di misurazione corporea nel tempo:
 
@@ -190,7 +382,7 @@ Questi sono i suoi dati di misurazione corporea nel tempo:
 
 Scrivi un'analisi sintetica (massimo 500 caratteri) sull'andamento delle singole aree corporee rispetto all'obiettivo.
 Sii chiaro, professionale e conciso.
-""")
+"""
 
 # Questa catena LangChain combina il prompt testuale con un modello LLM (es. GPT-3.5),
 # per generare un’analisi intelligente dell’andamento delle misure corporee nel tempo,
@@ -199,7 +391,7 @@ Sii chiaro, professionale e conciso.
 # Il prompt fornisce al modello i dati grezzi delle misurazioni (formattati come testo leggibile)
 # e chiede di produrre una breve analisi (max 500 caratteri), professionale e concisa,
 # che valuti se le variazioni corporee osservate sono coerenti con il goal prefissato.
-body_measurement_analysis_chain = body_measurement_analysis_prompt | llm_3_5_turbo
+CHAINS["body_measurement_analysis"] = (body_measurement_analysis_prompt, "llm_3_5_turbo")
 
 def generate_body_analysis(measurements: list, goal: str) -> str:
     """
@@ -223,6 +415,19 @@ def generate_body_analysis(measurements: list, goal: str) -> str:
     In caso di errore tecnico o di inferenza, restituisce un messaggio di fallback.
     """
 
+    try:
+        result = get_chain("body_measurement_analysis").invoke({
+            "goal": goal,
+            "measurements": format_body_measurements(measurements)
+        })
+        text = getattr(result, "content", "").strip()
+        return text
+    except Exception as e:
+        print(f"Errore nell'analisi delle misure: {e}")
+        return "Errore durante l'analisi delle misure."
+
+
+def format_body_measurements(measurements: list) -> str:
     def format_measure_row(entry):
         # Converte ogni record di misure in una riga leggibile, es:
         # "2025-05-01: Chest 102.3cm Waist 82.1cm Arms 35.2cm"
@@ -233,20 +438,22 @@ def generate_body_analysis(measurements: list, goal: str) -> str:
         return " ".join(parts)
 
     # Costruisce la stringa completa da passare al modello, una riga per ogni data
-    formatted = "\n".join(format_measure_row(m) for m in measurements)
+    return "\n".join(format_measure_row(m) for m in measurements)
 
-    try:
-        result = body_measurement_analysis_chain.invoke({"goal": goal, "measurements": formatted})
-        text = getattr(result, "content", "").strip()
-        return text
-    except Exception as e:
-        print(f"Errore nell'analisi delle misure: {e}")
-        return "Errore durante l'analisi delle misure."
+
+def stream_body_analysis(measurements: list, goal: str):
+    """
+    Variante in streaming di `generate_body_analysis`: genera i frammenti dell'analisi man mano che arrivano.
+    """
+    return stream_chain("body_measurement_analysis", {
+        "goal": goal,
+        "measurements": format_body_measurements(measurements)
+    })
     
 
 
 
-food_parsing_natural_language_prompt = PromptTemplate.from_template("""
+food_parsing_natural_language_prompt = """
 Dalla seguente frase in linguaggio naturale:
 
 "{input_text}"
@@ -260,7 +467,7 @@ Dalla seguente frase in linguaggio naturale:
       Se nella frase ci sono termini qualitativi (es. "abbondante", "qualche", "una porzione"), interpreta e traduci in un valore numerico coerente.
 
 Restituisci esclusivamente un array JSON. Nessuna spiegazione o testo fuori dal JSON.
-""")
+"""
 
 # La catena food_chain unisce il prompt a un modello AI (GPT-4o mini in questo caso),
 # che analizza frasi libere in linguaggio naturale e le trasforma in una struttura JSON utile per il tracciamento alimentare.
@@ -272,7 +479,7 @@ Restituisci esclusivamente un array JSON. Nessuna spiegazione o testo fuori dal
 # - stimare la quantità consumata, anche in assenza di numeri espliciti (es. "qualche patatina" → 50g)
 #
 # Questo output strutturato può essere poi utilizzato per popolare una food diary app, una dashboard nutrizionale o un backend per piani alimentari intelligenti.
-food_parsing_natural_language_chain = food_parsing_natural_language_prompt | llm_4o_mini
+CHAINS["food_parsing_natural_language"] = (food_parsing_natural_language_prompt, "llm_4o_mini")
 
 def generate_food_analysis(input_text: str) -> list:
     """
@@ -293,7 +500,7 @@ def generate_food_analysis(input_text: str) -> list:
     In caso di errore nella risposta del modello o nel parsing JSON, restituisce una lista vuota.
     """
     try:
-        result = food_parsing_natural_language_chain.invoke({"input_text": input_text})
+        result = get_chain("food_parsing_natural_language").invoke({"input_text": input_text})
         content = getattr(result, "content", "").strip()
         return json.loads(content)
     except Exception as e:
@@ -303,74 +510,104 @@ def generate_food_analysis(input_text: str) -> list:
 
 
 
-food_item_selection_prompt = PromptTemplate.from_template("""
-Tra i seguenti alimenti candidati, scegli quello che corrisponde meglio al pasto descritto:
-
-Nome del pasto: "{meal}"
+food_items_batch_selection_prompt = """
+Per ciascuno dei seguenti pasti scegli, tra i suoi candidati numerati, l'alimento che corrisponde meglio al pasto descritto.
 
-Candidati disponibili:
-{candidates}
+{meals}
 
-Restituisci esclusivamente il nome dell'alimento selezionato (nessuna spiegazione, solo testo).
-""")
+Restituisci esclusivamente un array JSON con un oggetto per ogni pasto, nello stesso ordine, senza testo extra:
+[
+  {{ "meal": 1, "candidate": 2 }},
+  {{ "meal": 2, "candidate": 1 }}
+]
+"""
 
-# Questa catena LangChain utilizza un modello IA (GPT-4o mini) per confrontare il nome di un pasto
-# con una lista di alimenti candidati (provenienti da un database o da un sistema utente) e selezionare
-# quello che meglio corrisponde in base alla semantica del nome.
-#
-# Il prompt è progettato per restituire *esclusivamente* il nome dell’alimento più pertinente.
-# Il modello si basa su comprensione semantica e similarità linguistica, anche in presenza di sinonimi,
-# varianti ortografiche o nomi descrittivi vaghi (es. "riso con pollo" vs "piatto unico pollo e riso").
-food_item_selector_chain = food_item_selection_prompt | llm_4o_mini
+# Questa catena usa GPT-4o mini per abbinare ogni pasto descritto dall'utente all'alimento candidato
+# semanticamente più vicino (sinonimi, varianti ortografiche, nomi vaghi come "riso con pollo").
+# Una sola chiamata abbina tutti i pasti di una giornata, invece di un round trip per ogni pasto.
+CHAINS["food_items_batch_selector"] = (food_items_batch_selection_prompt, "llm_4o_mini")
 
-def select_best_food_item(meal: str, food_items: list["FoodItem"]) -> dict:
+def select_best_food_items(meals: list[tuple[str, list["FoodItem"]]]) -> list["FoodItem | None"]:
     """
-    Dato il nome di un pasto e una lista di oggetti `FoodItem`, utilizza un modello IA per selezionare
-    il candidato più coerente semanticamente con il nome del pasto.
-
-    :param meal: stringa con il nome del pasto descritto dall’utente (es. "pasta al sugo con tonno")
-    :param food_items: lista di oggetti `FoodItem`, ciascuno con almeno attributi `name` (str) e `id` (str|int)
-
-    :return: dizionario con:
-        - "name": nome dell’alimento selezionato
-        - "id": ID corrispondente all’alimento nel database
-        Se nessun alimento corrisponde, ritorna {"name": None, "id": None}
+    Abbina N pasti ai rispettivi candidati con un'unica chiamata al modello IA.
 
-    Utilizzo tipico:
-        - Abbinamento tra descrizione libera dell’utente e dati strutturati
-        - Aiuto nella normalizzazione di input testuali in interfacce nutrizionali
-        - Supporto alla compilazione automatica di pasti giornalieri
+    :param meals: lista di tuple (nome_pasto, candidati), dove i candidati sono istanze `FoodItem`
+                  (es. il risultato di `find_matching_food_items`)
+    :return: lista parallela a `meals` con il `FoodItem` scelto per ogni pasto,
+             oppure None se il pasto non ha candidati o il modello non ne ha scelto uno valido
 
     Esempio:
-        select_best_food_item("riso con pollo", [FoodItem("Riso basmati", 1), FoodItem("Pollo al curry", 2)])
-        → {"name": "Pollo al curry", "id": 2}
+        select_best_food_items([
+            ("riso con pollo", [FoodItem("Riso basmati", 1), FoodItem("Pollo al curry", 2)]),
+            ("mela", [FoodItem("Mela golden", 3)])
+        ])
+        → [FoodItem("Pollo al curry", 2), FoodItem("Mela golden", 3)]
     """
 
-    if not food_items:
-        return {"name": None, "id": None}
+    selected = [None] * len(meals)
+
+    # Nel prompt vanno solo i pasti che hanno almeno un candidato
+    pending = [index for index, (_, candidates) in enumerate(meals) if candidates]
+    if not pending:
+        return selected
 
-    # Costruiamo l’elenco leggibile dei candidati da fornire al modello
-    formatted_candidates = "\n".join(f"- {item.name}" for item in food_items)
+    blocks = []
+    for number, index in enumerate(pending, start=1):
+        meal_name, candidates = meals[index]
+        rows = "\n".join(f"  {position}. {item.name}" for position, item in enumerate(candidates, start=1))
+        blocks.append(f'Pasto {number}: "{meal_name}"\n{rows}')
 
     try:
-        # Invochiamo la catena AI per ottenere il nome selezionato
-        result = food_item_selector_chain.invoke({
-            "meal": meal,
-            "candidates": formatted_candidates
-        })
-        name = getattr(result, "content", "").strip()
+        result = get_chain("food_items_batch_selector").invoke({"meals": "\n\n".join(blocks)})
+        content = getattr(result, "content", "").strip()
 
-        # Cerchiamo l’alimento originale che ha quel nome
-        matching = next((item for item in food_items if item.name == name), None)
+        start = content.find("[")
+        end = content.rfind("]") + 1
+        if start == -1 or end == 0:
+            raise ValueError("JSON non valido nella risposta.")
 
-        return {
-            "name": name,
-            "id": matching.id if matching else None
-        }
+        for choice in json.loads(content[start:end]):
+            try:
+                number = int(choice.get("meal"))
+                position = int(choice.get("candidate"))
+            except (AttributeError, TypeError, ValueError):
+                continue
+
+            if not 1 <= number <= len(pending):
+                continue
+            index = pending[number - 1]
+            candidates = meals[index][1]
+            if 1 <= position <= len(candidates):
+                selected[index] = candidates[position - 1]
 
     except Exception as e:
-        print(f"Errore nella selezione dell'alimento: {e}")
-        return {"name": None, "id": None}
+        print(f"Errore nella selezione degli alimenti: {e}")
+
+    return selected
+
+
+def match_meals_to_food_items(meals: list[dict], user) -> list["FoodItem | None"]:
+    """
+    Risolve una lista di pasti (con chiavi "meal" e "keywords") in `FoodItem`:
+    ricerca dei candidati sull'indice, un'unica chiamata IA per scegliere i migliori e,
+    solo per i pasti rimasti senza abbinamento, generazione dell'alimento tramite `generate_food_item`.
+
+    :return: lista parallela a `meals`; None dove anche la generazione è fallita
+    """
+    candidates = [
+        (meal.get("meal"), find_matching_food_items(meal.get("keywords", [])))
+        for meal in meals
+    ]
+    food_items = select_best_food_items(candidates)
+
+    # Gli alimenti mancanti vengono generati in parallelo; il salvataggio avviene qui, in ordine
+    missing = [index for index, food_item in enumerate(food_items) if food_item is None]
+    generated = run_concurrently(generate_food_item_data, [meals[index].get("meal") for index in missing])
+
+    for index, data in zip(missing, generated):
+        food_items[index] = create_food_item(data, user) if data else None
+
+    return food_items
 
 
 
@@ -386,17 +623,6 @@ Analizza il contenuto visivo e restituisci un array JSON con oggetti aventi i se
 Restituisci solo l'array JSON. Nessuna spiegazione.
 """
 
-def encode_image(file) -> str:
-    """
-    Converte un file immagine in una stringa codificata in Base64, 
-    adatta per l'invio a un modello IA con supporto Vision (es. GPT-4o).
-    """
-    import io
-    buffer = io.BytesIO()
-    file.seek(0)
-    buffer.write(file.read())
-    return base64.b64encode(buffer.getvalue()).decode("utf-8")
-
 def generate_food_analysis_from_image_file(file) -> list:
     """
     Analizza visivamente un'immagine contenente cibo e restituisce un array JSON
@@ -415,8 +641,11 @@ def generate_food_analysis_from_image_file(file) -> list:
     """
 
     try:
-        # Codifica l'immagine come stringa base64 per inviarla al modello via URL data URI
-        base64_img = encode_image(file)
+        from langchain_core.messages import HumanMessage
+        from data.images import image_data_url
+
+        # Ridimensiona e ricodifica l'immagine (JPEG/WebP) e la invia al modello come data URI
+        data_url = image_data_url(file)
 
         # Componiamo il messaggio multimodale da inviare: testo + immagine
         message = HumanMessage(content=[
@@ -424,13 +653,13 @@ def generate_food_analysis_from_image_file(file) -> list:
             {
                 "type": "image_url",
                 "image_url": {
-                    "url": f"data:image/png;base64,{base64_img}"
+                    "url": data_url
                 }
             }
         ])
 
         # Invochiamo il modello GPT-4o Vision per ottenere una risposta testuale
-        result = llm_4o.invoke([message])
+        result = get_llm("llm_4o").invoke([message], config={"metadata": {"chain": "food_parsing_vision"}})
         content = result.content.strip()
 
         # Estraiamo l'array JSON dalla risposta, isolando la sezione tra [ ... ]
@@ -447,7 +676,7 @@ def generate_food_analysis_from_image_file(file) -> list:
 
 
 
-food_plan_optimization_prompt = PromptTemplate.from_template("""
+food_plan_optimization_prompt = """
 L'obiettivo è ottimizzare un piano alimentare in termini di nutrienti, considerando solo i valori nutrizionali degli alimenti, e ignorando il contenuto semantico o la varietà.
 
 Il piano deve rispettare i seguenti vincoli nutrizionali totali:
@@ -476,11 +705,11 @@ Rispondi solo con un JSON **puro**, senza blocchi di codice, backtick o etichett
   {{ "id": 1, "adjusted_quantity_in_grams": 100 }},
   {{ "id": 2, "adjusted_quantity_in_grams": 150 }}
 ]
-""")
+"""
 
 # Catena LangChain che utilizza il modello GPT-4o per ottimizzare le quantità degli alimenti
 # in un piano alimentare, tenendo conto esclusivamente dei dati numerici nutrizionali
-food_plan_optimization_chain = food_plan_optimization_prompt | llm_4o
+CHAINS["food_plan_optimization"] = (food_plan_optimization_prompt, "llm_4o")
 
 def generate_foodplan_adjustment(food_plan) -> str:
     """
@@ -512,7 +741,7 @@ def generate_foodplan_adjustment(food_plan) -> str:
         ])
 
         # Invoca la catena IA con i limiti target e i dati formattati
-        result = food_plan_optimization_chain.invoke({
+        result = get_chain("food_plan_optimization").invoke({
             "max_protein": food_plan.max_protein,
             "max_carbs": food_plan.max_carbs,
             "max_fats": food_plan.max_fats,
@@ -565,10 +794,104 @@ def apply_foodplan_adjustment(data: list[dict]) -> list[int]:
 
     return updated_ids
 
+def optimize_foodplan_quantities(food_plan, min_grams: float = 10, max_grams: float = 200) -> list[dict]:
+    """
+    Alternativa numerica e deterministica a `generate_foodplan_adjustment`: risolve localmente
+    (NumPy, nessuna chiamata IA) il problema di ottimizzazione delle grammature.
+
+    Il problema è un minimo quadrati vincolato:
+    - obiettivo: avvicinare proteine, carboidrati e grassi totali ai valori massimi del piano
+      (errore relativo, così ogni macro pesa allo stesso modo), con un termine minimo
+      che preferisce restare vicino alle quantità attuali quando più soluzioni sono equivalenti;
+    - vincoli: nessun macro oltre il massimo, calorie entro `max_kcal`,
+      ogni alimento tra `min_grams` e `max_grams`.
+
+    Si usa un metodo a Lagrangiana aumentata con gradiente proiettato sui limiti per alimento,
+    poi le quantità vengono arrotondate al grammo e, se necessario, ridotte fino a rispettare
+    tutti i vincoli. Per piani di poche decine di alimenti richiede pochi millisecondi.
+
+    :param food_plan: istanza `FoodPlan` con i suoi `FoodPlanItem`
+    :param min_grams: quantità minima per alimento (le quantità a 0g non sono ammesse)
+    :param max_grams: quantità massima per alimento
+    :return: lista nello stesso formato prodotto dall'IA:
+             [{ "id": 1, "adjusted_quantity_in_grams": 100 }, ...]
+    """
+    import numpy as np
+
+    items = list(food_plan.foodplanitem_set.select_related("food_item"))
+    if not items:
+        return []
 
+    # Coefficienti per grammo: righe = proteine, carboidrati, grassi, calorie
+    coeffs = np.array([
+        [item.food_item.protein_per_100g, item.food_item.carbs_per_100g,
+         item.food_item.fats_per_100g, item.food_item.kcal_per_100g]
+        for item in items
+    ], dtype=float).T / 100.0
+
+    caps = np.array([food_plan.max_protein, food_plan.max_carbs, food_plan.max_fats, food_plan.max_kcal], dtype=float)
+    caps = np.maximum(caps, 1e-6)
+
+    # Variabili normalizzate in [min/max, 1] per un problema ben condizionato
+    lo = np.full(len(items), min_grams / max_grams)
+    hi = np.ones(len(items))
+    x0 = np.clip(np.array([item.quantity_in_grams for item in items], dtype=float) / max_grams, lo, hi)
+
+    # Obiettivo sui tre macro (errore relativo) e vincoli lineari (tutti e quattro, relativi al massimo)
+    A = coeffs[:3] * max_grams / caps[:3, None]
+    G = coeffs * max_grams / caps[:, None]
+    reg = 1e-3
+
+    rho = 10.0
+    mu = np.zeros(4)
+    step = 1.0 / (2 * np.linalg.norm(A.T @ A, 2) + 2 * reg + rho * np.linalg.norm(G.T @ G, 2))
+
+    # Gradiente proiettato accelerato (FISTA) per il sottoproblema, aggiornamento dei moltiplicatori fuori
+    x = x0.copy()
+    for _ in range(50):
+        y, t = x.copy(), 1.0
+        for _ in range(300):
+            violation = np.maximum(0.0, G @ y - 1.0 + mu / rho)
+            grad = 2 * A.T @ (A @ y - 1.0) + 2 * reg * (y - x0) + rho * G.T @ violation
+            x_next = np.clip(y - step * grad, lo, hi)
+            converged = np.abs(x_next - x).max() < 1e-6
+            t_next = (1 + np.sqrt(1 + 4 * t * t)) / 2
+            y = x_next + ((t - 1) / t_next) * (x_next - x)
+            x, t = x_next, t_next
+            if converged:
+                break
+        residual = G @ x - 1.0
+        mu = np.maximum(0.0, mu + rho * residual)
+        if converged and residual.max() < 1e-3:
+            break
+
+    # Arrotondamento al grammo (per difetto) e riparazione: finché un vincolo è violato,
+    # si toglie un grammo all'alimento che contribuisce di più a quel vincolo
+    grams = np.maximum(np.floor(x * max_grams), np.ceil(min_grams))
+    totals = coeffs @ grams
+    while True:
+        violated = np.flatnonzero(totals > caps + 1e-9)
+        if violated.size == 0:
+            break
+        row = violated[0]
+        reducible = grams > np.ceil(min_grams)
+        if not reducible.any():
+            break  # vincoli incompatibili con la quantità minima: si resta al minimo
+        idx = int(np.argmax(np.where(reducible, coeffs[row], -1.0)))
+        if coeffs[row, idx] <= 0:
+            break
+        grams[idx] -= 1
+        totals -= coeffs[:, idx]
+
+    return [
+        {"id": item.id, "adjusted_quantity_in_grams": int(g)}
+        for item, g in zip(items, grams)
+    ]
 
 
-food_plan_personalized_prompt = PromptTemplate.from_template("""
+
+
+food_plan_personalized_prompt = """
 L'utente ha come obiettivo nutrizionale: "{goal}".
 
 Ecco i suoi dati recenti:
@@ -597,11 +920,11 @@ Per ogni alimento, restituisci un oggetto JSON con:
 - "section_keywords": parole chiave legate al momento della giornata (es. mattina, colazione)
 
 Rispondi solo con un array JSON valido. Nessuna spiegazione, nessun blocco ```json.
-""")
+"""
 
 # Catena LangChain con GPT-4o che genera un piano alimentare completo e strutturato
 # basandosi su: obiettivo nutrizionale, andamento peso e misure, e macro precedenti
-food_plan_personalized_chain = food_plan_personalized_prompt | llm_4o
+CHAINS["food_plan_personalized"] = (food_plan_personalized_prompt, "llm_4o")
 
 def generate_food_plan_from_context(goal: str, weights: list, measurements: list, prev_macros: dict) -> list:
     """
@@ -650,7 +973,7 @@ def generate_food_plan_from_context(goal: str, weights: list, measurements: list
 
     try:
         # Invoca la catena AI fornendo tutti i dati utente formattati
-        response = food_plan_personalized_chain.invoke({
+        response = get_chain("food_plan_personalized").invoke({
             "goal": goal,
             "weights": format_weights(weights),
             "measurements": format_measurements(measurements),
@@ -678,7 +1001,7 @@ def generate_food_plan_from_context(goal: str, weights: list, measurements: list
 
 
 
-food_item_generate_macros_prompt = PromptTemplate.from_template("""
+food_item_generate_macros_prompt = """
 Inventa un alimento realistico con il nome "{name}" e genera i suoi valori nutrizionali per 100g. 
 
 Restituisci solo un JSON con i seguenti campi (nessun testo extra):
@@ -692,25 +1015,24 @@ Restituisci solo un JSON con i seguenti campi (nessun testo extra):
 - "fiber_per_100g"
 
 Non includere barcode o brand. Scrivi solo il JSON.
-""")
+"""
 
 # Catena LangChain che usa GPT-4o per creare un alimento plausibile a partire da un nome utente.
 # Il modello genera direttamente i valori nutrizionali realistici per 100g.
-food_item_generate_macros_chain = food_item_generate_macros_prompt | llm_4o
+CHAINS["food_item_generate_macros"] = (food_item_generate_macros_prompt, "llm_4o")
 
-def generate_food_item(name: str, user) -> "FoodItem | None":
+def generate_food_item_data(name: str) -> dict | None:
     """
-    Genera un nuovo alimento fittizio ma nutrizionalmente realistico a partire da un nome,
-    e lo salva nel database associandolo all’utente che lo ha richiesto.
+    Parte IA di `generate_food_item`: chiede al modello i valori nutrizionali dell'alimento,
+    senza toccare il database (può quindi girare in un thread di `run_concurrently`).
 
     :param name: Nome dell’alimento inventato (es. "Pane di quinoa integrale")
-    :param user: Utente Django a cui associare l'alimento (campo author)
-    :return: istanza salvata di FoodItem o None in caso di errore
+    :return: dizionario con nome e valori per 100g, oppure None in caso di errore
     """
 
     try:
         # Invochiamo la catena IA per ottenere i dati nutrizionali dell’alimento generato
-        result = food_item_generate_macros_chain.invoke({"name": name})
+        result = get_chain("food_item_generate_macros").invoke({"name": name})
         content = result.content.strip()
 
         # Estraiamo il blocco JSON dalla risposta (isolando la prima e ultima graffa)
@@ -719,13 +1041,26 @@ def generate_food_item(name: str, user) -> "FoodItem | None":
         if start == -1 or end == -1:
             raise ValueError("JSON non trovato nella risposta.")
 
-        data = json.loads(content[start:end])
+        return json.loads(content[start:end])
 
+    except Exception as e:
+        print(f"Errore generazione alimento: {e}")
+        return None
+
+
+def create_food_item(data: dict, user) -> "FoodItem | None":
+    """
+    Salva nel database l'alimento descritto da `generate_food_item_data`, associandolo all’utente.
+
+    :return: istanza salvata di FoodItem o None se i dati sono incompleti
+    """
+
+    try:
         # Importiamo il modello solo se necessario (lazy load per evitare circolarità)
         from data.models import FoodItem
 
         # Creiamo il nuovo oggetto `FoodItem` nel database
-        food = FoodItem.objects.create(
+        return FoodItem.objects.create(
             author=user,
             name=data["name"],
             kcal_per_100g=data["kcal_per_100g"],
@@ -737,16 +1072,30 @@ def generate_food_item(name: str, user) -> "FoodItem | None":
             fiber_per_100g=data["fiber_per_100g"]
         )
 
-        return food
-
     except Exception as e:
         print(f"Errore generazione alimento: {e}")
         return None
 
 
+def generate_food_item(name: str, user) -> "FoodItem | None":
+    """
+    Genera un nuovo alimento fittizio ma nutrizionalmente realistico a partire da un nome,
+    e lo salva nel database associandolo all’utente che lo ha richiesto.
+
+    :param name: Nome dell’alimento inventato (es. "Pane di quinoa integrale")
+    :param user: Utente Django a cui associare l'alimento (campo author)
+    :return: istanza salvata di FoodItem o None in caso di errore
+    """
+
+    data = generate_food_item_data(name)
+    if not data:
+        return None
+    return create_food_item(data, user)
+
+
 
 
-food_plan_generate_macros_prompt = PromptTemplate.from_template("""
+food_plan_generate_macros_prompt = """
 L'utente ha il seguente obiettivo: "{goal}".
 
 Andamento del peso nell'ultimo mese:
@@ -769,11 +1118,11 @@ Restituisci esclusivamente un JSON con i seguenti campi:
 - "reason": spiegazione dettagliata **in formato HTML**, che illustri il motivo delle modifiche o conferme per ogni macronutriente. Usa tag HTML e metti in <b>grassetto</b> le parole chiave (es. proteine, aumento, riduzione, ecc.)
 
 Rispondi solo con un oggetto JSON valido. Nessun testo introduttivo, nessun blocco ```json.
-""")
+"""
 
 # Catena LangChain che usa GPT-4o per ricalcolare i fabbisogni nutrizionali dell’utente
 # in funzione del suo obiettivo (es. massa, definizione) e dell’evoluzione fisica recente.
-food_plan_generate_macros_chain = food_plan_generate_macros_prompt | llm_4o
+CHAINS["food_plan_generate_macros"] = (food_plan_generate_macros_prompt, "llm_4o")
 
 def generate_new_macros(goal: str, weights: list, measurements: list, prev_macros: dict) -> dict:
     """
@@ -819,7 +1168,7 @@ def generate_new_macros(goal: str, weights: list, measurements: list, prev_macro
 
     try:
         # Invio dei dati al modello LLM tramite prompt personalizzato
-        result = food_plan_generate_macros_chain.invoke({
+        result = get_chain("food_plan_generate_macros").invoke({
             "goal": goal,
             "weights": format_weights(weights),
             "measurements": format_measurements(measurements),
@@ -842,7 +1191,7 @@ def generate_new_macros(goal: str, weights: list, measurements: list, prev_macro
 
 
 
-food_plan_alternative_meals_prompt = PromptTemplate.from_template("""
+food_plan_alternative_meals_prompt = """
 Ecco la composizione nutrizionale di un pasto della sezione "{section_name}".
 
 Macro totali da rispettare (±10%):
@@ -868,11 +1217,11 @@ Esempio:
   {{ "meal": "Pane integrale", "quantity": 60, "section": "Spuntino", "keywords": ["pane", "pani", "integrale"] }},
   {{ "meal": "Tonno al naturale", "quantity": 100, "section": "Spuntino", "keywords": ["tonno", "tonni", "naturale"] }}
 ]
-""")
+"""
 
 # Catena LangChain che utilizza GPT-4o mini per suggerire un'alternativa realistica
 # a un pasto esistente, rispettando i macro target della sezione (±10%)
-food_plan_alternative_meals_chain = food_plan_alternative_meals_prompt | llm_4o_mini
+CHAINS["food_plan_alternative_meals"] = (food_plan_alternative_meals_prompt, "llm_4o_mini")
 
 def generate_alternative_meals(section, user) -> list[dict]:
     """
@@ -907,7 +1256,7 @@ def generate_alternative_meals(section, user) -> list[dict]:
     )
 
     # Invio del prompt al modello AI per ottenere alternative valide
-    result = food_plan_alternative_meals_chain.invoke({
+    result = get_chain("food_plan_alternative_meals").invoke({
         "section_name": section.name,
         "total_protein": round(macros["total_protein"] or 0),
         "total_carbs": round(macros["total_carbs"] or 0),
@@ -924,28 +1273,18 @@ def generate_alternative_meals(section, user) -> list[dict]:
 
     enriched = []
 
-    for item in parsed:
-        name = item["meal"]
-        quantity = item["quantity"]
-        keywords = item.get("keywords", [])
-
-        # Ricerca semantica tra alimenti esistenti nel DB
-        candidates = find_matching_food_items(keywords)
-        best_match = select_best_food_item(name, candidates)
+    # Ricerca semantica tra alimenti esistenti nel DB (una sola chiamata IA per tutti gli alimenti);
+    # quelli non trovati vengono generati tramite IA
+    food_items = match_meals_to_food_items(parsed, user)
 
-        if best_match["id"]:
-            from data.models import FoodItem
-            food_item = FoodItem.objects.get(id=best_match["id"])
-        else:
-            # Se non trovato, genera alimento realistico tramite IA
-            food_item = generate_food_item(name, user)
-            if not food_item:
-                continue  # fallback: ignora se fallisce la generazione
+    for item, food_item in zip(parsed, food_items):
+        if not food_item:
+            continue  # fallback: ignora se fallisce la generazione
 
         enriched.append({
-            "meal": name,
+            "meal": item["meal"],
             "food_item_id": food_item.id,
-            "quantity": quantity,
+            "quantity": item["quantity"],
             "section": section.name
         })
 
@@ -956,7 +1295,7 @@ def generate_alternative_meals(section, user) -> list[dict]:
 
 
 # === Prompt per classificazione gruppo muscolare ===
-food_plan_section_type_prompt = PromptTemplate.from_template("""
+food_plan_section_type_prompt = """
 Sei un esperto di allenamento in palestra. 
 Dato l'elenco degli esercizi e dettagli sulle serie, indica quale gruppo muscolare viene allenato maggiormente nella giornata.
 
@@ -966,11 +1305,11 @@ Dati della giornata:
 {section_data}
 
 Risposta (solo una parola o breve frase, senza punteggiatura):
-""")
+"""
 
 # Catena LangChain che usa un modello GPT-3.5 per classificare la giornata di allenamento
 # in base al gruppo muscolare primario, sulla base dei dati delle serie ed esercizi.
-food_plan_section_type_chain = food_plan_section_type_prompt | llm_3_5_turbo
+CHAINS["food_plan_section_type"] = (food_plan_section_type_prompt, "llm_3_5_turbo")
 
 def build_section_data(section) -> str:
     """
@@ -1013,7 +1352,7 @@ def classify_section_type(section) -> str:
 
     try:
         section_text = build_section_data(section)
-        result = food_plan_section_type_chain.invoke({"section_data": section_text})
+        result = get_chain("food_plan_section_type").invoke({"section_data": section_text})
         category = getattr(result, "content", "").strip()
 
         if category:
@@ -1029,7 +1368,7 @@ def classify_section_type(section) -> str:
 
 
 
-food_plan_section_note_prompt = PromptTemplate.from_template("""
+food_plan_section_note_prompt = """
 Sei un esperto di allenamento. Ricevi un elenco di esercizi, dettagli sulle serie e sulle tecniche usate per una giornata di allenamento.
 
 Scrivi una **nota sintetica (massimo 300 caratteri)** che spieghi **perché sono stati scelti questi esercizi**, includendo logica dell’allenamento (es. focus muscolare, intensità, varietà, controllo tecnico, recuperi).
@@ -1040,11 +1379,11 @@ Dati della giornata:
 {section_data}
 
 Nota:
-""")
+"""
 
 # Catena LangChain che usa un LLM (es. GPT-3.5) per generare una breve nota tecnica e motivazionale,
 # utile a spiegare la logica dietro la selezione degli esercizi di una giornata di allenamento.
-food_plan_section_note_chain = food_plan_section_note_prompt | llm_3_5_turbo
+CHAINS["food_plan_section_note"] = (food_plan_section_note_prompt, "llm_3_5_turbo")
 
 def generate_section_note(section) -> str:
     """
@@ -1063,7 +1402,7 @@ def generate_section_note(section) -> str:
         section_text = build_section_data(section)
 
         # Invoca il modello LLM con il prompt formattato
-        result = food_plan_section_note_chain.invoke({"section_data": section_text})
+        result = get_chain("food_plan_section_note").invoke({"section_data": section_text})
         note = getattr(result, "content", "").strip()
 
         # Se viene generata una nota valida, la salva nel campo della sezione
@@ -1078,10 +1417,23 @@ def generate_section_note(section) -> str:
         return ""
 
 
+def stream_section_note(section):
+    """
+    Variante in streaming di `generate_section_note`: genera i frammenti della nota man mano che arrivano
+    e, a testo completo, la salva nel campo `section.note`.
+    """
+    def save_note(note):
+        if note:
+            section.note = note
+            section.save(update_fields=["note"])
+
+    return stream_chain("food_plan_section_note", {"section_data": build_section_data(section)}, save_note)
+
+
 
 
 # === Prompt per descrizione completa della GymPlan ===
-food_plan_note_prompt = PromptTemplate.from_template("""
+food_plan_note_prompt = """
 Sei un esperto di programmazione dell’allenamento.
 
 Dato un riepilogo dettagliato dei giorni (tipologia, tecniche usate, esercizi), scrivi una **breve descrizione (max 400 caratteri)** che riassuma:
@@ -1096,11 +1448,11 @@ Dati della scheda:
 {plan_data}
 
 Nota:
-""")
+"""
 
 # Catena LangChain che utilizza un modello GPT-3.5 per generare una descrizione sintetica e professionale
 # della GymPlan (scheda settimanale di allenamento), partendo dal riepilogo strutturato dei giorni.
-food_plan_note_chain = food_plan_note_prompt | llm_3_5_turbo
+CHAINS["food_plan_note"] = (food_plan_note_prompt, "llm_3_5_turbo")
 
 def build_plan_data(gym_plan) -> str:
     """
@@ -1150,7 +1502,7 @@ def generate_gymplan_note(gym_plan) -> str:
         plan_text = build_plan_data(gym_plan)
 
         # Invoca il modello per ottenere la nota sintetica
-        result = food_plan_note_chain.invoke({"plan_data": plan_text})
+        result = get_chain("food_plan_note").invoke({"plan_data": plan_text})
         note = getattr(result, "content", "").strip()
 
         # Salva la nota nella GymPlan solo se presente
@@ -1165,10 +1517,22 @@ def generate_gymplan_note(gym_plan) -> str:
         return ""
 
 
+def stream_gymplan_note(gym_plan):
+    """
+    Variante in streaming di `generate_gymplan_note`: a testo completo la nota viene salvata in `gym_plan.note`.
+    """
+    def save_note(note):
+        if note:
+            gym_plan.note = note
+            gym_plan.save(update_fields=["note"])
+
+    return stream_chain("food_plan_note", {"plan_data": build_plan_data(gym_plan)}, save_note)
+
+
 
 
 # === Prompt per generare GymPlanItem.notes ===
-food_plan_item_note_prompt = PromptTemplate.from_template("""
+food_plan_item_note_prompt = """
 Ricevi i dettagli di un esercizio inserito in una scheda di allenamento.
 
 Scrivi una **nota sintetica (massimo 8 parole)** che descriva brevemente il focus dell'esercizio (tecnica, forza, stimolo metabolico, controllo, velocità, esplosività, intensità, resistenza, volume, ecc.).
@@ -1179,11 +1543,11 @@ Dati esercizio:
 {item_data}
 
 Nota:
-""")
+"""
 
 # Catena LangChain che usa GPT-3.5 per generare una descrizione sintetica e informativa
 # del focus allenante di un esercizio specifico, sulla base di parametri tecnici.
-food_plan_item_note_chain = food_plan_item_note_prompt | llm_3_5_turbo
+CHAINS["food_plan_item_note"] = (food_plan_item_note_prompt, "llm_3_5_turbo")
 
 def build_item_data(item) -> str:
     """
@@ -1224,7 +1588,7 @@ def generate_item_note(item) -> str:
         item_text = build_item_data(item)
 
         # Invia i dati al modello e ottiene la nota sintetica
-        result = food_plan_item_note_chain.invoke({"item_data": item_text})
+        result = get_chain("food_plan_item_note").invoke({"item_data": item_text})
         note = getattr(result, "content", "").strip()
 
         # Salva la nota solo se presente
@@ -1239,10 +1603,22 @@ def generate_item_note(item) -> str:
         return ""
 
 
+def stream_item_note(item):
+    """
+    Variante in streaming di `generate_item_note`: a testo completo la nota viene salvata in `item.notes`.
+    """
+    def save_note(note):
+        if note:
+            item.notes = note
+            item.save(update_fields=["notes"])
+
+    return stream_chain("food_plan_item_note", {"item_data": build_item_data(item)}, save_note)
+
+
 
 
 # === PROMPT PER GENERARE LA SCHEDA ===
-generate_plan_prompt = PromptTemplate.from_template("""
+generate_plan_prompt = """
 Sei un coach esperto. Devi creare una scheda di allenamento settimanale per un utente, in base ai giorni in cui si allena e alle sue misure recenti.
 
 Obiettivo dell’utente: {goal}
@@ -1290,14 +1666,14 @@ Esempio di struttura:
 }}
 
 Giorni selezionati: {days}
-""")
+"""
 
 # Catena GPT-4o che genera un piano di allenamento completo settimanale
 # in formato JSON, in base a: giorni attivi, obiettivo, peso e misure recenti.
-generate_plan_chain = generate_plan_prompt | llm_4o
+CHAINS["generate_plan"] = (generate_plan_prompt, "llm_4o")
 
 # === PROMPT PER PARSING NOMI ESERCIZI ===
-name_parser_prompt = PromptTemplate.from_template("""
+name_parser_prompt = """
 Dato il nome dell’esercizio: "{input_name}"
 
 Trova il nome più simile tra questi presenti nel database (case insensitive):
@@ -1305,11 +1681,11 @@ Trova il nome più simile tra questi presenti nel database (case insensitive):
 {db_names}
 
 Risposta: (solo uno dei nomi indicati)
-""")
+"""
 
 # Catena GPT-4o mini per normalizzare un nome di esercizio libero
 # confrontandolo con l'elenco degli esercizi nel database.
-parser_chain = name_parser_prompt | llm_4o_mini
+CHAINS["parser"] = (name_parser_prompt, "llm_4o_mini")
 
 def get_matching_gymitems_by_keywords(input_name: str, all_exercises: list[str]) -> list[str]:
     """
@@ -1340,7 +1716,7 @@ def parse_exercise_name(input_name: str, all_exercises: list[str]) -> str:
         filtered = get_matching_gymitems_by_keywords(input_name, all_exercises)
         if not filtered:
             filtered = all_exercises[:15]  # fallback se nessuna parola chiave matcha
-        result = parser_chain.invoke({
+        result = get_chain("parser").invoke({
             "input_name": input_name,
             "db_names": ", ".join(filtered)
         })
@@ -1352,7 +1728,7 @@ def parse_exercise_name(input_name: str, all_exercises: list[str]) -> str:
 
 
 
-gym_item_generate_alternative_prompt = PromptTemplate.from_template("""
+gym_item_generate_alternative_prompt = """
 Sei un coach esperto. Ti fornirò un esercizio attuale in una scheda di allenamento.
 
 Genera un esercizio alternativo che alleni gli **stessi gruppi muscolari**, ma in modo diverso (con attrezzo differente o schema diverso).  
@@ -1374,9 +1750,9 @@ Non usare blocchi di codice come ```json o simili. Restituisci solo il puro JSON
 Esercizio attuale:
 - Nome: {current_name}
 - Tecnica: {technique}
-""")
+"""
 
-gym_item_generate_alternative_chain = gym_item_generate_alternative_prompt | llm_4o
+CHAINS["gym_item_generate_alternative"] = (gym_item_generate_alternative_prompt, "llm_4o")
 
 def replace_gymplan_item_with_alternative(item_id):
     """
@@ -1401,7 +1777,7 @@ def replace_gymplan_item_with_alternative(item_id):
         technique = item.intensity_techniques[0] if item.intensity_techniques else "null"
 
         # === INVOCAZIONE GPT PER GENERARE UN ESERCIZIO ALTERNATIVO ===
-        result = gym_item_generate_alternative_chain.invoke({
+        result = get_chain("gym_item_generate_alternative").invoke({
             "current_name": original_name,
             "technique": technique
         })
@@ -1413,7 +1789,7 @@ def replace_gymplan_item_with_alternative(item_id):
         possible_names = get_matching_gymitems_by_keywords(new_data["name"], all_names)
 
         # Catena di parsing (es. da "Incline Barbell Press" → "Barbell Incline Bench Press")
-        parser_result = parser_chain.invoke({
+        parser_result = get_chain("parser").invoke({
             "input_name": new_data["name"],
             "db_names": ", ".join(possible_names or all_names[:15])
         })
@@ -1466,7 +1842,7 @@ def replace_gymplan_item_with_alternative(item_id):
 
 
 
-generate_warmup_prompt = PromptTemplate.from_template("""
+generate_warmup_prompt = """
 Sei un coach esperto. Ti fornirò i dettagli di un esercizio principale (con i suoi set) e devi creare una o più serie di **riscaldamento** per lo stesso esercizio.
 
 Le serie di riscaldamento devono:
@@ -1485,9 +1861,9 @@ Per ogni serie di riscaldamento restituisci:
 - rest_seconds
 
 Restituisci **esattamente** un array JSON valido, **senza oggetti wrapper** e **senza blocchi di codice tipo ```json**.
-""")
+"""
 
-generate_warmup_chain = generate_warmup_prompt | llm_4o
+CHAINS["generate_warmup"] = (generate_warmup_prompt, "llm_4o")
 
 def generate_warmup_sets(item: "GymPlanItem") -> dict:
     """
@@ -1515,10 +1891,7 @@ def generate_warmup_sets(item: "GymPlanItem") -> dict:
         )
 
         # === Chiamata al modello GPT-4o per generare warm-up ===
-        llm = ChatOpenAI(model="gpt-4o", temperature=0)
-        chain = generate_warmup_prompt | llm
-
-        result = chain.invoke({
+        result = get_chain("generate_warmup").invoke({
             "exercise_name": exercise.name,
             "series_summary": series_summary,
             "main_weight": main_weight
@@ -1557,7 +1930,7 @@ def generate_warmup_sets(item: "GymPlanItem") -> dict:
 
 
 
-suggest_weight_prompt = PromptTemplate.from_template("""
+suggest_weight_prompt = """
 Sei un coach esperto. Ti fornirò una serie di set eseguiti da un utente per un determinato esercizio.
 
 Set (JSON):
@@ -1566,7 +1939,9 @@ Set (JSON):
 In base a questi dati, suggerisci un **peso ideale** (in kg) da usare oggi, coerente con l’andamento.
 
 Restituisci **solo il numero**, senza testo aggiuntivo, note o simboli. Nessuna unità di misura. Nessun blocco di codice.
-""")
+"""
+
+CHAINS["suggest_weight"] = (suggest_weight_prompt, "llm_4o_mini")
 
 def get_suggested_weight(sets_data: list) -> float:
     """
@@ -1583,8 +1958,7 @@ def get_suggested_weight(sets_data: list) -> float:
     sets_summary = json.dumps(sets_data)
 
     # Costruisce e invoca la catena con modello GPT-4o-mini
-    result = suggest_weight_prompt | llm_4o_mini
-    response = result.invoke({"sets_summary": sets_summary})
+    response = get_chain("suggest_weight").invoke({"sets_summary": sets_summary})
     
     try:
         # Estrae e converte il contenuto in float, assicurandosi che sia un numero puro
@@ -1,35 +1,45 @@
 import json
+from contextlib import ExitStack
 from datetime import timedelta
 
 from django.db.models import ExpressionWrapper, F, FloatField, Sum
+from django.http import StreamingHttpResponse
 from django.utils import timezone
-from django.utils.timezone import now
 from rest_framework import generics, status
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import api_view, permission_classes, renderer_classes, throttle_classes
 from rest_framework.parsers import MultiPartParser, FormParser
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAuthenticated, SAFE_METHODS
 from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
 from django.shortcuts import get_object_or_404
+from django.urls import reverse
 from rest_framework.views import APIView
 
 from .models import (
     DetailsAccount, Weight, BodyMeasurement,
     FoodItem, FoodPlan, FoodPlanItem, FoodPlanSection, GymItem, GymMediaUpload, GymPlan, GymPlanItem, GymPlanSection,
-    GymPlanSetDetail
+    GymPlanSetDetail, AIJob
 )
 from .serializers import (
     DetailsAccountSerializer, WeightSerializer, BodyMeasurementSerializer,
     FoodItemSerializer, FoodPlanSerializer, FoodPlanItemSerializer, FoodPlanSectionSerializer, GymItemSerializer,
     GymMediaUploadSerializer, GymPlanSerializer, GymPlanItemSerializer, GymPlanSectionSerializer,
-    GymPlanSetDetailSerializer, GymPlanSynthesizedSerializer
+    GymPlanSetDetailSerializer, GymPlanSynthesizedSerializer, AIJobSerializer, gym_plan_tree_prefetch
 )
 from data.utils import generate_weight_analysis, generate_body_analysis, generate_food_analysis, \
-    find_matching_food_items, select_best_food_item, generate_food_analysis_from_image_file, \
-    generate_foodplan_adjustment, apply_foodplan_adjustment, generate_food_plan_from_context, generate_food_item, \
-    generate_new_macros, generate_alternative_meals, classify_section_type, generate_section_note, \
-    generate_gymplan_note, generate_item_note, generate_plan_chain, parse_exercise_name, \
+    match_meals_to_food_items, generate_foodplan_adjustment, apply_foodplan_adjustment, \
+    optimize_foodplan_quantities, generate_new_macros, generate_alternative_meals, \
+    classify_section_type, generate_section_note, generate_gymplan_note, generate_item_note, \
+    stream_weight_analysis, stream_body_analysis, stream_section_note, stream_gymplan_note, stream_item_note, \
     replace_gymplan_item_with_alternative, generate_warmup_sets, get_suggested_weight
+from data.pipelines import run_food_image_parsing, run_food_plan_generation, run_gym_plan_generation
+from data.jobs import enqueue_job, wants_async
+from data.cloning import clone_food_plan, clone_gym_plan, MAX_CLONE_WEEKS
+from data.throttles import LLMQuotaThrottle
+from data.pagination import GymItemCursorPagination
+from data.routers import read_from_replica, recently_wrote
+from data.renderers import EventStreamRenderer
 
 
 # ======== MIXINS PER OTTIMIZZARE ========
@@ -50,6 +60,59 @@ class UserCreateMixin:
         serializer.save(**{self.user_field: self.request.user})
 
 
+class ReplicaReadMixin:
+    """
+    Le richieste in lettura della view usano la replica (data/routers.py), tranne quando l'utente
+    ha scritto da pochi secondi. Il routing parte dopo autenticazione e throttling.
+    """
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        self._replica_reads = ExitStack()
+        if request.method in SAFE_METHODS and not recently_wrote(request.user):
+            self._replica_reads.enter_context(read_from_replica())
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        if hasattr(self, "_replica_reads"):
+            self._replica_reads.close()
+        return super().finalize_response(request, response, *args, **kwargs)
+
+
+# ======== STREAMING SSE ========
+# Renderer delle view in streaming: quelli predefiniti più text/event-stream, richiesto dai client SSE
+SSE_RENDERER_CLASSES = [*api_settings.DEFAULT_RENDERER_CLASSES, EventStreamRenderer]
+
+
+def sse_event(data: dict, event: str | None = None) -> str:
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def sse_response(chunks) -> StreamingHttpResponse:
+    """
+    Risposta Server-Sent Events per le view AI testuali: ogni frammento generato dal modello viene
+    inviato subito come evento `data: {"delta": "..."}`, seguito alla fine da un evento `done`
+    con il testo completo (oppure da un evento `error`).
+    """
+    def events():
+        parts = []
+        try:
+            for chunk in chunks:
+                parts.append(chunk)
+                yield sse_event({"delta": chunk})
+        except Exception as e:
+            print(f"Errore durante lo streaming IA: {e}")
+            yield sse_event({"error": str(e)}, event="error")
+            return
+        yield sse_event({"text": "".join(parts).strip()}, event="done")
+
+    response = StreamingHttpResponse(events(), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    # Evita che un eventuale reverse proxy (nginx) accumuli la risposta prima di inviarla
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+
 # ======== DETAILS ACCOUNT ========
 class DetailsAccountCreateView(UserCreateMixin, generics.CreateAPIView):
     queryset = DetailsAccount.objects.all()
@@ -87,8 +150,9 @@ class WeightListView(UserQuerySetMixin, generics.ListAPIView):
         return super().get_queryset().order_by('-date_recorded')
 
 
-class WeightAnalysisAIView(APIView):
+class WeightAnalysisAIView(ReplicaReadMixin, APIView):
     permission_classes = [IsAuthenticated]
+    throttle_classes = [LLMQuotaThrottle]
 
     def get(self, request):
         user = request.user
@@ -104,11 +168,21 @@ class WeightAnalysisAIView(APIView):
         if not weights:
             return Response({"error": "Nessun dato di peso registrato"}, status=400)
 
-        analysis = generate_weight_analysis(weights, details.goal_targets)
+        return self.analysis_response(weights, details.goal_targets)
+
+    def analysis_response(self, weights, goal):
+        analysis = generate_weight_analysis(weights, goal)
 
         return Response({"analysis": analysis})
 
 
+class WeightAnalysisStreamAIView(WeightAnalysisAIView):
+    renderer_classes = SSE_RENDERER_CLASSES
+
+    def analysis_response(self, weights, goal):
+        return sse_response(stream_weight_analysis(weights, goal))
+
+
 class WeightUpdateView(UserQuerySetMixin, generics.UpdateAPIView):
     queryset = Weight.objects.all()
     serializer_class = WeightSerializer
@@ -155,8 +229,9 @@ class BodyMeasurementDeleteView(UserQuerySetMixin, generics.DestroyAPIView):
     permission_classes = [IsAuthenticated]
 
 
-class BodyMeasurementAnalysisView(APIView):
+class BodyMeasurementAnalysisView(ReplicaReadMixin, APIView):
     permission_classes = [IsAuthenticated]
+    throttle_classes = [LLMQuotaThrottle]
 
     def get(self, request):
         user = request.user
@@ -184,10 +259,20 @@ class BodyMeasurementAnalysisView(APIView):
                 "shoulders": float(obj.shoulders) if obj.shoulders else None,
             })
 
-        analysis = generate_body_analysis(data, profile.goal_targets)
+        return self.analysis_response(data, profile.goal_targets)
+
+    def analysis_response(self, measurements, goal):
+        analysis = generate_body_analysis(measurements, goal)
         return Response({"analysis": analysis})
 
 
+class BodyMeasurementAnalysisStreamView(BodyMeasurementAnalysisView):
+    renderer_classes = SSE_RENDERER_CLASSES
+
+    def analysis_response(self, measurements, goal):
+        return sse_response(stream_body_analysis(measurements, goal))
+
+
 
 # ======== FOOD ITEM ========
 class FoodItemListView(generics.ListAPIView):
@@ -227,7 +312,7 @@ class FoodItemDeleteView(UserQuerySetMixin, generics.DestroyAPIView):
 
 
 # ======== FOOD PLAN ========
-class FoodPlanListView(UserQuerySetMixin, generics.ListAPIView):
+class FoodPlanListView(ReplicaReadMixin, UserQuerySetMixin, generics.ListAPIView):
     queryset = FoodPlan.objects.all()
     serializer_class = FoodPlanSerializer
     permission_classes = [IsAuthenticated]
@@ -260,41 +345,40 @@ class FoodPlanDeleteView(UserQuerySetMixin, generics.DestroyAPIView):
     permission_classes = [IsAuthenticated]
 
 
+def get_clone_weeks(request) -> int | None:
+    """
+    Legge `?weeks=N` (default 1): quante settimane consecutive clonare in una sola chiamata.
+    Ritorna None se il valore non è valido.
+    """
+    try:
+        weeks = int(request.query_params.get("weeks", 1))
+    except (TypeError, ValueError):
+        return None
+    return weeks if 1 <= weeks <= MAX_CLONE_WEEKS else None
+
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def FoodPlanCloneView(request, pk):
     original_plan = get_object_or_404(FoodPlan, pk=pk, author=request.user)
 
-    # Cloniamo il piano alimentare
-    new_plan = FoodPlan.objects.create(
-        author=original_plan.author,
-        start_date=original_plan.start_date + timedelta(days=7),  # o `now().date()`
-        end_date=original_plan.end_date + timedelta(days=7),
-        max_kcal=original_plan.max_kcal,
-        max_protein=original_plan.max_protein,
-        max_carbs=original_plan.max_carbs,
-        max_fats=original_plan.max_fats,
-    )
-
-    # Cloniamo gli elementi associati
-    original_items = FoodPlanItem.objects.filter(food_plan=original_plan)
-    for item in original_items:
-        FoodPlanItem.objects.create(
-            eaten=False,
-            food_plan=new_plan,
-            food_item=item.food_item,
-            food_section=item.food_section,
-            quantity_in_grams=item.quantity_in_grams,
-        )
+    weeks = get_clone_weeks(request)
+    if weeks is None:
+        return Response({"error": f"Il parametro 'weeks' deve essere un intero tra 1 e {MAX_CLONE_WEEKS}."}, status=400)
+
+    # Cloniamo il piano alimentare e gli elementi associati sulle settimane successive
+    new_plans = clone_food_plan(original_plan, weeks)
 
     return Response({
         "message": "Food plan cloned successfully.",
-        "new_plan_id": new_plan.id
+        "new_plan_id": new_plans[0].id,
+        "new_plan_ids": [plan.id for plan in new_plans]
     }, status=status.HTTP_201_CREATED)
 
 
 class FoodPlanParsingAIView(APIView):
     permission_classes = [IsAuthenticated]
+    throttle_classes = [LLMQuotaThrottle]
 
     def post(self, request):
         user = request.user
@@ -305,27 +389,17 @@ class FoodPlanParsingAIView(APIView):
 
         try:
             meals = generate_food_analysis(sentence)
+            food_items = match_meals_to_food_items(meals, user)
             enriched = []
 
-            for meal in meals:
-                meal_name = meal.get("meal")
-                keywords = meal.get("keywords", [])
-                quantity = meal.get("quantity")
-
-                candidates = find_matching_food_items(keywords)
-                best_match = select_best_food_item(meal_name, candidates)
-
-                if best_match["id"]:
-                    food_item = FoodItem.objects.get(id=best_match["id"])
-                else:
-                    food_item = generate_food_item(meal_name, user)
-                    if not food_item:
-                        continue
+            for meal, food_item in zip(meals, food_items):
+                if not food_item:
+                    continue
 
                 enriched.append({
-                    "meal": meal_name,
-                    "keywords": keywords,
-                    "quantity": quantity,
+                    "meal": meal.get("meal"),
+                    "keywords": meal.get("keywords", []),
+                    "quantity": meal.get("quantity"),
                     "matched_food_item": {
                         "id": food_item.id,
                         "name": food_item.name
@@ -342,6 +416,7 @@ class FoodPlanParsingAIView(APIView):
 
 class FoodImageParsingAIView(APIView):
     permission_classes = [IsAuthenticated]
+    throttle_classes = [LLMQuotaThrottle]
     parser_classes = [MultiPartParser, FormParser]
 
     def post(self, request):
@@ -352,36 +427,13 @@ class FoodImageParsingAIView(APIView):
 
         image = request.FILES["image"]
 
-        try:
-            meals = generate_food_analysis_from_image_file(image)
-            enriched = []
-
-            for meal in meals:
-                meal_name = meal.get("meal")
-                keywords = meal.get("keywords", [])
-                quantity = meal.get("quantity")
+        if wants_async(request):
+            job = enqueue_job(user, "food_image_parsing", attachment=image)
+            return job_accepted_response(request, job)
 
-                candidates = find_matching_food_items(keywords)
-                best_match = select_best_food_item(meal_name, candidates)
-
-                if best_match["id"]:
-                    food_item = FoodItem.objects.get(id=best_match["id"])
-                else:
-                    food_item = generate_food_item(meal_name, user)
-                    if not food_item:
-                        continue
-
-                enriched.append({
-                    "meal": meal_name,
-                    "keywords": keywords,
-                    "quantity": quantity,
-                    "matched_food_item": {
-                        "id": food_item.id,
-                        "name": food_item.name
-                    }
-                })
-
-            return Response({"meals": enriched})
+        try:
+            data, result_status = run_food_image_parsing(user, {}, image)
+            return Response(data, status=result_status)
 
         except Exception as e:
             return Response({"error": str(e)}, status=500)
@@ -389,17 +441,26 @@ class FoodImageParsingAIView(APIView):
 
 class FoodPlanOptimizationAIView(APIView):
     permission_classes = [IsAuthenticated]
+    throttle_classes = [LLMQuotaThrottle]
 
     def get(self, request, plan_id):
         try:
             food_plan = FoodPlan.objects.get(id=plan_id, author=request.user)
 
-            result_json_str = generate_foodplan_adjustment(food_plan)
+            # mode=numeric: ottimizzazione locale deterministica (NumPy), mode=llm (default): GPT-4o
+            mode = request.query_params.get("mode", "llm")
+            if mode not in ("llm", "numeric"):
+                return Response({"error": "Il parametro 'mode' deve essere 'llm' o 'numeric'."}, status=400)
 
-            if "Errore" in result_json_str:
-                return Response({"error": "Errore nella generazione dell'ottimizzazione"}, status=500)
+            if mode == "numeric":
+                result_data = optimize_foodplan_quantities(food_plan)
+            else:
+                result_json_str = generate_foodplan_adjustment(food_plan)
+
+                if "Errore" in result_json_str:
+                    return Response({"error": "Errore nella generazione dell'ottimizzazione"}, status=500)
 
-            result_data = json.loads(result_json_str)
+                result_data = json.loads(result_json_str)
 
             updated_ids = apply_foodplan_adjustment(result_data)
 
@@ -422,140 +483,27 @@ class FoodPlanOptimizationAIView(APIView):
 
 
 
-DEFAULT_SECTION_TIMES = {
-    "colazione": 8,
-    "spuntino": 10,
-    "pranzo": 13,
-    "merenda": 16,
-    "cena": 20,
-    "pre nanna": 22
-}
-
-def get_or_create_section(section_name: str, section_keywords: list, user, existing_sections: list) -> FoodPlanSection:
-    def normalize(text): return text.strip().lower()
-    normalized_name = normalize(section_name)
-    keyword_set = set(normalize(k) for k in section_keywords + [normalized_name])
-
-    for s in existing_sections:
-        if normalize(s.name) in keyword_set:
-            return s
-        expected_time = DEFAULT_SECTION_TIMES.get(normalized_name)
-        if expected_time and abs(s.start_time - expected_time) <= 1:
-            return s
-
-    start_time = DEFAULT_SECTION_TIMES.get(normalized_name, 12)
-    new_section = FoodPlanSection.objects.create(
-        author=user,
-        name=section_name.strip().capitalize(),
-        start_time=start_time
-    )
-    existing_sections.append(new_section)
-    return new_section
-
 class FoodPlanGeneratePlanItemAIView(APIView):
     permission_classes = [IsAuthenticated]
+    throttle_classes = [LLMQuotaThrottle]
 
     def get(self, request, plan_id):
         user = request.user
 
-        try:
-            food_plan = FoodPlan.objects.get(id=plan_id, author=user)
-        except FoodPlan.DoesNotExist:
+        if not FoodPlan.objects.filter(id=plan_id, author=user).exists():
             return Response({"error": "Piano alimentare non trovato"}, status=404)
 
-        try:
-            details = DetailsAccount.objects.get(author=user)
-        except DetailsAccount.DoesNotExist:
-            return Response({"error": "Profilo utente non trovato"}, status=404)
-
-        # Dati ultimi 30 giorni
-        today = timezone.now().date()
-        last_month = today - timedelta(days=30)
-
-        weights = Weight.objects.filter(author=user, date_recorded__gte=last_month)
-        weights_data = [(w.date_recorded.strftime("%Y-%m-%d"), w.weight_value) for w in weights]
-
-        measurements = BodyMeasurement.objects.filter(author=user, date_recorded__gte=last_month)
-        measurements_data = []
-        for m in measurements:
-            row = {"date": m.date_recorded.strftime("%Y-%m-%d")}
-            for f in ["chest", "waist", "hips", "arm", "leg"]:
-                value = getattr(m, f, None)
-                if value is not None:
-                    row[f] = value
-            measurements_data.append(row)
-
-        # Macro attuali del piano
-        prev_macros = {
-            "max_protein": round(food_plan.max_protein),
-            "max_carbs": round(food_plan.max_carbs),
-            "max_fats": round(food_plan.max_fats),
-            "max_kcal": round(food_plan.max_kcal)
-        }
-
-        # ⚙️ Chiamata AI
-        ai_meals = generate_food_plan_from_context(
-            details.goal_targets,
-            weights_data,
-            measurements_data,
-            prev_macros
-        )
-
-        if not ai_meals:
-            return Response({"error": "Piano non generato"}, status=500)
-
-        # 🔁 Applica piano
-        # Rimuove eventuali item esistenti
-        FoodPlanItem.objects.filter(food_plan=food_plan).delete()
-        sections = list(FoodPlanSection.objects.filter(author=user))
-
-        created_items = []
-
-        for meal in ai_meals:
-            meal_name = meal["meal"]
-            keywords = meal.get("keywords", [])
-            quantity = meal["quantity"]
-            section_name = meal.get("section", "")
-            section_keywords = meal.get("section_keywords", [])
-
-            # Sezione
-            section = get_or_create_section(section_name, section_keywords, user, sections)
-
-            # Alimento
-            candidates = find_matching_food_items(keywords)
-            best_match = select_best_food_item(meal_name, candidates)
-
-            if best_match["id"]:
-                food_item = FoodItem.objects.get(id=best_match["id"])
-            else:
-                food_item = generate_food_item(meal_name, user)
-                if not food_item:
-                    continue
-
-            # Item
-            FoodPlanItem.objects.create(
-                eaten=False,
-                food_plan=food_plan,
-                food_item=food_item,
-                food_section=section,
-                quantity_in_grams=quantity
-            )
-
-            created_items.append({
-                "meal": meal_name,
-                "food_item": food_item.name,
-                "quantity": quantity,
-                "section": section.name
-            })
+        if wants_async(request):
+            job = enqueue_job(user, "food_plan_generation", {"plan_id": plan_id})
+            return job_accepted_response(request, job)
 
-        return Response({
-            "message": "Piano generato con successo",
-            "created_items": created_items
-        })
+        data, result_status = run_food_plan_generation(user, {"plan_id": plan_id})
+        return Response(data, status=result_status)
 
 
 class FoodPlanGenerateMacroAIView(APIView):
     permission_classes = [IsAuthenticated]
+    throttle_classes = [LLMQuotaThrottle]
 
     def get(self, request):
         user = request.user
@@ -632,6 +580,7 @@ class FoodPlanGenerateMacroAIView(APIView):
 
 class FoodPlanGenerateAlternativeAIView(APIView):
     permission_classes = [IsAuthenticated]
+    throttle_classes = [LLMQuotaThrottle]
 
     def post(self, request):
         user = request.user
@@ -657,11 +606,12 @@ class FoodPlanGenerateAlternativeAIView(APIView):
 
         FoodPlanItem.objects.filter(food_plan=food_plan, food_section=section).delete()
 
+        food_items = FoodItem.objects.in_bulk([item["food_item_id"] for item in selected])
+
         created_items = []
         for item in selected:
-            try:
-                food_item = FoodItem.objects.get(id=item["food_item_id"])
-            except FoodItem.DoesNotExist:
+            food_item = food_items.get(item["food_item_id"])
+            if not food_item:
                 continue
 
             FoodPlanItem.objects.create(
@@ -742,12 +692,45 @@ class FoodPlanSectionDeleteView(UserQuerySetMixin, generics.DestroyAPIView):
 
 
 # ======== GYM ITEM ========
-class GymItemListView(generics.ListAPIView):
-    queryset = GymItem.objects.all().order_by('name')
+class GymItemCatalogueMixin:
+    """
+    Lista del catalogo esercizi con:
+    - filtri `?primary_muscle=chest&equipment=barbell,dumbbell` (più valori separati da virgola)
+    - proiezione `?fields=id,name,images` (le immagini vengono caricate solo se richieste)
+    - paginazione a cursore opzionale con `?page_size=` / `?cursor=` (vedi GymItemCursorPagination)
+    """
+    pagination_class = GymItemCursorPagination
+
+    def requested_fields(self) -> list[str] | None:
+        fields = self.request.query_params.get("fields")
+        return [f.strip() for f in fields.split(",") if f.strip()] if fields else None
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+
+        for field in GymItem.CATALOGUE_FILTERS:
+            values = self.request.query_params.get(field)
+            if values:
+                queryset = queryset.filter(**{f"{field}__in": [v.strip() for v in values.split(",")]})
+
+        fields = self.requested_fields()
+        if fields is None or {"image_urls", "images"} & set(fields):
+            queryset = queryset.prefetch_related('image_urls')
+
+        return queryset.order_by('name', 'id')
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context["fields"] = self.requested_fields()
+        return context
+
+
+class GymItemListView(ReplicaReadMixin, GymItemCatalogueMixin, generics.ListAPIView):
+    queryset = GymItem.objects.all()
     serializer_class = GymItemSerializer
     permission_classes = [IsAuthenticated]
 
-class GymItemListMeView(UserQuerySetMixin, generics.ListAPIView):
+class GymItemListMeView(ReplicaReadMixin, GymItemCatalogueMixin, UserQuerySetMixin, generics.ListAPIView):
     queryset = GymItem.objects.all()
     serializer_class = GymItemSerializer
     permission_classes = [IsAuthenticated]
@@ -796,8 +779,8 @@ class GymMediaUploadDeleteView(generics.DestroyAPIView):
 
 
 # ======== GYM PLAN ========
-class GymPlanListView(UserQuerySetMixin, generics.ListAPIView):
-    queryset = GymPlan.objects.all()
+class GymPlanListView(ReplicaReadMixin, UserQuerySetMixin, generics.ListAPIView):
+    queryset = GymPlan.objects.prefetch_related(gym_plan_tree_prefetch())
     serializer_class = GymPlanSerializer
     permission_classes = [IsAuthenticated]
 
@@ -807,7 +790,7 @@ class GymPlanSynthesizedListView(UserQuerySetMixin, generics.ListAPIView):
     permission_classes = [IsAuthenticated]
 
 class GymPlanRetrieveView(UserQuerySetMixin, generics.RetrieveAPIView):
-    queryset = GymPlan.objects.all()
+    queryset = GymPlan.objects.prefetch_related(gym_plan_tree_prefetch())
     serializer_class = GymPlanSerializer
     permission_classes = [IsAuthenticated]
 
@@ -827,6 +810,8 @@ class GymPlanDeleteView(UserQuerySetMixin, generics.DestroyAPIView):
     permission_classes = [IsAuthenticated]
 
 @api_view(['GET'])
+@permission_classes([IsAuthenticated])
+@throttle_classes([LLMQuotaThrottle])
 def GymPlanClassifyDectionAIView(request, pk):
     try:
         section = GymPlanSection.objects.get(id=pk)
@@ -848,6 +833,8 @@ def GymPlanClassifyDectionAIView(request, pk):
 
 
 @api_view(['GET'])
+@permission_classes([IsAuthenticated])
+@throttle_classes([LLMQuotaThrottle])
 def GymPlanSectionGenerateNoteAIView(request, pk):
     try:
         section = GymPlanSection.objects.get(id=pk)
@@ -868,7 +855,22 @@ def GymPlanSectionGenerateNoteAIView(request, pk):
         return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+@renderer_classes(SSE_RENDERER_CLASSES)
+@throttle_classes([LLMQuotaThrottle])
+def GymPlanSectionGenerateNoteStreamAIView(request, pk):
+    try:
+        section = GymPlanSection.objects.get(id=pk)
+    except GymPlanSection.DoesNotExist:
+        return Response({"error": "GymPlanSection non trovata."}, status=status.HTTP_404_NOT_FOUND)
+
+    return sse_response(stream_section_note(section))
+
 @api_view(['GET'])
+@permission_classes([IsAuthenticated])
+@throttle_classes([LLMQuotaThrottle])
 def GymPlanGenerateNoteAIView(request, pk):
     try:
         plan = GymPlan.objects.get(id=pk)
@@ -887,93 +889,39 @@ def GymPlanGenerateNoteAIView(request, pk):
         return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+@renderer_classes(SSE_RENDERER_CLASSES)
+@throttle_classes([LLMQuotaThrottle])
+def GymPlanGenerateNoteStreamAIView(request, pk):
+    try:
+        plan = GymPlan.objects.get(id=pk)
+    except GymPlan.DoesNotExist:
+        return Response({"error": "GymPlan non trovata."}, status=status.HTTP_404_NOT_FOUND)
+
+    return sse_response(stream_gymplan_note(plan))
+
 @api_view(['POST'])
+@permission_classes([IsAuthenticated])
+@throttle_classes([LLMQuotaThrottle])
 def GymPlanGenerateEntirePlanAIView(request, pk):
     try:
-        plan = GymPlan.objects.get(id=pk)
-        user = plan.author
+        # Job e token sono dell'utente che fa la richiesta: solo lui può leggere lo stato del job
+        plan = GymPlan.objects.get(id=pk, author=request.user)
         days = request.data.get("days")
 
         if not days or not isinstance(days, list):
             return Response({"error": "Devi specificare una lista di giorni (es. ['lun', 'mer', 'ven'])."}, status=400)
 
-        # === Recupera obiettivo dell'utente ===
-        details = DetailsAccount.objects.filter(author=user).first()
-        goal = details.goal_targets if details and details.goal_targets else "Non specificato"
-
-        # === Recupera pesi e misurazioni ultimi 30 giorni ===
-        cutoff_date = now().date() - timedelta(days=30)
-
-        weights = list(Weight.objects.filter(author=user, date_recorded__gte=cutoff_date)
-                       .values_list("weight_value", flat=True))
-        weight_str = ", ".join(str(w) for w in weights) or "Nessun dato"
-
-        measurements = BodyMeasurement.objects.filter(
-            author=user,
-            date_recorded__gte=cutoff_date
-        )
-
-        measurement_str = "; ".join(
-            f"{m.date_recorded}: {round(m.average_measurement(), 2)} cm"
-            for m in measurements
-            if m.average_measurement() is not None
-        ) or "Nessun dato"
-
-        db_ex_names = list(GymItem.objects.values_list("name", flat=True))
+        payload = {"plan_id": plan.id, "days": days}
 
-        result = generate_plan_chain.invoke({
-            "days": ", ".join(days),
-            "goal": goal,
-            "body_measurements": measurement_str,
-            "weights": weight_str
-        })
-
-        content = getattr(result, "content", "{}").strip()
-        try:
-            day_plan = json.loads(content)
-        except Exception:
-            day_plan = eval(content)
+        if wants_async(request):
+            job = enqueue_job(request.user, "gym_plan_generation", payload)
+            return job_accepted_response(request, job)
 
-        existing_sections = {
-            section.day: section
-            for section in GymPlanSection.objects.filter(gym_plan=plan)
-        }
-
-        for day_code, esercizi in day_plan.items():
-            section = existing_sections.get(day_code)
-            if not section:
-                continue
-
-            for ex in esercizi:
-                parsed_name = parse_exercise_name(ex["name"], db_ex_names)
-                try:
-                    gym_item = GymItem.objects.get(name__iexact=parsed_name)
-                except GymItem.DoesNotExist:
-                    continue
-
-                item = GymPlanItem.objects.create(
-                    section=section,
-                    order=ex.get("order", 0),
-                    intensity_techniques=[ex.get("technique")] if ex.get("technique") else [],
-                    notes=ex.get("notes", "")
-                )
-
-                total_sets = ex.get("sets", 3)
-                for set_index in range(1, total_sets + 1):
-                    GymPlanSetDetail.objects.create(
-                        plan_item=item,
-                        exercise=gym_item,
-                        order=set_index,
-                        set_number=set_index,
-                        prescribed_reps_1=ex.get("prescribed_reps_1", 8),
-                        prescribed_reps_2=ex.get("prescribed_reps_2", 8),
-                        tempo_fcr=ex.get("tempo_fcr", "2-0-2"),
-                        rir=ex.get("rir", 2),
-                        weight=ex.get("weight", 0),
-                        rest_seconds=ex.get("rest_seconds", 90)
-                    )
-
-        return Response({"status": "Scheda generata correttamente."}, status=201)
+        data, result_status = run_gym_plan_generation(request.user, payload)
+        return Response(data, status=result_status)
 
     except GymPlan.DoesNotExist:
         return Response({"error": "GymPlan non trovata."}, status=404)
@@ -986,63 +934,17 @@ def GymPlanGenerateEntirePlanAIView(request, pk):
 def GymPlanCloneView(request, pk):
     original_plan = get_object_or_404(GymPlan, pk=pk, author=request.user)
 
-    # Calcolo nuove date
-    new_start = original_plan.start_date + timedelta(days=7)
-    new_end = original_plan.end_date + timedelta(days=7)
-
-    # Clona GymPlan
-    new_plan = GymPlan.objects.create(
-        author=original_plan.author,
-        start_date=new_start,
-        end_date=new_end,
-        note=original_plan.note
-    )
-
-    section_mapping = {}
-
-    # Clona GymPlanSection
-    original_sections = GymPlanSection.objects.filter(gym_plan=original_plan)
-    for section in original_sections:
-        new_section = GymPlanSection.objects.create(
-            author=section.author,
-            gym_plan=new_plan,
-            day=section.day,
-            type=section.type,
-            note=section.note
-        )
-        section_mapping[section.id] = new_section
-
-    # Clona GymPlanItem e GymPlanSetDetail
-    for old_section in original_sections:
-        old_items = old_section.gymplanitem_set.all()
-        for item in old_items:
-            new_item = GymPlanItem.objects.create(
-                section=section_mapping[old_section.id],
-                order=item.order,
-                notes=item.notes,
-                intensity_techniques=item.intensity_techniques
-            )
+    weeks = get_clone_weeks(request)
+    if weeks is None:
+        return Response({"error": f"Il parametro 'weeks' deve essere un intero tra 1 e {MAX_CLONE_WEEKS}."}, status=400)
 
-            # Clona i set associati
-            for s in item.sets.all():
-                GymPlanSetDetail.objects.create(
-                    plan_item=new_item,
-                    exercise=s.exercise,  # RIFERIMENTO, non duplicato
-                    order=s.order,
-                    set_number=s.set_number,
-                    prescribed_reps_1=s.prescribed_reps_1,
-                    actual_reps_1=s.actual_reps_1,
-                    prescribed_reps_2=s.prescribed_reps_2,
-                    actual_reps_2=s.actual_reps_2,
-                    rir=s.rir,
-                    rest_seconds=s.rest_seconds,
-                    weight=s.weight,
-                    tempo_fcr=s.tempo_fcr
-                )
+    # Clona GymPlan, GymPlanSection, GymPlanItem e GymPlanSetDetail sulle settimane successive
+    new_plans = clone_gym_plan(original_plan, weeks)
 
     return Response({
         "message": "Gym plan cloned successfully.",
-        "new_plan_id": new_plan.id
+        "new_plan_id": new_plans[0].id,
+        "new_plan_ids": [plan.id for plan in new_plans]
     }, status=status.HTTP_201_CREATED)
 
 
@@ -1068,6 +970,8 @@ class GymPlanItemDeleteView(generics.DestroyAPIView):
     permission_classes = [IsAuthenticated]
 
 @api_view(['GET'])
+@permission_classes([IsAuthenticated])
+@throttle_classes([LLMQuotaThrottle])
 def GymPlanItemGenerateNoteAIView(request, pk):
     try:
         item = GymPlanItem.objects.get(id=pk)
@@ -1086,7 +990,22 @@ def GymPlanItemGenerateNoteAIView(request, pk):
         return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+
 @api_view(['GET'])
+@permission_classes([IsAuthenticated])
+@renderer_classes(SSE_RENDERER_CLASSES)
+@throttle_classes([LLMQuotaThrottle])
+def GymPlanItemGenerateNoteStreamAIView(request, pk):
+    try:
+        item = GymPlanItem.objects.get(id=pk)
+    except GymPlanItem.DoesNotExist:
+        return Response({"error": "GymPlanItem non trovato."}, status=status.HTTP_404_NOT_FOUND)
+
+    return sse_response(stream_item_note(item))
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+@throttle_classes([LLMQuotaThrottle])
 def GymPlanItemGenerateAlternativeAIView(request, pk):
     try:
         result = replace_gymplan_item_with_alternative(pk)
@@ -1100,6 +1019,8 @@ def GymPlanItemGenerateAlternativeAIView(request, pk):
 
 
 @api_view(["GET"])
+@permission_classes([IsAuthenticated])
+@throttle_classes([LLMQuotaThrottle])
 def GymPlanItemGenerateWarmupAIView(request, pk):
     try:
         item = GymPlanItem.objects.get(id=pk)
@@ -1177,6 +1098,8 @@ class GymPlanSetDetailDeleteView(generics.DestroyAPIView):
     permission_classes = [IsAuthenticated]
 
 @api_view(['GET'])
+@permission_classes([IsAuthenticated])
+@throttle_classes([LLMQuotaThrottle])
 def GymPlanSetDetailGenerateSuggestedWeightAIView(request, pk):
     user = request.user
     exercise = get_object_or_404(GymItem, id=pk)
@@ -1207,4 +1130,23 @@ def GymPlanSetDetailGenerateSuggestedWeightAIView(request, pk):
     return Response({
         "exercise": exercise.name,
         "suggested_weight": suggested_weight
-    })
\ No newline at end of file
+    })
+
+
+# ======== AI JOB ========
+def job_accepted_response(request, job):
+    """
+    Risposta 202 Accepted per una pipeline accodata: il client interroga `status_url`
+    fino a quando il job non è "done" o "failed".
+    """
+    return Response({
+        "job_id": job.id,
+        "status": job.status,
+        "status_url": request.build_absolute_uri(reverse("aijob-detail", kwargs={"pk": job.id}))
+    }, status=status.HTTP_202_ACCEPTED)
+
+
+class AIJobRetrieveView(UserQuerySetMixin, generics.RetrieveAPIView):
+    queryset = AIJob.objects.all()
+    serializer_class = AIJobSerializer
+    permission_classes = [IsAuthenticated]